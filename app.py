@@ -1,9 +1,26 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, make_response, render_template, request, jsonify, send_from_directory, stream_with_context
+import hashlib
 import os
 import json
+import queue
+import re
 import sys
 import subprocess
 import shutil
+import threading
+
+from bundle_reader import read_ordered
+from config_store import JsonStore
+from content_cache import DEFAULT_FALLBACK_ENCODINGS, ContentCache, file_version
+from content_index import open_content_index
+from exclusions import GITIGNORE
+from file_ranges import LineIndexCache, read_text_slice, split_line_range
+from file_sniffer import FileSniffer
+from fs_watcher import FsWatcher
+from hidden_matcher import HiddenMatcher
+from project_index import open_index
+from token_budget import TokenCounter, load_tokenizer, pack
+from trigram_index import FileNameIndex
 
 app = Flask(__name__)
 
@@ -13,6 +30,178 @@ DATA_DIR = os.path.join(os.getcwd(), 'data')
 PREF_FILE = os.path.join(DATA_DIR, 'preferences.json')
 FAV_FILE = os.path.join(DATA_DIR, 'favorites.json')
 HIDE_FILE = os.path.join(DATA_DIR, 'hidden_items.json')
+# In-memory copies of the JSON config files, written back in the background
+preferences = JsonStore(PREF_FILE, {})
+favorites = JsonStore(FAV_FILE, [])
+hidden_items = JsonStore(HIDE_FILE, [])
+# Hidden-path matcher, rebuilt when the hidden items change
+hidden_matcher_cache = (None, HiddenMatcher())
+# Byte budget for the shared file content cache
+CONTENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Largest page /api/tree returns when paginating
+TREE_PAGE_MAX = 5000
+# Limits of one /api/tree/batch request
+TREE_BATCH_MAX_DIRS = 200
+TREE_BATCH_MAX_DEPTH = 2
+# Number of files read concurrently when assembling a bundle
+BUNDLE_READ_WORKERS = 8
+
+# Optional local BPE vocabulary (tiktoken format); a byte heuristic is used without it
+TOKEN_VOCAB_FILE = os.path.join(DATA_DIR, 'tokenizer.tiktoken')
+
+# Decoded file contents shared by /api/code and /api/preview
+# Codecs tried after UTF-8 come from the preferences (default: latin-1)
+content_cache = ContentCache(CONTENT_CACHE_MAX_BYTES,
+                             preferences.get().get('fallback_encodings', DEFAULT_FALLBACK_ENCODINGS))
+# Text/binary verdicts, memoized by file version: binaries never reach the readers
+file_sniffer = FileSniffer()
+# Per-file token counts, memoized by file version
+token_counter = TokenCounter(load_tokenizer(TOKEN_VOCAB_FILE), lambda entry: read_selection(entry),
+                             lambda: content_cache.fallback_encodings)
+# Line offsets of the files selected or previewed by line range, rebuilt when a file changes
+line_indexes = LineIndexCache()
+
+# Filesystem watcher keeping the index current, and the event-stream clients it notifies
+fs_watcher = None
+fs_watcher_lock = threading.Lock()
+fs_subscribers = []
+fs_subscribers_lock = threading.Lock()
+
+# Trigram index of file names, built on the first search and kept current by the watcher
+name_index = None
+name_index_lock = threading.Lock()
+# Default and largest number of /api/search results
+SEARCH_DEFAULT_LIMIT = 200
+SEARCH_MAX_LIMIT = 5000
+# Matching lines returned per file by /api/search/content
+CONTENT_SEARCH_MAX_HITS = 20
+# Longest a content search waits for the content index to catch up, in seconds
+CONTENT_REFRESH_WAIT = 0.5
+# Default and largest number of bytes returned by one /api/preview request
+PREVIEW_DEFAULT_BYTES = 64 * 1024
+PREVIEW_MAX_BYTES = 1024 * 1024
+# Default and largest number of lines returned by one /api/preview?mode=lines request
+PREVIEW_DEFAULT_LINES = 200
+PREVIEW_MAX_LINES = 5000
+
+def open_project_index():
+    # Index of the served project with the exclusion settings of the preferences;
+    # changing them makes the next get_project_index() rebuild it
+    pref = preferences.get()
+    return open_index(os.getcwd(), DATA_DIR, patterns=pref.get('exclude_patterns', []),
+                      use_gitignore=pref.get('use_gitignore', True))
+
+def get_project_index(wait=True):
+    # Persistent metadata index of the served project, built on first use.
+    # With wait=False the build runs in the background and may still be partial.
+    global fs_watcher
+    index = open_project_index()
+    if wait:
+        index.ensure_built()
+    else:
+        index.build_in_background()
+    with fs_watcher_lock:
+        # configure() gave the index other exclusion rules: watch with the new ones
+        if fs_watcher is not None and fs_watcher.exclusions is not index.exclusions:
+            fs_watcher.stop()
+            fs_watcher = None
+        if fs_watcher is None:
+            fs_watcher = FsWatcher(os.getcwd(), on_fs_change, exclusions=index.exclusions,
+                                   ignore_paths=[DATA_DIR]).start()
+    return index
+
+def on_fs_change(changes):
+    # Runs on the watcher thread: refresh only the changed directories, then notify browsers
+    index = open_project_index()
+    for path in changes.dirs:
+        index.rescan_dir(path)
+    for path in changes.files:
+        index.refresh_file(path)
+    # A .gitignore edit can change the exclusion of a whole subtree: browsers reload
+    # its directory and the name index is rebuilt on the next search
+    ignore_dirs = {os.path.dirname(path) for path in changes.files if os.path.basename(path) == GITIGNORE}
+    if ignore_dirs:
+        reset_name_index()
+    elif name_index is not None:
+        for path in changes.dirs:
+            name_index.sync_dir(index, path)
+    payload = {'dirs': sorted(changes.dirs | ignore_dirs), 'files': sorted(changes.files)}
+    with fs_subscribers_lock:
+        for subscriber in fs_subscribers:
+            subscriber.put(payload)
+
+def get_name_index():
+    global name_index
+    with name_index_lock:
+        if name_index is None:
+            index = get_project_index()
+            new_index = FileNameIndex(index.root)
+            new_index.build(index)
+            name_index = new_index
+        return name_index
+
+def reset_name_index():
+    # Drop the name index after a change of the indexed file set; rebuilt on the next search
+    global name_index
+    with name_index_lock:
+        name_index = None
+
+def get_content_index():
+    # Trigram index of file contents, brought up to date with the metadata index on a
+    # background thread. Returns (index, ready): a request waits CONTENT_REFRESH_WAIT
+    # seconds at most, then searches what is already indexed.
+    index = get_project_index(wait=False)
+    content_index = open_content_index(index.root, DATA_DIR)
+    ready = content_index.refresh_in_background(index, wait=CONTENT_REFRESH_WAIT)
+    return content_index, ready
+
+def get_hidden_matcher():
+    global hidden_matcher_cache
+    generation, items = hidden_items.snapshot()
+    cached_generation, matcher = hidden_matcher_cache
+    if cached_generation != generation:
+        matcher = HiddenMatcher(items)
+        hidden_matcher_cache = (generation, matcher)
+    return matcher
+
+def config_generation():
+    # Changes whenever the preferences or hidden items change
+    return (preferences.snapshot()[0], hidden_items.snapshot()[0])
+
+def make_etag(*parts):
+    # Strong validator from version stamps (never from file contents)
+    return hashlib.sha1(repr(parts).encode('utf-8', 'surrogatepass')).hexdigest()
+
+def conditional_response(etag, build):
+    # 304 without building the payload when the client already holds this version
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    # Let browsers keep the payload but always revalidate it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def path_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns)
+
+def code_etag(paths, budget):
+    # Bundle validator: one stat per selected file
+    stamps = []
+    for path in paths:
+        try:
+            stamps.append((path, file_version(split_line_range(path)[0])))
+        except (OSError, TypeError, ValueError):
+            stamps.append((path, None))
+    # Decoded text also depends on the fallback encodings
+    return make_etag('code', stamps, budget, content_cache.fallback_encodings)
 
 # Serve the favicon
 @app.route('/favicon.ico')
@@ -24,70 +213,186 @@ def index():
     # Pass base directory path for tree initialization
     return render_template('index.html', baseDir=os.getcwd())
 
-@app.route('/api/tree')
-def get_tree():
-    # Directory listing with extension and hidden filtering
-    path = request.args.get('path', os.getcwd())
-    # Convert URL-forwarded slashes to OS separator and normalize
-    path = path.replace('/', os.sep)
-    path = os.path.normpath(path)
-    show_hidden = request.args.get('showHidden', 'false').lower() == 'true'
-    # Load preferences and filters
-    try:
-        pref = json.load(open(PREF_FILE, 'r', encoding='utf-8'))
-    except:
-        pref = {}
+def list_tree_dir(path, show_hidden, limit=None, cursor=None):
+    # One directory listing with extension and hidden filtering: (items, total, next_cursor)
+    pref = preferences.get()
     selected_exts = pref.get('selected_extensions', [])
     known_exts = pref.get('known_extensions', [])
     hidden_exts = pref.get('hidden_extensions', [])
-    try:
-        hidden = json.load(open(HIDE_FILE, 'r', encoding='utf-8'))
-    except:
-        hidden = []
+    hidden = get_hidden_matcher()
     items = []
-    try:
-        entries = os.listdir(path)
-    except Exception as e:
-        app.logger.error(f"get_tree: cannot list {path}: {e}")
-        return jsonify(items)
-    for name in entries:
-        full = os.path.join(path, name)
-        is_dir = os.path.isdir(full)
+    if not os.path.isdir(path):
+        app.logger.error(f"get_tree: cannot list {path}")
+        return items, 0, None
+    # Filter files by extension: use selected_exts if set, else known_exts if available.
+    # Filtering and paging run in the index query, so a page costs the same in any directory.
+    entries, total = get_project_index().children_page(
+        path, after=cursor, limit=None if limit is None else limit + 1,
+        include_exts=selected_exts or known_exts or None, exclude_exts=hidden_exts,
+        exclude_names=[] if show_hidden else hidden.hidden_names(path))
+    next_cursor = None
+    if limit is not None and len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = entries[-1].name
+    for entry in entries:
+        name, full, is_dir = entry.name, entry.path, bool(entry.is_dir)
         # Skip hidden unless showing
-        if not show_hidden and full in hidden:
+        if not show_hidden and hidden.is_hidden(full):
             continue
-        # Filter files by extension: use selected_exts if set, else known_exts if available
-        if not is_dir:
-            ext = os.path.splitext(name)[1]
-            # Skip hidden-defined extensions
-            if ext in hidden_exts:
-                continue
-            if selected_exts:
-                if ext not in selected_exts:
-                    continue
-            elif known_exts:
-                if ext not in known_exts:
-                    continue
         node = {'text': name, 'id': full, 'children': is_dir}
         # Mark hidden state
-        if show_hidden and full in hidden:
+        if show_hidden and hidden.is_hidden(full):
             node['state'] = {'disabled': True}
         items.append(node)
-    return jsonify(items)
+    return items, total, next_cursor
+
+def parse_tree_limit(value):
+    # Optional page size, clamped to TREE_PAGE_MAX
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(1, min(limit, TREE_PAGE_MAX))
+
+def normalize_tree_path(path):
+    # Convert URL-forwarded slashes to OS separator and normalize
+    return os.path.normpath(path.replace('/', os.sep))
+
+@app.route('/api/tree')
+def get_tree():
+    # Directory listing with extension and hidden filtering
+    path = normalize_tree_path(request.args.get('path', os.getcwd()))
+    show_hidden = request.args.get('showHidden', 'false').lower() == 'true'
+    # Optional pagination: page size and name of the last entry already received
+    limit = parse_tree_limit(request.args.get('limit'))
+    cursor = request.args.get('cursor') or None
+    # A listing only changes with its directory's mtime, the config, or the
+    # .gitignore files deciding which of its entries are excluded
+    exclusions = open_project_index().exclusions
+    etag = make_etag('tree', path, show_hidden, limit, cursor, path_stamp(path), config_generation(),
+                     exclusions.gitignore_stamps(path))
+
+    def build():
+        items, total, next_cursor = list_tree_dir(path, show_hidden, limit, cursor)
+        if limit is None:
+            return jsonify(items)
+        return jsonify(items=items, total=total, next_cursor=next_cursor)
+
+    return conditional_response(etag, build)
+
+@app.route('/api/tree/batch', methods=['POST'])
+def get_tree_batch():
+    # First page of several directories in one round trip, optionally with
+    # their subdirectories down to `depth` extra levels
+    data = request.get_json(silent=True) or {}
+    show_hidden = bool(data.get('showHidden', False))
+    limit = parse_tree_limit(data.get('limit'))
+    try:
+        depth = max(0, min(int(data.get('depth', 0)), TREE_BATCH_MAX_DEPTH))
+    except (TypeError, ValueError):
+        depth = 0
+    pending = [(normalize_tree_path(p), 0) for p in data.get('paths', []) if isinstance(p, str)]
+    listings = {}
+    while pending and len(listings) < TREE_BATCH_MAX_DIRS:
+        path, level = pending.pop(0)
+        if path in listings:
+            continue
+        items, total, next_cursor = list_tree_dir(path, show_hidden, limit)
+        listings[path] = {'items': items, 'total': total, 'next_cursor': next_cursor}
+        if level < depth:
+            pending.extend((item['id'], level + 1) for item in items if item['children'])
+    return jsonify(listings=listings)
+
+def parse_search_limit(value):
+    try:
+        return max(1, min(int(value or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT))
+    except ValueError:
+        return SEARCH_DEFAULT_LIMIT
+
+@app.route('/api/search')
+def search_files():
+    # Case-insensitive substring search on file names (scope=path: relative paths)
+    query = request.args.get('q', '').strip()
+    in_path = request.args.get('scope', 'name') == 'path'
+    limit = parse_search_limit(request.args.get('limit'))
+    if not query:
+        return jsonify(matches=[], truncated=False)
+    # One extra result tells whether the list was cut
+    matches = get_name_index().search(query, limit=limit + 1, in_path=in_path)
+    return jsonify(matches=matches[:limit], truncated=len(matches) > limit)
+
+@app.route('/api/search/content')
+def search_content():
+    # Literal (or regex=1) search in text file contents, with the matching lines of each file
+    query = request.args.get('q', '')
+    regex = request.args.get('regex') in ('1', 'true')
+    limit = parse_search_limit(request.args.get('limit'))
+    if not query.strip():
+        return jsonify(results=[], truncated=False)
+    matcher = get_hidden_matcher()
+    content_index, ready = get_content_index()
+    try:
+        matches, truncated = content_index.search(
+            query, regex=regex, limit=limit, max_hits=CONTENT_SEARCH_MAX_HITS,
+            read_fn=content_cache.read, path_filter=lambda path: not matcher.is_hidden(path))
+    except re.error as e:
+        return jsonify(error=f"Invalid regular expression: {e}"), 400
+    results = [{'path': m.path, 'hits': [{'line': line, 'text': text} for line, text in m.hits]}
+               for m in matches]
+    # While the index is still being built the results may be incomplete
+    return jsonify(results=results, truncated=truncated, building=not ready)
+
+def parse_preview_int(value, default):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
 
 @app.route('/api/preview')
 def preview_file():
+    # One slice of a file: mode=head (default), tail, or range from `offset`,
+    # or mode=lines: `count` lines from line `line`, found through the line index.
+    # Only the requested bytes are mapped, so any file size costs the same.
     path = request.args.get('path', '')
     # Normalize and ensure file is within BASE_DIR
     path = os.path.normpath(path)
-    if not path.startswith(os.getcwd()) or not os.path.isfile(path):
-        return jsonify(content=''), 400
+    if not path.startswith(os.getcwd()):
+        return jsonify(error="Invalid path."), 400
+    if not os.path.isfile(path):
+        return jsonify(error="File not found."), 404
+    mode = request.args.get('mode', 'head')
+    length = min(parse_preview_int(request.args.get('length'), PREVIEW_DEFAULT_BYTES) or PREVIEW_DEFAULT_BYTES,
+                 PREVIEW_MAX_BYTES)
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = f.read()
-    except Exception:
-        data = ''
-    return jsonify(content=data)
+        size = os.path.getsize(path)
+        if file_sniffer.is_binary(path):
+            return jsonify(content='', binary=True, size=size)
+        if mode == 'lines':
+            line = parse_preview_int(request.args.get('line'), 1) or 1
+            count = min(parse_preview_int(request.args.get('count'), PREVIEW_DEFAULT_LINES) or PREVIEW_DEFAULT_LINES,
+                        PREVIEW_MAX_LINES)
+            lines = line_indexes.read_lines(path, line, line + count - 1, content_cache.fallback_encodings)
+            return jsonify(content=lines.text, line=lines.start, end_line=lines.end,
+                           line_count=lines.line_count, size=size, encoding=lines.encoding)
+        if mode == 'tail':
+            offset = max(0, size - length)
+        elif mode == 'range':
+            offset = parse_preview_int(request.args.get('offset'), 0)
+        else:
+            offset = 0
+        piece = read_text_slice(path, offset, length, content_cache.fallback_encodings)
+    except FileNotFoundError:
+        return jsonify(error="File not found."), 404
+    except PermissionError:
+        return jsonify(error="Permission denied."), 403
+    except UnicodeDecodeError as e:
+        encodings = ', '.join(content_cache.fallback_encodings) or 'none'
+        return jsonify(error=f"Cannot decode file (fallback encodings: {encodings}): {e}"), 500
+    except Exception as e:
+        app.logger.error(f"Error previewing {path}: {e}")
+        return jsonify(error=f"Error reading file: {e}"), 500
+    return jsonify(content=piece.text, offset=piece.start, end=piece.end, size=piece.size,
+                   encoding=piece.encoding)
 
 @app.route('/api/select', methods=['POST'])
 def select_item():
@@ -95,6 +400,41 @@ def select_item():
     data = request.get_json()
     return jsonify(success=True, data=data)
 
+def code_header(path):
+    return f"// === {path} ===\n"
+
+def read_selection(entry):
+    # Text of a selection entry: a whole file, or the lines of a "<path>:<start>-<end>" entry
+    path, start, end = split_line_range(entry)
+    if start is None:
+        return content_cache.read(path)
+    return line_indexes.read_lines(path, start, end, content_cache.fallback_encodings).text
+
+def select_bundle_paths(paths, budget=None):
+    # only include files within BASE_DIR and not binary, then keep what fits in the token budget
+    base_dir = os.getcwd()
+    paths = file_sniffer.text_paths((p for p in paths if isinstance(p, str) and p.startswith(base_dir)),
+                                    lambda p: split_line_range(p)[0])
+    if budget:
+        paths, _, _ = pack(paths, budget, token_counter,
+                           overhead_fn=lambda p: token_counter.count_text(code_header(p)))
+    return paths
+
+def parse_budget(value):
+    try:
+        budget = int(value)
+    except (TypeError, ValueError):
+        return None
+    return budget if budget > 0 else None
+
+def iter_code_pieces(paths, budget=None):
+    # Yield one formatted piece per readable file or line range, in selection order
+    paths = select_bundle_paths(paths, budget)
+    # Files are read concurrently; missing, unreadable and non-UTF-8 files are skipped
+    for result in read_ordered(paths, read_selection, BUNDLE_READ_WORKERS):
+        if result.error is None:
+            yield code_header(result.path) + result.content
+
 @app.route('/api/code')
 def get_code():
     # Read selected file paths from query params
@@ -103,152 +443,205 @@ def get_code():
         paths = json.loads(paths_json)
     except Exception:
         paths = []
-    code_pieces = []
-    for p in paths:
-        # only include files within BASE_DIR
-        if not p.startswith(os.getcwd()):
-            continue
-        if os.path.isfile(p):
-            try:
-                with open(p, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                code_pieces.append(f"// === {p} ===\n{content}")
-            except Exception:
-                pass
-    full_code = "\n\n".join(code_pieces)
-    return jsonify(code=full_code)
+    budget = parse_budget(request.args.get('budget'))
+    if not isinstance(paths, list):
+        paths = []
+    return conditional_response(code_etag(paths, budget),
+                                lambda: jsonify(code="\n\n".join(iter_code_pieces(paths, budget))))
+
+@app.route('/api/code/stream', methods=['POST'])
+def stream_code():
+    # Path list comes in the JSON body to avoid URL length limits
+    data = request.get_json(silent=True) or {}
+    paths = data.get('paths', [])
+    if not isinstance(paths, list):
+        paths = []
+    budget = parse_budget(data.get('budget'))
+    # The client echoes the ETag of the bundle it already shows
+    etag = code_etag(paths, budget)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def generate():
+        # Emit the bundle file by file so only one file is held at a time
+        first = True
+        for piece in iter_code_pieces(paths, budget):
+            yield piece if first else "\n\n" + piece
+            first = False
+
+    response = Response(stream_with_context(generate()), mimetype='text/plain; charset=utf-8')
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/tokens', methods=['POST'])
+def get_tokens():
+    # Token counts of the selected files, and what fits in an optional budget
+    data = request.get_json(silent=True) or {}
+    paths = data.get('paths', [])
+    if not isinstance(paths, list):
+        paths = []
+    budget = parse_budget(data.get('budget'))
+    paths = select_bundle_paths(paths)
+    counts = token_counter.counts(paths)
+    result = {
+        'tokenizer': token_counter.tokenizer.name,
+        'total': sum(counts.values()) + sum(token_counter.count_text(code_header(p)) for p in counts),
+        'files': counts,
+    }
+    if budget:
+        kept, used, skipped = pack(list(counts), budget, token_counter,
+                                   overhead_fn=lambda p: token_counter.count_text(code_header(p)))
+        result.update(budget=budget, packed=kept, packed_total=used, skipped=skipped)
+    return jsonify(result)
+
+@app.route('/api/fs/events')
+def fs_events():
+    # Server-sent events stream of filesystem changes
+    get_project_index()  # Make sure the watcher is running
+    subscriber = queue.Queue()
+    with fs_subscribers_lock:
+        fs_subscribers.append(subscriber)
+
+    def generate():
+        try:
+            while True:
+                try:
+                    payload = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"data: {json.dumps(payload)}\n\n"
+        finally:
+            with fs_subscribers_lock:
+                fs_subscribers.remove(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    # Hit/miss counters of the shared content cache and of the binary sniffer
+    stats = content_cache.stats()
+    stats['sniffer'] = file_sniffer.stats()
+    return jsonify(stats)
 
 @app.route('/api/options')
 def get_options():
-    # Load or initialize preferences
-    try:
-        with open(PREF_FILE, 'r', encoding='utf-8') as f:
-            pref = json.load(f)
-    except:
-        pref = {}
-    # Populate known_extensions if empty
-    if not pref.get('known_extensions'):
-        exts = set()
-        for root, _, files in os.walk(os.getcwd()):
-            for fn in files:
-                ext = os.path.splitext(fn)[1]
-                if ext:
-                    exts.add(ext)
-        pref['known_extensions'] = sorted(exts)
-        pref.setdefault('selected_extensions', [])
-        pref.setdefault('hidden_extensions', [])
-        json.dump(pref, open(PREF_FILE, 'w', encoding='utf-8'), indent=2)
-    # Read favorites
-    try:
-        with open(FAV_FILE, 'r', encoding='utf-8') as f:
-            fav = json.load(f)
-    except:
-        fav = []
+    pref = preferences.get()
+    # Answer from the incrementally maintained per-extension stats, even while
+    # the first index build is still running
+    index = get_project_index(wait=False)
+    stats = index.extension_stats()
+    scan_complete = index.is_built
+    # Populate known_extensions once the scan is complete
+    if not pref.get('known_extensions') and scan_complete:
+        def init_extensions(pref):
+            pref['known_extensions'] = sorted(stats)
+            pref.setdefault('selected_extensions', [])
+            pref.setdefault('hidden_extensions', [])
+        pref = preferences.update(init_extensions)
+    known = pref.get('known_extensions') or sorted(stats)
+    fav = favorites.get()
     # Return option sets
     return jsonify(
-        known_extensions=[e for e in pref.get('known_extensions', []) if e not in pref.get('hidden_extensions', [])],
+        known_extensions=[e for e in known if e not in pref.get('hidden_extensions', [])],
         selected_extensions=pref.get('selected_extensions', []),
         favorites=fav,
-        hidden_extensions=pref.get('hidden_extensions', [])
+        hidden_extensions=pref.get('hidden_extensions', []),
+        exclude_patterns=pref.get('exclude_patterns', []),
+        fallback_encodings=list(content_cache.fallback_encodings),
+        use_gitignore=pref.get('use_gitignore', True),
+        extension_stats={ext: {'files': files, 'bytes': size} for ext, (files, size) in stats.items()},
+        scan_complete=scan_complete
     )
 
 @app.route('/api/options/extensions', methods=['POST'])
 def update_extensions():
     data = request.get_json()
     exts = data.get('extensions', [])
-    try:
-        pref = {}
-        if os.path.exists(PREF_FILE):
-            pref = json.load(open(PREF_FILE, 'r', encoding='utf-8'))
-        pref['selected_extensions'] = exts
-        json.dump(pref, open(PREF_FILE, 'w', encoding='utf-8'), indent=2)
-        return jsonify(success=True)
-    except:
-        return jsonify(success=False), 500
+    preferences.update(lambda pref: pref.update(selected_extensions=exts))
+    return jsonify(success=True)
 
 @app.route('/api/options/favorites', methods=['POST'])
 def update_favorites():
     data = request.get_json()
     favs = data.get('favorites', [])
-    try:
-        json.dump(favs, open(FAV_FILE, 'w', encoding='utf-8'), indent=2)
-        return jsonify(success=True)
-    except:
-        return jsonify(success=False), 500
+    favorites.set(favs)
+    return jsonify(success=True)
 
 @app.route('/api/options/hidden', methods=['GET'])
 def get_hidden():
-    try:
-        hidden = json.load(open(HIDE_FILE, 'r', encoding='utf-8'))
-    except:
-        hidden = []
-    return jsonify(hidden)
+    return jsonify(hidden_items.get())
 
 @app.route('/api/options/hidden', methods=['POST'])
 def update_hidden():
     data = request.get_json()
     hidden = data.get('hidden', [])
-    try:
-        json.dump(hidden, open(HIDE_FILE, 'w', encoding='utf-8'), indent=2)
-        return jsonify(success=True)
-    except:
-        return jsonify(success=False), 500
+    hidden_items.set(hidden)
+    return jsonify(success=True)
 
 # Add endpoint for hidden_extensions
 @app.route('/api/options/hidden_extensions', methods=['POST'])
 def update_hidden_extensions():
     data = request.get_json()
     hidden_exts = data.get('hidden_extensions', [])
-    try:
-        with open(PREF_FILE, 'r', encoding='utf-8') as f:
-            pref = json.load(f)
-        pref['hidden_extensions'] = hidden_exts
-        json.dump(pref, open(PREF_FILE, 'w', encoding='utf-8'), indent=2)
-        return jsonify(success=True)
-    except Exception:
-        return jsonify(success=False), 500
+    preferences.update(lambda pref: pref.update(hidden_extensions=hidden_exts))
+    return jsonify(success=True)
+
+@app.route('/api/options/exclusions', methods=['POST'])
+def update_exclusions():
+    # Glob patterns (gitignore syntax) excluded from the project, and whether .gitignore files apply
+    data = request.get_json()
+    patterns = [p for p in data.get('exclude_patterns', []) if isinstance(p, str) and p.strip()]
+    use_gitignore = bool(data.get('use_gitignore', True))
+    preferences.update(lambda pref: pref.update(exclude_patterns=patterns, use_gitignore=use_gitignore))
+    # Reconfigure now so the rebuild starts before the next listing
+    get_project_index(wait=False)
+    reset_name_index()
+    return jsonify(success=True)
+
+@app.route('/api/options/encodings', methods=['POST'])
+def update_encodings():
+    # Codecs tried in order for files that are not UTF-8; unknown names are dropped
+    data = request.get_json()
+    content_cache.set_fallback_encodings(
+        [e.strip() for e in data.get('fallback_encodings', []) if isinstance(e, str) and e.strip()])
+    encodings = list(content_cache.fallback_encodings)
+    preferences.update(lambda pref: pref.update(fallback_encodings=encodings))
+    return jsonify(success=True, fallback_encodings=encodings)
 
 # Helper function to build tree structure string (similar to Tkinter version)
-def build_tree_string(path, hidden_items, show_hidden, excluded_dirs):
+def build_tree_string(index, path, hidden, show_hidden):
     lines = []
-    # Normalize excluded dirs for comparison
-    excluded_dirs_norm = {os.path.normpath(d) for d in excluded_dirs}
 
     def recurse(current_path, prefix=''):
-        try:
-            # Filter excluded directories early
-            base_name = os.path.basename(current_path)
-            if base_name in excluded_dirs_norm or base_name.startswith('.'): # Also exclude hidden files/dirs by default
-                 # Check if it's explicitly in hidden_items OR starts with '.' and show_hidden is false
-                 norm_current_path = os.path.normpath(current_path)
-                 is_hidden_explicitly = norm_current_path in hidden_items
-                 is_hidden_convention = base_name.startswith('.')
-
-                 if not show_hidden and (is_hidden_explicitly or is_hidden_convention):
-                     return # Skip if hidden and not showing hidden
-                 # If showing hidden, we continue but might style it later if needed
-
-            items = os.listdir(current_path)
-            items.sort()
-        except (PermissionError, FileNotFoundError):
-            return
+        # Excluded entries never come out of the index; dot entries are hidden by default
+        base_name = os.path.basename(current_path)
+        if base_name.startswith('.'):
+             # Check if it's explicitly in hidden_items OR starts with '.' and show_hidden is false
+             is_hidden_explicitly = hidden.is_hidden(current_path)
+             is_hidden_convention = base_name.startswith('.')
+
+             if not show_hidden and (is_hidden_explicitly or is_hidden_convention):
+                 return # Skip if hidden and not showing hidden
+             # If showing hidden, we continue but might style it later if needed
+
+        # Indexed listing is sorted by name and already knows each entry's type
+        entries = index.children(current_path)
 
         # Separate dirs and files to list dirs first (optional, for consistency)
-        dirs = sorted([item for item in items if os.path.isdir(os.path.join(current_path, item))])
-        files = sorted([item for item in items if not os.path.isdir(os.path.join(current_path, item))])
+        dirs = [entry for entry in entries if entry.is_dir]
+        files = [entry for entry in entries if not entry.is_dir]
         sorted_items = dirs + files # List directories first
 
-        for idx, item in enumerate(sorted_items):
-            abs_path = os.path.join(current_path, item)
-            norm_abs_path = os.path.normpath(abs_path)
+        for idx, entry in enumerate(sorted_items):
+            item = entry.name
+            abs_path = entry.path
             base_item_name = os.path.basename(item)
 
-            # Skip excluded dirs
-            if base_item_name in excluded_dirs_norm:
-                continue
-
             # Check if hidden
-            is_hidden_explicitly = norm_abs_path in hidden_items
+            is_hidden_explicitly = hidden.is_hidden(abs_path)
             is_hidden_convention = base_item_name.startswith('.')
             is_hidden = is_hidden_explicitly or is_hidden_convention
 
@@ -263,7 +656,7 @@ def build_tree_string(path, hidden_items, show_hidden, excluded_dirs):
                  line += " (hidden)" # Mark hidden items if shown
             lines.append(line)
 
-            if os.path.isdir(abs_path):
+            if entry.is_dir:
                 extension = '    ' if is_last else '│   ' # Corrected extension
                 recurse(abs_path, prefix + extension)
 
@@ -279,34 +672,23 @@ def get_tree_structure():
     base_path = os.getcwd() # Or get from a config/request param if needed
     show_hidden = request.args.get('showHidden', 'false').lower() == 'true'
 
-    # Load hidden items
-    try:
-        with open(HIDE_FILE, 'r', encoding='utf-8') as f:
-            hidden_set = set(json.load(f))
-    except:
-        hidden_set = set()
-
-    # Define excluded dirs (consider making this configurable)
-    excluded_dirs = ['node_modules', '__pycache__', '.git', '.venv', 'venv']
+    index = get_project_index()
+    # One stat per directory instead of a full rebuild when nothing changed
+    etag = make_etag('tree_structure', base_path, show_hidden, index.tree_stamp(base_path), config_generation())
 
-    try:
-        tree_str = build_tree_string(base_path, hidden_set, show_hidden, excluded_dirs)
-        return jsonify(tree=tree_str)
-    except Exception as e:
-        app.logger.error(f"Error generating tree structure: {e}")
-        return jsonify(tree='// Error generating tree structure'), 500
+    def build():
+        try:
+            tree_str = build_tree_string(index, base_path, get_hidden_matcher(), show_hidden)
+            return jsonify(tree=tree_str)
+        except Exception as e:
+            app.logger.error(f"Error generating tree structure: {e}")
+            return jsonify(tree='// Error generating tree structure'), 500
 
-# Helper function to update JSON list file
-def update_json_list_file(filepath, old_item=None, new_item=None, remove_item=None):
-    items = set()
-    try:
-        if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                items = set(json.load(f))
-    except (json.JSONDecodeError, IOError) as e:
-        app.logger.warning(f"Could not read JSON file {filepath}: {e}")
-        items = set() # Reset on error
+    return conditional_response(etag, build)
 
+# Helper function to update a stored path list after a rename or delete
+def update_path_list(store, old_item=None, new_item=None, remove_item=None):
+    items = set(store.get())
     updated = False
     if remove_item and remove_item in items:
         items.remove(remove_item)
@@ -321,14 +703,9 @@ def update_json_list_file(filepath, old_item=None, new_item=None, remove_item=No
         updated = True
 
     if updated:
-        try:
-            # Ensure data directory exists
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(sorted(list(items)), f, ensure_ascii=False, indent=2)
-            app.logger.info(f"Updated JSON file: {filepath}")
-        except IOError as e:
-            app.logger.error(f"Could not write JSON file {filepath}: {e}")
+        # Written back by the store in the background
+        store.set(sorted(items))
+        app.logger.info(f"Updated path list: {store.path}")
 
 @app.route('/api/fs/rename', methods=['POST'])
 def rename_item():
@@ -361,8 +738,8 @@ def rename_item():
         app.logger.info(f"Renamed '{norm_old_path}' to '{new_path}'")
 
         # Update favorites and hidden items
-        update_json_list_file(FAV_FILE, old_item=norm_old_path, new_item=new_path)
-        update_json_list_file(HIDE_FILE, old_item=norm_old_path, new_item=new_path)
+        update_path_list(favorites, old_item=norm_old_path, new_item=new_path)
+        update_path_list(hidden_items, old_item=norm_old_path, new_item=new_path)
 
         # Return the new path relative to the base_dir for frontend update
         relative_new_path = os.path.relpath(new_path, base_dir)
@@ -388,8 +765,8 @@ def delete_item():
 
     if not os.path.exists(norm_path):
         # If it doesn't exist, still try to remove from JSON files just in case
-        update_json_list_file(FAV_FILE, remove_item=norm_path)
-        update_json_list_file(HIDE_FILE, remove_item=norm_path)
+        update_path_list(favorites, remove_item=norm_path)
+        update_path_list(hidden_items, remove_item=norm_path)
         return jsonify(success=False, message="Path does not exist."), 404
 
     try:
@@ -401,8 +778,8 @@ def delete_item():
             app.logger.info(f"Deleted file: {norm_path}")
 
         # Update favorites and hidden items
-        update_json_list_file(FAV_FILE, remove_item=norm_path)
-        update_json_list_file(HIDE_FILE, remove_item=norm_path)
+        update_path_list(favorites, remove_item=norm_path)
+        update_path_list(hidden_items, remove_item=norm_path)
 
         return jsonify(success=True)
     except Exception as e:
@@ -0,0 +1,56 @@
+"""Concurrent, order-preserving file reading for bundle assembly."""
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Default number of files read concurrently
+DEFAULT_WORKERS = 8
+
+# Outcome of reading one file: exactly one of content/error is set
+FileResult = namedtuple('FileResult', ['path', 'content', 'error'])
+
+
+class FallbackDecodeError(Exception):
+    """Raised when a file fits neither UTF-8 nor any of the fallback encodings."""
+
+
+def read_with_fallback(cache, path):
+    """
+    Read `path` through `cache`, which reads it once and tries its fallback
+    encodings in memory when UTF-8 fails. A file no codec fits is reported
+    as FallbackDecodeError.
+    """
+    try:
+        return cache.read(path)
+    except UnicodeDecodeError as e:
+        raise FallbackDecodeError(e) from e
+
+
+def _capture(read_fn, path):
+    try:
+        return FileResult(path, read_fn(path), None)
+    except Exception as e:
+        return FileResult(path, None, e)
+
+
+def read_ordered(paths, read_fn, max_workers=DEFAULT_WORKERS):
+    """
+    Yield a FileResult for every path, in the order given.
+
+    Files are read on a bounded thread pool; at most `2 * max_workers` reads
+    are in flight so results never pile up far ahead of the consumer.
+    """
+    max_workers = max(1, int(max_workers))
+    window = max_workers * 2
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            for path in paths:
+                pending.append(pool.submit(_capture, read_fn, path))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Consumer stopped early: drop reads that have not started yet
+            for future in pending:
+                future.cancel()
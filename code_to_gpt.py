@@ -3,10 +3,13 @@ import json
 import logging
 import os
 import queue
+import re
 import shutil
 import subprocess
 import threading
+import time
 import tkinter as tk
+from collections import OrderedDict, deque, namedtuple
 from tkinter import filedialog, font, messagebox, simpledialog
 from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
@@ -16,11 +19,31 @@ from PIL import Image, ImageTk
 from ttkbootstrap import Style
 from tkinterdnd2 import DND_FILES, TkinterDnD
 
+# Local modules
+from bundle_reader import FallbackDecodeError, read_ordered, read_with_fallback
+from content_cache import DEFAULT_FALLBACK_ENCODINGS, ContentCache, file_version
+from content_index import open_content_index
+from exclusions import DEFAULT_EXCLUDED_DIRS, GITIGNORE
+from file_ranges import LineIndexCache, format_line_range, split_line_range
+from file_sniffer import FileSniffer
+from fs_walker import combine, list_dir
+from fs_watcher import FsWatcher
+from hidden_matcher import HiddenMatcher
+from project_index import open_index
+from search_engine import SearchCriteria, run_search
+from token_budget import TokenCounter, load_tokenizer, pack
+from trigram_index import FileNameIndex
+from ui_queue import UiQueue
+from virtual_view import SegmentedDocument, VirtualTextView
+
 # Configure logging
 LOG_FILE = 'project_explorer.log'
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Segment d'un fichier dans le code généré : marque Tk de début, version rendue, tokens
+BundleSegment = namedtuple('BundleSegment', ['mark', 'key', 'tokens'])
+
 
 class ProjectExplorerApp:
     """
@@ -31,6 +54,16 @@ class ProjectExplorerApp:
     PREFERENCES_FILE = 'preferences.json'
     FAVORITES_FILE = 'favorites.json'
     HIDDEN_ITEMS_FILE = 'hidden_items.json'
+    # Répertoire des index de métadonnées des projets
+    INDEX_DIR = 'data'
+    # Temps maximal consacré à la queue par passage de la boucle Tk (secondes)
+    QUEUE_TICK_BUDGET = 0.008
+    # Intervalle de vérification du drapeau de la queue quand elle est vide (millisecondes)
+    QUEUE_POLL_MS = 15
+    # Nombre maximal de fichiers affichés par une recherche dans le contenu
+    CONTENT_SEARCH_LIMIT = 500
+    # Fichiers examinés pour décider si une extension inconnue est du texte
+    EXT_SNIFF_SAMPLES = 3
 
     def _initialize_variables(self):
         """Initialize instance variables."""
@@ -38,6 +71,11 @@ class ProjectExplorerApp:
         self.selected_files = {}             # Dictionary to store all selected files
         self.manual_selected_files = {}        # New: to store manual selections
         self.generate_code_after_id = None     # New: for debouncing multiple changes
+        self.bundle_segments = OrderedDict()   # Segments du code généré affiché, par fichier
+        self.segment_counter = 0               # Compteur pour nommer les marques des segments
+        self.bundle_document = SegmentedDocument()  # Texte complet du code généré, hors widget
+        self.virtual_mode = False              # Affichage virtualisé des gros bundles
+        self.code_search_pos = (0, 0)          # Position de départ de la prochaine recherche dans le code
 
         # Initialize theme and fullscreen variables before loading preferences
         self.current_theme = 'flatly'      # Default theme
@@ -49,13 +87,35 @@ class ProjectExplorerApp:
         self.font_size = 12
         self.code_font = "Courier"
         self.auto_refresh = True
+        self.content_cache_mb = 256        # Budget du cache de contenu des fichiers (Mo)
+        self.fallback_encodings = list(DEFAULT_FALLBACK_ENCODINGS)  # Encodages essayés si l'UTF-8 échoue
+        self.read_workers = 8              # Lectures de fichiers simultanées pour le code généré
+        self.token_vocab_file = ""         # Vocabulaire BPE local (format tiktoken), heuristique sinon
+        self.token_budget = 0              # Budget de tokens du code généré (0 = illimité)
+        self.pack_to_budget = False        # Ne garder que les fichiers prioritaires tenant dans le budget
+        self.virtual_view_threshold_mb = 5 # Au-delà, seul le texte visible du code généré est affiché
         self.ext_vars = {}
-        self.excluded_dirs = ['node_modules', '__pycache__', '.git', '__svn__', '__hg__', 'Google Drive']
+        self.excluded_dirs = list(DEFAULT_EXCLUDED_DIRS)
+        self.exclude_patterns = []         # Motifs exclus (syntaxe .gitignore), relatifs au projet
+        self.use_gitignore = True          # Appliquer les fichiers .gitignore du projet
         self.history_stack = []
-        self.queue = queue.Queue()
+        self.queue = UiQueue()
+        self.pending_inserts = deque()         # Lots d'insertions dans l'arborescence, appliqués par tranches
+        self.queue_after_id = None             # Prochain passage planifié de process_queue
+        self.processing_queue = False          # Vrai pendant un passage (une boîte de dialogue peut le réentrer)
+        self.loading_dirs = {}                 # Dossiers en cours de chargement -> numéro du chargement
+        self.load_counter = 0
         self.favorites = set()
         self.hidden_items = set()
+        self.hidden_matcher = HiddenMatcher()  # Recherche des éléments masqués, reconstruite à chaque modification
         self.path_to_item = {}
+        self.fs_watcher = None                 # Surveillance incrémentale du projet ouvert
+        self.name_index = None                 # Index trigramme des noms de fichiers du projet ouvert
+        self.name_index_lock = threading.Lock()
+        self.index_waits = set()               # Projets dont un thread attend la fin de construction de l'index
+        self.search_cancel = None              # Jeton d'annulation de la recherche avancée en cours
+        self.search_id = 0                     # Numéro de la dernière recherche avancée lancée
+        self.search_results_view = None        # (numéro, libellé, liste, chemins) de sa fenêtre de résultats
         self.is_initial_loading = False
         self.known_text_extensions = {
             '.txt', '.py', '.md', '.c', '.cpp', '.h', '.java', '.js', '.html', '.css',
@@ -69,6 +129,15 @@ class ProjectExplorerApp:
         self.load_preferences()
         self.load_favorites()
         self.load_hidden_items()
+        # Cache partagé du contenu des fichiers, dimensionné selon les préférences
+        self.content_cache = ContentCache(self.content_cache_mb * 1024 * 1024, self.fallback_encodings)
+        # Nature texte/binaire des fichiers, mémorisée par version de fichier
+        self.file_sniffer = FileSniffer()
+        # Positions des lignes des fichiers sélectionnés par plage de lignes
+        self.line_indexes = LineIndexCache()
+        # Comptage de tokens mémorisé par version de fichier
+        self.token_counter = TokenCounter(load_tokenizer(self.token_vocab_file), self.read_selection,
+                                          lambda: self.content_cache.fallback_encodings)
 
     def _setup_window(self):
         """Configure the main window."""
@@ -114,8 +183,9 @@ class ProjectExplorerApp:
         if self.path_var.get():
             self.on_path_change()
 
-        # Démarrer la boucle de vérification de la queue
-        self.root.after(100, self.process_queue)
+        # Démarrer la boucle de traitement de la queue : seul le thread Tk y touche,
+        # les threads de travail ne font que lever le drapeau de la queue
+        self.queue_after_id = self.root.after(self.QUEUE_POLL_MS, self.process_queue)
 
         # Protocole de fermeture pour sauvegarder les préférences
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
@@ -188,6 +258,13 @@ class ProjectExplorerApp:
                 self.hidden_items = set()
         else:
             self.hidden_items = set()
+        self.update_hidden_matcher()
+
+    def update_hidden_matcher(self):
+        """
+        Reconstruit la structure de recherche des éléments masqués.
+        """
+        self.hidden_matcher = HiddenMatcher(self.hidden_items)
 
     def save_hidden_items(self):
         """
@@ -220,6 +297,15 @@ class ProjectExplorerApp:
                 self.font_size = prefs.get("font_size", self.font_size)
                 self.code_font = prefs.get("code_font", self.code_font)
                 self.auto_refresh = prefs.get("auto_refresh", self.auto_refresh)
+                self.content_cache_mb = prefs.get("content_cache_mb", self.content_cache_mb)
+                self.fallback_encodings = prefs.get("fallback_encodings", self.fallback_encodings)
+                self.read_workers = prefs.get("read_workers", self.read_workers)
+                self.token_vocab_file = prefs.get("token_vocab_file", self.token_vocab_file)
+                self.token_budget = prefs.get("token_budget", self.token_budget)
+                self.pack_to_budget = prefs.get("pack_to_budget", self.pack_to_budget)
+                self.virtual_view_threshold_mb = prefs.get("virtual_view_threshold_mb", self.virtual_view_threshold_mb)
+                self.exclude_patterns = prefs.get("exclude_patterns", self.exclude_patterns)
+                self.use_gitignore = prefs.get("use_gitignore", self.use_gitignore)
                 
                 # Charger les extensions connues
                 known_extensions = prefs.get("known_extensions", [])
@@ -234,6 +320,10 @@ class ProjectExplorerApp:
         """
         try:
             selected_extensions = [ext for ext, var in self.ext_vars.items() if var.get()]
+            try:
+                token_budget = int(self.token_budget_var.get())
+            except (tk.TclError, ValueError):
+                token_budget = self.token_budget
             prefs = {
                 "window_geometry": self.root.geometry(),
                 "last_path": self.path_var.get(),
@@ -245,6 +335,15 @@ class ProjectExplorerApp:
                 "font_size": self.font_size,
                 "code_font": self.code_font,
                 "auto_refresh": self.auto_refresh,
+                "content_cache_mb": self.content_cache_mb,
+                "fallback_encodings": self.fallback_encodings,
+                "read_workers": self.read_workers,
+                "token_vocab_file": self.token_vocab_file,
+                "token_budget": token_budget,
+                "pack_to_budget": self.pack_to_budget_var.get(),
+                "virtual_view_threshold_mb": self.virtual_view_threshold_mb,
+                "exclude_patterns": self.exclude_patterns,
+                "use_gitignore": self.use_gitignore,
                 "known_extensions": list(self.known_text_extensions)  # Ajout des extensions connues
             }
             with open(self.PREFERENCES_FILE, 'w', encoding='utf-8') as f:
@@ -290,6 +389,15 @@ class ProjectExplorerApp:
         ttk.Button(simple_search_frame, text="Recherche", command=self.on_search).pack(side='left', padx=5)
         self.toggle_advanced_button = ttk.Button(simple_search_frame, text="Recherche Avancée", command=self.toggle_advanced_search)
         self.toggle_advanced_button.pack(side='left', padx=5)
+        # Recherche dans le contenu des fichiers (index trigramme)
+        ttk.Label(simple_search_frame, text="Contenu:").pack(side='left', padx=(15, 0))
+        self.content_search_var = tk.StringVar()
+        content_search_entry = ttk.Entry(simple_search_frame, textvariable=self.content_search_var, width=30)
+        content_search_entry.pack(side='left', padx=5)
+        content_search_entry.bind('<Return>', lambda event: self.on_content_search())
+        self.content_search_regex = tk.BooleanVar(value=False)
+        ttk.Checkbutton(simple_search_frame, text="Regex", variable=self.content_search_regex).pack(side='left', padx=5)
+        ttk.Button(simple_search_frame, text="Chercher", command=self.on_content_search).pack(side='left', padx=5)
 
         # --- PanedWindow principal ---
         self.paned = ttk.PanedWindow(self.root, orient='horizontal')
@@ -316,7 +424,18 @@ class ProjectExplorerApp:
         self.search_date_entry = ttk.Entry(self.advanced_search_frame, textvariable=self.search_date_var)
         self.search_date_entry.grid(row=2, column=1, sticky='ew', padx=5, pady=2)
         ttk.Label(self.advanced_search_frame, text="(format: YYYY-MM-DD)").grid(row=2, column=2, sticky='w', pady=2)
-        ttk.Button(self.advanced_search_frame, text="Rechercher", command=self.on_advanced_search).grid(row=3, column=1, sticky='e', pady=5)
+        ttk.Label(self.advanced_search_frame, text="Taille (Ko) min / max:").grid(row=3, column=0, sticky='w', pady=2)
+        size_frame = ttk.Frame(self.advanced_search_frame)
+        size_frame.grid(row=3, column=1, sticky='ew', padx=5, pady=2)
+        self.search_min_size_var = tk.StringVar()
+        ttk.Entry(size_frame, textvariable=self.search_min_size_var, width=10).pack(side='left', fill='x', expand=True)
+        self.search_max_size_var = tk.StringVar()
+        ttk.Entry(size_frame, textvariable=self.search_max_size_var, width=10).pack(side='left', fill='x', expand=True, padx=(5, 0))
+        ttk.Label(self.advanced_search_frame, text="Chemin (motif):").grid(row=4, column=0, sticky='w', pady=2)
+        self.search_glob_var = tk.StringVar()
+        ttk.Entry(self.advanced_search_frame, textvariable=self.search_glob_var).grid(row=4, column=1, sticky='ew', padx=5, pady=2)
+        ttk.Label(self.advanced_search_frame, text="(ex: src/**/*.py, test_*)").grid(row=4, column=2, sticky='w', pady=2)
+        ttk.Button(self.advanced_search_frame, text="Rechercher", command=self.on_advanced_search).grid(row=5, column=1, sticky='e', pady=5)
         self.advanced_search_frame.pack_forget()  # Masquer initialement
 
         # Arborescence dans left_frame
@@ -424,10 +543,39 @@ class ProjectExplorerApp:
         # Onglet Code : affichage du code généré
         self.tab_code = ttk.Frame(self.notebook)
         self.notebook.add(self.tab_code, text="Code généré")
-        self.code_text = ScrolledText(self.tab_code, height=15, state='disabled')
+        # Deux vues du code : widget complet, ou vue virtualisée pour les gros bundles
+        code_container = ttk.Frame(self.tab_code)
+        code_container.pack(side='top', fill='both', expand=True, padx=5, pady=5)
+        self.code_text = ScrolledText(code_container, height=15, state='disabled')
         # Appliquer la police et taille définie dans les préférences
         self.code_text.config(font=(self.code_font, self.font_size))
-        self.code_text.pack(side='top', fill='both', expand=True, padx=5, pady=5)
+        self.code_text.tag_configure('search', background='yellow')
+        self.code_text.pack(fill='both', expand=True)
+        self.code_view = VirtualTextView(code_container, self.bundle_document, height=15,
+                                         font=(self.code_font, self.font_size))
+        # Recherche dans l'ensemble du code généré
+        code_search_frame = ttk.Frame(self.tab_code)
+        code_search_frame.pack(side='top', fill='x', padx=5)
+        ttk.Label(code_search_frame, text="Rechercher dans le code:").pack(side='left')
+        self.code_search_var = tk.StringVar()
+        self.code_search_var.trace_add("write", lambda *args: setattr(self, 'code_search_pos', (0, 0)))
+        code_search_entry = ttk.Entry(code_search_frame, textvariable=self.code_search_var, width=30)
+        code_search_entry.pack(side='left', padx=5)
+        code_search_entry.bind('<Return>', lambda event: self.search_in_code())
+        ttk.Button(code_search_frame, text="Suivant", command=self.search_in_code).pack(side='left', padx=5)
+        # Budget de tokens et nombre de tokens du code généré
+        budget_frame = ttk.Frame(self.tab_code)
+        budget_frame.pack(side='top', fill='x', padx=5)
+        ttk.Label(budget_frame, text="Budget (tokens):").pack(side='left')
+        self.token_budget_var = tk.IntVar(value=self.token_budget)
+        budget_entry = ttk.Entry(budget_frame, textvariable=self.token_budget_var, width=10)
+        budget_entry.pack(side='left', padx=5)
+        budget_entry.bind('<Return>', lambda event: self.schedule_generate_code())
+        self.pack_to_budget_var = tk.BooleanVar(value=self.pack_to_budget)
+        ttk.Checkbutton(budget_frame, text="Limiter au budget", variable=self.pack_to_budget_var,
+                        command=self.schedule_generate_code).pack(side='left', padx=5)
+        self.token_count_var = tk.StringVar(value="")
+        ttk.Label(budget_frame, textvariable=self.token_count_var).pack(side='right', padx=5)
         button_frame = ttk.Frame(self.tab_code)
         button_frame.pack(side='top', pady=5)
         # Removed: bouton "Générer le code"
@@ -495,6 +643,7 @@ class ProjectExplorerApp:
         self.context_menu.add_separator()
         self.context_menu.add_command(label="Sélectionner", command=self.select_from_context_menu)
         self.context_menu.add_command(label="Désélectionner", command=self.deselect_from_context_menu)
+        self.context_menu.add_command(label="Sélectionner des lignes...", command=self.select_lines_from_context_menu)
 
         self.tree.bind("<Button-3>", self.show_context_menu)  # Windows/Linux
         self.tree.bind("<Button-2>", self.show_context_menu)  # macOS
@@ -536,6 +685,29 @@ class ProjectExplorerApp:
                 path = item_values[0]
                 self.add_selected_file(path)
 
+    def select_lines_from_context_menu(self):
+        """
+        Ajoute au code généré une plage de lignes du fichier sélectionné, saisie sous la forme « début-fin ».
+        """
+        selected_item = self.tree.selection()
+        if not selected_item:
+            return
+        item_values = self.tree.item(selected_item[0], 'values')
+        if not item_values or not os.path.isfile(item_values[0]):
+            return
+        path = item_values[0]
+        answer = simpledialog.askstring("Sélectionner des lignes",
+                                        f"Lignes de {os.path.basename(path)} (début-fin) :", parent=self.root)
+        if not answer:
+            return
+        try:
+            start, end = (int(part) for part in answer.replace(' ', '').split('-', 1))
+        except ValueError:
+            messagebox.showerror("Erreur", "Plage invalide, format attendu : début-fin (ex. 120-180).")
+            return
+        start, end = sorted((max(1, start), max(1, end)))
+        self.add_selected_file(format_line_range(path, start, end))
+
     def deselect_from_context_menu(self):
         selected_item = self.tree.selection()
         if (selected_item):
@@ -553,6 +725,7 @@ class ProjectExplorerApp:
         for item in selected_items:
             path = self.tree.item(item, 'values')[0]
             self.hidden_items.add(path)
+        self.update_hidden_matcher()
         self.save_preferences()
         self.refresh_tree()
         # Update generated code when items are hidden
@@ -562,10 +735,8 @@ class ProjectExplorerApp:
         """
         Réaffiche l'arborescence en tenant compte des éléments masqués et de la préférence d'affichage.
         """
-        self.tree.delete(*self.tree.get_children())
-        self.path_to_item.clear()
-        root_path = self.path_var.get()
-        threading.Thread(target=self.insert_tree_items, args=('', root_path), daemon=True).start()
+        self.clear_tree()
+        self.load_tree_dir('', self.path_var.get(), force=True)
 
     def open_item(self):
         """
@@ -882,23 +1053,18 @@ class ProjectExplorerApp:
         """
         path = self.path_var.get()
         lines = []
+        prune = self.tree_prune_hook(path)
         def recurse(path, prefix=''):
             try:
-                items = os.listdir(path)
-            except (PermissionError, FileNotFoundError):
+                entries = list_dir(path, prune)
+            except OSError:
                 return
-            items.sort()
-            for idx, item in enumerate(items):
-                if item in self.excluded_dirs:
-                    continue
-                abs_path = os.path.join(path, item)
-                if abs_path in self.hidden_items and not self.show_hidden.get():
-                    continue
-                connector = '├── ' if idx < len(items) - 1 else '└── '
-                lines.append(f"{prefix}{connector}{item}")
-                if os.path.isdir(abs_path):
-                    extension = '│   ' if idx < len(items) - 1 else '    '
-                    recurse(abs_path, prefix + extension)
+            for idx, entry in enumerate(entries):
+                connector = '├── ' if idx < len(entries) - 1 else '└── '
+                lines.append(f"{prefix}{connector}{entry.name}")
+                if entry.is_dir():
+                    extension = '│   ' if idx < len(entries) - 1 else '    '
+                    recurse(entry.path, prefix + extension)
         recurse(path)
         return '\n'.join(lines)
 
@@ -907,7 +1073,7 @@ class ProjectExplorerApp:
         Copie le code dans le presse-papiers.
         """
         try:
-            code_str = self.code_text.get('1.0', tk.END)
+            code_str = self.bundle_document.text()
             self.root.clipboard_clear()
             self.root.clipboard_append(code_str)
             messagebox.showinfo("Succès", "Le code a été copié dans le presse-papiers.")
@@ -922,7 +1088,7 @@ class ProjectExplorerApp:
         """
         try:
             tree_str = self.get_full_treeview_items()
-            code_str = self.code_text.get('1.0', tk.END)
+            code_str = self.bundle_document.text()
             all_str = tree_str + '\n' + code_str
             self.root.clipboard_clear()
             self.root.clipboard_append(all_str)
@@ -963,92 +1129,197 @@ class ProjectExplorerApp:
         else:
             current_path = self.path_var.get()
         if os.path.isdir(current_path):
-            self.tree.delete(*self.tree.get_children())
-            self.path_to_item.clear()
+            self.clear_tree()
+            self.progress['maximum'] = 100
             self.progress['value'] = 0
             self.status_var.set("Chargement de l'arborescence...")
             logging.info(f"Chargement du projet à partir de {current_path}")
             self.is_initial_loading = True
-            threading.Thread(target=self.build_treeview_thread, args=(current_path,), daemon=True).start()
+            self.load_tree_dir('', current_path, force=True, initial=True)
             threading.Thread(target=self.update_extensions, args=(current_path,), daemon=True).start()
+            self.start_fs_watcher(current_path)
             self.selected_files = {} # Reset selected files on path change.
             self.manual_selected_files = {} # Reset manual selection too
             self.on_generate_code() # Generate code after path change
         else:
-            self.tree.delete(*self.tree.get_children())
+            self.stop_fs_watcher()
+            self.clear_tree()
             for widget in self.ext_frame.winfo_children():
                 widget.destroy()
             self.ext_vars.clear()
-            self.path_to_item.clear()
 
-    def build_treeview_thread(self, path):
+    def start_fs_watcher(self, path):
+        """
+        Démarre la surveillance du projet (inotify, ou scrutation à défaut) à la place de l'ancienne.
+        La racine est fixée ici : le thread de surveillance ne lit aucune variable Tk.
+        """
+        self.stop_fs_watcher()
+        self.fs_watcher = FsWatcher(path, lambda changes: self.on_fs_change_thread(path, changes),
+                                    exclusions=self.open_project_index(path).exclusions,
+                                    ignore_paths=[self.INDEX_DIR]).start()
+
+    def stop_fs_watcher(self):
+        if self.fs_watcher:
+            self.fs_watcher.stop()
+            self.fs_watcher = None
+
+    def on_fs_change_thread(self, root, changes):
+        """
+        Appelé par le thread de surveillance du projet `root` : met à jour l'index pour les
+        seuls dossiers et fichiers modifiés, puis transmet les changements à l'interface via la queue,
+        avec les extensions texte du projet quand des fichiers ont pu apparaître.
+        """
+        # Sans attendre une construction en cours : elle prendra aussi ces changements
+        index = self.get_project_index(root, wait=False)
+        for path in changes.dirs:
+            index.rescan_dir(path)
+        for path in changes.files:
+            index.refresh_file(path)
+        name_index = self.name_index
+        gitignore_changed = any(os.path.basename(path) == GITIGNORE for path in changes.files)
+        if gitignore_changed:
+            # Tout un sous-arbre a pu changer d'exclusion : index des noms reconstruit à la demande
+            self.name_index = None
+        elif name_index is not None:
+            for path in changes.dirs:
+                name_index.sync_dir(index, path)
+        # Requête d'index et lecture d'échantillons : faites ici plutôt que sur le thread Tk
+        extensions = self.get_text_extensions(root, wait=False) if changes.dirs or gitignore_changed else []
+        self.queue.put(('fs_changed', changes, extensions))
+
+    def on_fs_changed(self, changes, extensions):
+        """
+        Applique des changements du système de fichiers sans tout reparcourir :
+        seuls les dossiers modifiés sont rechargés dans l'arborescence, ainsi que ceux
+        dont le .gitignore a changé.
+        """
+        dirs = set(changes.dirs)
+        dirs.update(os.path.dirname(path) for path in changes.files if os.path.basename(path) == GITIGNORE)
+        for path in sorted(dirs):
+            self.refresh_tree_dir(path)
+        # Ajouter les nouvelles extensions sans réinitialiser les cases déjà cochées
+        for ext in extensions:
+            if ext not in self.ext_vars:
+                self.queue.put(('add_extension', ext))
+        if dirs:
+            self.update_selected_files()
+        elif any(split_line_range(path)[0] in changes.files for path in self.selected_files):
+            self.schedule_generate_code()
+
+    def refresh_tree_dir(self, path):
+        """
+        Recharge les enfants d'un dossier s'il est affiché dans l'arborescence.
         """
-        Construit l'arborescence du projet dans un thread séparé.
+        if os.path.normpath(path) == os.path.normpath(os.path.abspath(self.path_var.get())):
+            item = ''
+        else:
+            item = self.path_to_item.get(path)
+            if not item:
+                return
+        self.forget_tree_children(item)
+        if item == '' or self.tree.item(item, 'open'):
+            self.load_tree_dir(item, path, force=True)
+        else:
+            self.tree.insert(item, 'end')  # Nœud factice pour le chargement paresseux
+
+    def forget_tree_children(self, item):
         """
+        Supprime les enfants d'un nœud et leurs entrées dans path_to_item.
+        """
+        for child in self.tree.get_children(item):
+            self.forget_tree_children(child)
+            values = self.tree.item(child, 'values')
+            if values:
+                self.path_to_item.pop(values[0], None)
+        self.tree.delete(*self.tree.get_children(item))
+        # Les lignes encore en attente pour ce nœud appartiennent à l'ancien listage
+        self.pending_inserts = deque(pending for pending in self.pending_inserts if pending[0] != item)
+
+    def clear_tree(self):
+        """
+        Vide l'arborescence ; les chargements en cours et les insertions en attente sont abandonnés.
+        """
+        self.tree.delete(*self.tree.get_children())
+        self.path_to_item.clear()
+        self.pending_inserts.clear()
+        self.loading_dirs.clear()
+
+    def tree_prune_hook(self, path=None):
+        """
+        Filtre des listages de l'arborescence sous `path` : règles d'exclusion du projet
+        (dossiers exclus, motifs et .gitignore), et éléments masqués sauf si leur affichage
+        est demandé.
+        """
+        rules = self.open_project_index(path).exclusions
+        hidden = None if self.show_hidden.get() else (lambda entry: self.hidden_matcher.is_hidden(entry.path))
+        return combine(rules.prune, hidden)
+
+    def load_tree_dir(self, parent, path, force=False, initial=False):
+        """
+        Lance le chargement des enfants d'un dossier (thread principal uniquement) :
+        un thread liste et filtre le dossier, puis les lignes sont insérées par lots
+        depuis la queue. Un dossier déjà en cours de chargement n'est pas relancé, sauf
+        avec `force`, auquel cas le résultat du chargement précédent est ignoré.
+        """
+        if path in self.loading_dirs and not force:
+            return
+        self.load_counter += 1
+        self.loading_dirs[path] = self.load_counter
+        # Le filtre lit les variables Tk : il est construit ici et non dans le thread
+        prune = self.tree_prune_hook(path)
+        threading.Thread(target=self.list_tree_dir_thread,
+                         args=(self.load_counter, parent, path, prune, initial), daemon=True).start()
+
+    def list_tree_dir_thread(self, token, parent, path, prune, initial):
+        """
+        Liste un dossier hors du thread principal et transmet à la queue les lignes
+        (nom, chemin, dossier, tags) à insérer. Aucun appel Tk n'est fait ici.
+        """
+        rows = []
         try:
-            self.queue.put(('progress_max', 100))
-            self.queue.put(('progress_value', 0))
-            self.queue.put(('status', "Chargement de l'arborescence..."))
-            self.insert_tree_items('', path)
+            matcher = self.hidden_matcher
+            for entry in list_dir(path, prune):
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                tags = ('hidden',) if matcher.is_hidden(entry.path) else ()
+                rows.append((entry.name, entry.path, is_dir, tags))
+        except OSError as e:
+            logging.error(f"Erreur lors du listage de {path}: {e}")
+            if initial:
+                self.queue.put(('error_message', f"Erreur lors du chargement de l'arborescence: {e}"))
+        finally:
+            self.queue.put(('tree_rows', token, parent, path, rows))
+        if initial:
+            # Traités après l'insertion des lignes, les messages étant appliqués dans l'ordre
             self.queue.put(('progress_value', 100))
             self.queue.put(('status', "Chargement terminé"))
             logging.info("Arborescence chargée avec succès")
-        except Exception as e:
-            logging.error(f"Erreur dans le thread de construction de l'arborescence pour {path}: {e}")
-            self.queue.put(('error_message', f"Erreur lors du chargement de l'arborescence: {e}"))
 
-    def insert_tree_items(self, parent, path):
+    def on_treeview_open(self, event):
         """
-        Insère les éléments dans le Treeview avec lazy loading.
+        Chargement paresseux des sous-dossiers lorsqu'un dossier est ouvert.
         """
-        try:
-            items = os.listdir(path)
-        except (PermissionError, FileNotFoundError):
-            return
-        items.sort()
-        for idx, item in enumerate(items):
-            if item in self.excluded_dirs:
-                continue
-            abs_path = os.path.join(path, item)
-            if abs_path in self.hidden_items and not self.show_hidden.get():
-                continue
-            tags = ()
-            if abs_path in self.hidden_items:
-                tags = ('hidden',)
-            try:
-                is_dir = os.path.isdir(abs_path)
-                if is_dir:
-                    node = self.tree.insert(parent, 'end', text=item, open=False, values=[abs_path],
-                                            image=self.folder_icon if self.folder_icon else '', tags=tags)
-                    self.tree.insert(node, 'end')
-                else:
-                    node = self.tree.insert(parent, 'end', text=item, values=[abs_path],
-                                            image=self.file_icon if self.file_icon else '', tags=tags)
-                self.path_to_item[abs_path] = node
-                if self.is_initial_loading:
-                    self.queue.put(('progress_increment',))
-                    percentage = (self.progress['value'] + 1) % 100
-                    self.queue.put(('status', f"Chargement... {percentage:.2f}%"))
-            except (PermissionError, FileNotFoundError):
-                continue
+        self.expand_tree_node(self.tree.focus())
 
-    def on_treeview_open(self, event):
+    def expand_tree_node(self, node):
         """
-        Chargement paresseux des sous-dossiers lorsqu'un dossier est ouvert.
+        Charge les enfants d'un nœud de dossier s'ils ne sont ni chargés ni en cours de chargement.
         """
-        node = self.tree.focus()
         if not node:
             return
-        children = self.tree.get_children(node)
-        for child in children:
-            if not self.tree.get_children(child):
-                self.tree.delete(child)
         item_values = self.tree.item(node, 'values')
         if not item_values:
             return
+        # Seul le nœud factice d'un dossier pas encore chargé n'a pas de chemin
+        placeholders = [child for child in self.tree.get_children(node) if not self.tree.item(child, 'values')]
+        if not placeholders:
+            return
+        self.tree.delete(*placeholders)
         current_path = item_values[0]
         logging.info(f"Chargement du sous-dossier: {current_path}")
-        threading.Thread(target=self.insert_tree_items, args=(node, current_path), daemon=True).start()
+        self.load_tree_dir(node, current_path)
 
     def on_treeview_double_click(self, event):
         """
@@ -1079,23 +1350,108 @@ class ProjectExplorerApp:
         except Exception as e:
             logging.error(f"Erreur lors de la mise à jour des extensions: {e}")
 
-    def get_text_extensions(self, path):
+    def open_project_index(self, path=None):
+        """
+        Retourne l'index couvrant le chemin (par défaut le projet courant) avec les règles
+        d'exclusion des préférences, sans le construire. Un changement de ces règles
+        entraîne la reconstruction de l'index au prochain get_project_index().
+        """
+        return open_index(path or self.path_var.get(), self.INDEX_DIR, self.excluded_dirs,
+                          self.exclude_patterns, self.use_gitignore)
+
+    def get_project_index(self, path=None, wait=True):
+        """
+        Retourne l'index de métadonnées couvrant le chemin (par défaut le projet courant).
+        L'index est construit au premier appel puis réutilisé entre les sessions.
+        Avec wait=False, la construction se fait sur un thread et l'index peut être partiel :
+        c'est la seule forme utilisable depuis le thread Tk.
+        """
+        index = self.open_project_index(path)
+        if wait:
+            index.ensure_built()
+        else:
+            index.build_in_background()
+        return index
+
+    def wait_for_index(self, path):
+        """
+        Attend sur un thread la fin de la construction de l'index de `path`, puis le signale
+        à l'interface par la tâche index_rebuilt. Un seul thread d'attente par projet.
+        """
+        if path in self.index_waits:
+            return
+        self.index_waits.add(path)
+
+        def wait():
+            try:
+                self.get_project_index(path)
+            except Exception as e:
+                logging.error(f"Erreur lors de la construction de l'index pour {path}: {e}")
+                self.queue.put(('index_rebuilt', path, False))
+            else:
+                self.queue.put(('index_rebuilt', path, True))
+        threading.Thread(target=wait, daemon=True).start()
+
+    def apply_exclusions(self, patterns, use_gitignore):
+        """
+        Applique de nouvelles règles d'exclusion : l'arborescence et la surveillance sont
+        rechargées, l'index est reconstruit sur un thread, puis la sélection est recalculée.
+        """
+        if patterns == self.exclude_patterns and use_gitignore == self.use_gitignore:
+            return
+        self.exclude_patterns = patterns
+        self.use_gitignore = use_gitignore
+        self.name_index = None
+        path = self.path_var.get()
+        if os.path.isdir(path):
+            self.start_fs_watcher(path)
+            self.refresh_tree()
+            self.wait_for_index(path)
+
+    def get_name_index(self, path):
+        """
+        Retourne l'index trigramme des noms de fichiers du projet, construit au premier
+        appel à partir de l'index de métadonnées puis tenu à jour par la surveillance.
         """
-        Identifie les extensions de fichiers texte dans le chemin donné.
+        root = os.path.normpath(os.path.abspath(path))
+        with self.name_index_lock:
+            if self.name_index is None or self.name_index.root != root:
+                name_index = FileNameIndex(root)
+                name_index.build(self.get_project_index(root))
+                self.name_index = name_index
+                logging.info(f"Index des noms construit pour {root}: {len(name_index)} fichiers")
+            return self.name_index
+
+    def get_text_extensions(self, path, wait=True):
+        """
+        Identifie les extensions de fichiers texte dans le chemin donné : les extensions
+        connues, et les autres dont les premiers fichiers s'avèrent être du texte.
+        Avec wait=False, se contente de l'index tel qu'il est si sa construction est en cours.
         """
-        extensions = set()
         try:
-            for root_dir, dirs, files in os.walk(path):
-                dirs[:] = [d for d in dirs if d not in self.excluded_dirs]
-                for file in files:
-                    ext = os.path.splitext(file)[1]
-                    if ext.lower() in self.known_text_extensions:
-                        extensions.add(ext)
+            index = self.get_project_index(path, wait)
+            # Statistiques par extension tenues à jour par l'index pour la racine du projet
+            if os.path.normpath(os.path.abspath(path)) == index.root:
+                found = index.extension_stats()
+            else:
+                found = index.extensions(path)
+            extensions = {ext for ext in found
+                          if ext.lower() in self.known_text_extensions or self.is_text_extension(index, path, ext)}
             return sorted(extensions)
         except Exception as e:
             logging.error(f"Erreur lors de la récupération des extensions pour {path}: {e}")
             return []
 
+    def is_text_extension(self, index, path, ext):
+        """
+        Vrai si les premiers fichiers de cette extension sous `path` ne sont pas binaires.
+        """
+        samples = index.files(path, [ext], limit=self.EXT_SNIFF_SAMPLES)
+        try:
+            return bool(samples) and not any(self.file_sniffer.is_binary(entry.path) for entry in samples)
+        except OSError:
+            return False
+
     def select_all_exts(self):
         """
         Sélectionne toutes les extensions.
@@ -1118,12 +1474,7 @@ class ProjectExplorerApp:
         """
         Vérifie si le chemin est masqué ou si l'un de ses dossiers parents est masqué.
         """
-        path = os.path.abspath(path)
-        for hidden_path in self.hidden_items:
-            hidden_path = os.path.abspath(hidden_path)
-            if path == hidden_path or path.startswith(hidden_path + os.sep):
-                return True
-        return False
+        return self.hidden_matcher.is_hidden(path)
 
     def schedule_generate_code(self, delay=100):
         """Debounce multiple changes by canceling previous and scheduling one call.""" 
@@ -1136,17 +1487,21 @@ class ProjectExplorerApp:
         repo_path = self.path_var.get()
         selected_exts = [ext for ext, var in self.ext_vars.items() if var.get()]
         dynamic_selected = {}
-        # Parcours du répertoire
-        for root_dir, dirs, files in os.walk(repo_path):
+        # Requêtes sur l'index du projet au lieu d'un parcours complet du répertoire ;
+        # sans bloquer le thread Tk : pendant une construction, la sélection est recalculée
+        # à la réception de index_rebuilt
+        if os.path.isdir(repo_path):
+            index = self.get_project_index(repo_path, wait=False)
+            if not index.is_current:
+                self.wait_for_index(repo_path)
+            for entry in index.files(repo_path, selected_exts):
+                if not self.is_hidden(entry.path):
+                    dynamic_selected[entry.path] = True
             # If a parent folder was manually selected, add all its files.
-            if root_dir in self.manual_selected_files: # Changed to check root_dir in manual_selected_files keys
-                for file in files:
-                    dynamic_selected[os.path.join(root_dir, file)] = True
-            else:
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    if os.path.splitext(file)[1] in selected_exts:
-                        dynamic_selected[file_path] = True
+            for selected_path in self.manual_selected_files:
+                if index.contains(selected_path):
+                    for entry in index.child_files(selected_path):
+                        dynamic_selected[entry.path] = True
         # Combine computed selections with manual selections.
         self.selected_files = {}
         self.selected_files.update(dynamic_selected)
@@ -1175,43 +1530,229 @@ class ProjectExplorerApp:
 
     # The on_generate_code method is called via schedule_generate_code
     def on_generate_code(self):
+        """
+        Met à jour le code généré de façon incrémentale : seuls les fichiers ajoutés,
+        retirés ou modifiés depuis la génération précédente sont relus. Le texte complet
+        est conservé hors widget ; au-delà du seuil configuré, seule la partie visible
+        est affichée, sinon chaque segment est repéré dans le widget par une marque Tk.
+        """
+        if self.generate_code_after_id:
+            self.root.after_cancel(self.generate_code_after_id)
+            self.generate_code_after_id = None
+        paths, skipped = self.get_bundle_paths()
+        keys = {path: (self.get_segment_version(path), index == 0) for index, path in enumerate(paths)}
+        old_segments = self.bundle_segments
+
+        # Segments inchangés ; si leur ordre relatif a changé, tout est régénéré
+        kept = [path for path, segment in old_segments.items() if keys.get(path) == segment.key]
+        kept_set = set(kept)
+        if kept != [path for path in paths if path in kept_set]:
+            kept_set = set()
+
+        # Lecture parallèle des seuls fichiers à (ré)insérer, dans l'ordre de la sélection
+        results = read_ordered([p for p in paths if p not in kept_set], self.read_selection, self.read_workers)
+        new_segments = OrderedDict()
+        new_texts = {}
+        for path in paths:
+            if path in kept_set:
+                new_segments[path] = old_segments[path]
+                continue
+            new_texts[path], tokens = self.render_bundle_segment(next(results), first=keys[path][1])
+            new_segments[path] = BundleSegment(None, keys[path], tokens)
+        self.bundle_document.update(paths, new_texts)
+
+        virtual = self.bundle_document.size > self.virtual_view_threshold_mb * 1024 * 1024
+        if virtual != self.virtual_mode:
+            self.set_virtual_mode(virtual)
+            old_segments = OrderedDict()
+            kept_set = set()
+        if virtual:
+            # Aucune marque dans le widget en mode virtualisé
+            for path, segment in new_segments.items():
+                new_segments[path] = segment._replace(mark=None)
+            self.code_view.refresh()
+        else:
+            self.patch_code_text(old_segments, new_segments, kept_set)
+        self.bundle_segments = new_segments
+        self.code_search_pos = (0, 0)
+
+        self.update_token_count(sum(segment.tokens for segment in new_segments.values()), skipped)
+        stats = self.content_cache.stats()
+        logging.info(f"Cache de contenu: {stats['hits']} hits, {stats['misses']} misses, {stats['bytes']} octets")
+
+    def patch_code_text(self, old_segments, new_segments, kept_set):
+        """
+        Applique au widget de code les segments retirés ou modifiés, sans toucher
+        aux segments conservés, et pose une marque au début de chaque nouveau segment.
+        """
         self.code_text.configure(state='normal')
-        self.code_text.delete('1.0', tk.END)
-        code = ""
-        first_file = True # Flag to track the first file
-        for file_path in self.selected_files:
-            if not first_file:
-                code += "\n--------------------------\n\n" # Separator line with spaces
+        # Supprimer les segments retirés ou modifiés, du bas vers le haut
+        end = 'end-1c'
+        for path in reversed(list(old_segments)):
+            segment = old_segments[path]
+            if path in kept_set:
+                end = segment.mark
             else:
-                first_file = False # Set flag to false after the first file
-
-            code += f"{file_path}\n" # Display path
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    code += content + "\n\n" # Add content with extra space after
-            except FileNotFoundError:
-                logging.warning(f"Fichier non trouvé lors de la génération du code: {file_path}")
-                code += f"--- Fichier non trouvé: {file_path} ---\n\n"
-            except IOError as e:
-                logging.error(f"Erreur d'E/S lors de la lecture de {file_path}: {e}")
-                code += f"--- Erreur d'E/S: {e} ---\n\n"
-            except UnicodeDecodeError as e:
-                logging.warning(f"Erreur de décodage pour {file_path}: {e}. Tentative avec latin-1.")
-                try:
-                    with open(file_path, 'r', encoding='latin-1') as f:
-                        content = f.read()
-                        code += content + "\n\n"
-                except Exception as e_fallback:
-                    logging.error(f"Erreur de lecture (fallback latin-1) pour {file_path}: {e_fallback}")
-                    code += f"--- Erreur de lecture (fallback latin-1): {e_fallback} ---\n\n"
-            except Exception as e:
-                logging.error(f"Erreur générale lors de la lecture de {file_path}: {e}")
-                code += f"--- Erreur générale: {e} ---\n\n"
+                self.code_text.delete(segment.mark, end)
+                self.code_text.mark_unset(segment.mark)
+
+        # Point d'insertion de chaque nouveau segment : début du segment conservé suivant
+        insert_before = {}
+        next_mark = 'end-1c'
+        for path in reversed(list(new_segments)):
+            if path in kept_set:
+                next_mark = old_segments[path].mark
+            else:
+                insert_before[path] = next_mark
 
-        self.code_text.insert('1.0', code)
+        for path, segment in new_segments.items():
+            if path in kept_set:
+                continue
+            index = self.code_text.index(insert_before[path])
+            self.code_text.insert(index, self.bundle_document.segment_text(path))
+            self.segment_counter += 1
+            mark = f"segment{self.segment_counter}"
+            self.code_text.mark_set(mark, index)
+            new_segments[path] = segment._replace(mark=mark)
         self.code_text.configure(state='disabled') # Disable after writing
 
+    def set_virtual_mode(self, virtual):
+        """
+        Bascule entre le widget complet et la vue virtualisée du code généré.
+        """
+        self.virtual_mode = virtual
+        self.code_text.configure(state='normal')
+        self.code_text.delete('1.0', tk.END)
+        for segment in self.bundle_segments.values():
+            if segment.mark is not None:
+                self.code_text.mark_unset(segment.mark)
+        self.code_text.configure(state='disabled')
+        if virtual:
+            self.code_text.pack_forget()
+            self.code_view.first_line = 0
+            self.code_view.pack(fill='both', expand=True)
+        else:
+            self.code_view.pack_forget()
+            self.code_text.pack(fill='both', expand=True)
+        logging.info(f"Affichage {'virtualisé' if virtual else 'complet'} du code généré "
+                     f"({self.bundle_document.size} caractères)")
+
+    def search_in_code(self):
+        """
+        Recherche l'occurrence suivante dans tout le code généré, y compris la
+        partie non affichée en mode virtualisé.
+        """
+        query = self.code_search_var.get()
+        if not query:
+            return
+        match = self.bundle_document.find(query, *self.code_search_pos)
+        if match is None:
+            self.status_var.set(f"Aucune occurrence de '{query}' dans le code généré")
+            return
+        line, col = match
+        self.code_search_pos = (line, col + len(query))
+        if self.virtual_mode:
+            self.code_view.show(line, col, len(query))
+        else:
+            index = f"{line + 1}.{col}"
+            self.code_text.tag_remove('search', '1.0', tk.END)
+            self.code_text.tag_add('search', index, f"{index}+{len(query)}c")
+            self.code_text.see(index)
+        self.status_var.set(f"Occurrence ligne {line + 1}")
+
+    def read_selection(self, entry):
+        """
+        Texte d'une entrée de la sélection : un fichier entier, ou seulement les lignes
+        d'une entrée « chemin:début-fin », lues via l'index des positions de lignes.
+        """
+        path, start, end = split_line_range(entry)
+        if start is None:
+            return read_with_fallback(self.content_cache, path)
+        try:
+            return self.line_indexes.read_lines(path, start, end, self.content_cache.fallback_encodings).text
+        except UnicodeDecodeError as e:
+            raise FallbackDecodeError(e) from e
+
+    def get_segment_version(self, path):
+        """
+        Version d'un fichier servant à détecter les segments à régénérer ; elle inclut
+        les encodages de repli, dont dépend le texte décodé.
+        """
+        try:
+            return file_version(split_line_range(path)[0]) + self.content_cache.fallback_encodings
+        except OSError as e:
+            return ('error', e.errno)
+
+    def render_bundle_segment(self, result, first):
+        """
+        Texte d'un fichier dans le code généré (séparateur, chemin, contenu ou erreur)
+        et son nombre de tokens.
+        """
+        file_path, e = result.path, result.error
+        code = "" if first else "\n--------------------------\n\n" # Separator line with spaces
+        code += f"{file_path}\n" # Display path
+        tokens = 0
+        if e is None:
+            code += result.content + "\n\n" # Add content with extra space after
+            tokens = self.token_counter.count_file(file_path, result.content)
+        elif isinstance(e, FileNotFoundError):
+            logging.warning(f"Fichier non trouvé lors de la génération du code: {file_path}")
+            code += f"--- Fichier non trouvé: {file_path} ---\n\n"
+        elif isinstance(e, FallbackDecodeError):
+            encodings = ", ".join(self.content_cache.fallback_encodings) or "aucun"
+            logging.error(f"Erreur de décodage (encodages de repli : {encodings}) pour {file_path}: {e}")
+            code += f"--- Erreur de décodage (encodages de repli : {encodings}): {e} ---\n\n"
+        elif isinstance(e, IOError):
+            logging.error(f"Erreur d'E/S lors de la lecture de {file_path}: {e}")
+            code += f"--- Erreur d'E/S: {e} ---\n\n"
+        else:
+            logging.error(f"Erreur générale lors de la lecture de {file_path}: {e}")
+            code += f"--- Erreur générale: {e} ---\n\n"
+        return code, tokens
+
+    def get_token_budget(self):
+        """
+        Retourne le budget de tokens actif, ou None si la limitation est désactivée.
+        """
+        try:
+            budget = int(self.token_budget_var.get())
+        except (tk.TclError, ValueError):
+            return None
+        if self.pack_to_budget_var.get() and budget > 0:
+            return budget
+        return None
+
+    def get_bundle_paths(self):
+        """
+        Retourne les fichiers à inclure dans le code généré et ceux écartés par le budget.
+        Les fichiers binaires sont écartés avant toute lecture ; les sélections manuelles
+        sont prioritaires sur celles par extension.
+        """
+        paths = self.file_sniffer.text_paths(self.selected_files, lambda p: split_line_range(p)[0])
+        if len(paths) < len(self.selected_files):
+            logging.info(f"{len(self.selected_files) - len(paths)} fichier(s) binaire(s) écarté(s) du code généré")
+        budget = self.get_token_budget()
+        if budget is None:
+            return paths, []
+        prioritized = ([p for p in paths if p in self.manual_selected_files]
+                       + [p for p in paths if p not in self.manual_selected_files])
+        kept, _, skipped = pack(prioritized, budget, self.token_counter,
+                                overhead_fn=lambda p: self.token_counter.count_text(f"{p}\n"))
+        kept = set(kept)
+        return [p for p in paths if p in kept], skipped
+
+    def update_token_count(self, total_tokens, skipped):
+        """
+        Affiche le nombre de tokens du code généré.
+        """
+        text = f"{total_tokens} tokens ({self.token_counter.tokenizer.name})"
+        budget = self.get_token_budget()
+        if budget is not None:
+            text = f"{total_tokens} / {budget} tokens ({self.token_counter.tokenizer.name})"
+            if skipped:
+                text += f" - {len(skipped)} fichier(s) écarté(s)"
+        self.token_count_var.set(text)
+
     def on_search(self):
         """
         Recherche simple par nom via un thread séparé.
@@ -1229,13 +1770,7 @@ class ProjectExplorerApp:
         try:
             self.queue.put(('status', "Recherche en cours..."))
             path = self.path_var.get()
-            matches = []
-            for root_dir, dirs, files in os.walk(path):
-                dirs[:] = [d for d in dirs if d not in self.excluded_dirs]
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    if query.lower() in file.lower():
-                        matches.append(file_path)
+            matches = self.get_name_index(path).search(query)
             self.queue.put(('search_results', matches))
             logging.info(f"Recherche terminée. {len(matches)} éléments trouvés.")
             self.queue.put(('status', "Terminé"))
@@ -1244,58 +1779,118 @@ class ProjectExplorerApp:
             self.queue.put(('error_message', f"Erreur lors de la recherche: {e}"))
             self.queue.put(('status', "Erreur lors de la recherche"))
 
+    def on_content_search(self):
+        """
+        Recherche dans le contenu des fichiers texte via un thread séparé.
+        """
+        query = self.content_search_var.get()
+        if not query.strip():
+            messagebox.showwarning("Attention", "Veuillez entrer un terme de recherche.")
+            return
+        regex = self.content_search_regex.get()
+        if regex:
+            try:
+                re.compile(query)
+            except re.error as e:
+                messagebox.showerror("Erreur de format", f"Expression régulière invalide : {e}")
+                return
+        skip_hidden = not self.show_hidden.get()
+        threading.Thread(target=self.search_thread_content, args=(query, regex, skip_hidden), daemon=True).start()
+
+    def get_content_index(self, path):
+        """
+        Retourne l'index du contenu du projet, mis à jour à partir de l'index de
+        métadonnées : seuls les fichiers dont la taille ou la date ont changé sont relus.
+        """
+        content_index = open_content_index(path, self.INDEX_DIR)
+        content_index.refresh(self.get_project_index(path))
+        return content_index
+
+    def search_thread_content(self, query, regex, skip_hidden):
+        """
+        Thread pour effectuer une recherche dans le contenu des fichiers.
+        """
+        try:
+            self.queue.put(('status', "Indexation du contenu..."))
+            path = self.path_var.get()
+            content_index = self.get_content_index(path)
+            self.queue.put(('status', "Recherche en cours..."))
+            matcher = self.hidden_matcher
+            matches, truncated = content_index.search(
+                query, regex=regex, limit=self.CONTENT_SEARCH_LIMIT,
+                read_fn=lambda file_path: read_with_fallback(self.content_cache, file_path),
+                path_filter=(lambda file_path: not matcher.is_hidden(file_path)) if skip_hidden else None)
+            self.queue.put(('content_results', query, matches, truncated))
+            logging.info(f"Recherche dans le contenu terminée. {len(matches)} fichiers trouvés.")
+            self.queue.put(('status', "Terminé"))
+        except Exception as e:
+            logging.error(f"Erreur lors de la recherche dans le contenu: {e}")
+            self.queue.put(('error_message', f"Erreur lors de la recherche dans le contenu: {e}"))
+            self.queue.put(('status', "Erreur lors de la recherche"))
+
     def on_advanced_search(self):
         """
-        Recherche avancée basée sur plusieurs critères.
+        Recherche avancée basée sur plusieurs critères, compilés une seule fois.
+        Une nouvelle recherche annule la précédente.
         """
-        query_name = self.search_name_var.get().strip().lower()
+        query_name = self.search_name_var.get().strip()
         query_ext = self.search_ext_var.get().strip().lower()
         query_date = self.search_date_var.get().strip()
+        modified_after = None
         if query_date:
             try:
-                datetime.datetime.strptime(query_date, "%Y-%m-%d")
+                modified_after = datetime.datetime.strptime(query_date, "%Y-%m-%d")
             except ValueError:
                 messagebox.showerror("Erreur de format", "La date doit être au format YYYY-MM-DD.")
                 return
+        exts = []
         if query_ext:
-            exts = [e.strip() for e in query_ext.split(',')]
+            exts = [e.strip() for e in query_ext.split(',') if e.strip()]
             for ext in exts:
                 if not ext.startswith('.'):
                     messagebox.showerror("Erreur de format", f"L'extension '{ext}' n'est pas valide. Elle doit commencer par un point.")
                     return
-        threading.Thread(target=self.search_thread_advanced, args=(query_name, query_ext, query_date), daemon=True).start()
+        sizes = []
+        for value in (self.search_min_size_var.get().strip(), self.search_max_size_var.get().strip()):
+            try:
+                sizes.append(int(float(value) * 1024) if value else None)
+            except ValueError:
+                messagebox.showerror("Erreur de format", f"La taille '{value}' n'est pas un nombre de Ko valide.")
+                return
+        path = self.path_var.get()
+        criteria = SearchCriteria(path, name=query_name, exts=exts, modified_after=modified_after,
+                                  min_size=sizes[0], max_size=sizes[1],
+                                  path_glob=self.search_glob_var.get().strip())
+        self.cancel_advanced_search()
+        self.search_cancel = threading.Event()
+        self.search_id += 1
+        self.open_search_results(self.search_id, self.search_cancel)
+        threading.Thread(target=self.search_thread_advanced,
+                         args=(self.search_id, path, criteria, self.search_cancel), daemon=True).start()
+
+    def cancel_advanced_search(self):
+        """
+        Interrompt la recherche avancée en cours, s'il y en a une.
+        """
+        if self.search_cancel is not None:
+            self.search_cancel.set()
+            self.search_cancel = None
 
-    def search_thread_advanced(self, query_name, query_ext, query_date):
+    def search_thread_advanced(self, search_id, path, criteria, cancel):
         """
-        Thread pour effectuer la recherche avancée.
+        Thread pour effectuer la recherche avancée : les résultats sont transmis par
+        lots à la fenêtre de résultats au fur et à mesure qu'ils sont trouvés.
         """
         try:
             self.queue.put(('status', "Recherche en cours..."))
-            path = self.path_var.get()
-            matches = []
-            for root_dir, dirs, files in os.walk(path):
-                dirs[:] = [d for d in dirs if d not in self.excluded_dirs]
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    basename = file.lower()
-                    if query_name and query_name not in basename:
-                        continue
-                    if query_ext:
-                        file_ext = os.path.splitext(file)[1].lower()
-                        ext_list = [e.strip().lower() for e in query_ext.split(',')]
-                        if file_ext not in ext_list:
-                            continue
-                    if query_date:
-                        try:
-                            date_obj = datetime.datetime.strptime(query_date, "%Y-%m-%d")
-                            mod_time = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-                            if mod_time < date_obj:
-                                continue
-                        except ValueError:
-                            continue
-                    matches.append(file_path)
-            self.queue.put(('search_results', matches))
-            logging.info(f"Recherche terminée. {len(matches)} éléments trouvés.")
+            count, cancelled = run_search(self.get_project_index(path).iter_files(path), criteria,
+                                          lambda paths: self.queue.put(('search_batch', search_id, paths)),
+                                          cancel)
+            self.queue.put(('search_done', search_id, count, cancelled))
+            if cancelled:
+                logging.info(f"Recherche annulée après {count} éléments trouvés.")
+                return
+            logging.info(f"Recherche terminée. {count} éléments trouvés.")
             self.queue.put(('status', "Terminé"))
         except Exception as e:
             logging.error(f"Erreur lors de la recherche avancée: {e}")
@@ -1306,10 +1901,61 @@ class ProjectExplorerApp:
         """
         Affiche les résultats de la recherche dans une nouvelle fenêtre.
         """
+        _, summary_label, results_listbox = self.create_results_window(matches)
+        summary_label.config(text=f"Résultats de la recherche ({len(matches)} éléments trouvés):")
+        for path in matches:
+            results_listbox.insert(tk.END, path)
+
+    def open_search_results(self, search_id, cancel):
+        """
+        Ouvre la fenêtre de résultats d'une recherche avancée, remplie ensuite par lots.
+        Fermer la fenêtre annule la recherche.
+        """
+        matches = []
+        results_window, summary_label, results_listbox = self.create_results_window(matches)
+        summary_label.config(text="Recherche en cours...")
+
+        def on_close():
+            cancel.set()
+            if self.search_results_view and self.search_results_view[0] == search_id:
+                self.search_results_view = None
+            results_window.destroy()
+
+        results_window.protocol("WM_DELETE_WINDOW", on_close)
+        self.search_results_view = (search_id, summary_label, results_listbox, matches)
+
+    def add_search_batch(self, search_id, paths):
+        """
+        Ajoute un lot de résultats à la fenêtre de la recherche avancée en cours.
+        """
+        view = self.search_results_view
+        if view is None or view[0] != search_id:
+            return
+        _, summary_label, results_listbox, matches = view
+        matches.extend(paths)
+        results_listbox.insert(tk.END, *paths)
+        summary_label.config(text=f"Recherche en cours... ({len(matches)} éléments trouvés)")
+
+    def finish_search(self, search_id, count, cancelled):
+        """
+        Affiche le bilan d'une recherche avancée terminée ou annulée.
+        """
+        view = self.search_results_view
+        if view is None or view[0] != search_id:
+            return
+        state = "interrompue" if cancelled else "terminée"
+        view[1].config(text=f"Résultats de la recherche ({count} éléments trouvés, recherche {state}):")
+
+    def create_results_window(self, matches):
+        """
+        Crée une fenêtre de résultats et retourne (fenêtre, libellé, liste).
+        `matches` est la liste des chemins affichés, utilisée par la sélection.
+        """
         results_window = tk.Toplevel(self.root)
         results_window.title("Résultats de la Recherche")
         results_window.geometry("800x600")
-        ttk.Label(results_window, text=f"Résultats de la recherche ({len(matches)} éléments trouvés):").pack(pady=5)
+        summary_label = ttk.Label(results_window)
+        summary_label.pack(pady=5)
         results_frame = ttk.Frame(results_window)
         results_frame.pack(fill='both', expand=True, padx=10, pady=10)
         results_scroll = ttk.Scrollbar(results_frame)
@@ -1317,8 +1963,6 @@ class ProjectExplorerApp:
         results_listbox = tk.Listbox(results_frame, yscrollcommand=results_scroll.set)
         results_listbox.pack(side='left', fill='both', expand=True)
         results_scroll.config(command=results_listbox.yview)
-        for path in matches:
-            results_listbox.insert(tk.END, path)
         action_frame = ttk.Frame(results_window)
         action_frame.pack(pady=5)
         open_button = ttk.Button(action_frame, text="Ouvrir l'élément sélectionné",
@@ -1327,6 +1971,67 @@ class ProjectExplorerApp:
         show_in_tree_button = ttk.Button(action_frame, text="Afficher dans l'arborescence",
                                          command=lambda: self.show_in_tree(results_listbox))
         show_in_tree_button.pack(side='left', padx=5)
+        ttk.Button(action_frame, text="Sélectionner ces fichiers",
+                   command=lambda: self.select_search_results(matches)).pack(side='left', padx=5)
+        return results_window, summary_label, results_listbox
+
+    def show_content_results(self, query, matches, truncated):
+        """
+        Affiche les résultats d'une recherche dans le contenu : les fichiers trouvés
+        et, pour le fichier sélectionné, les lignes correspondantes.
+        """
+        results_window = tk.Toplevel(self.root)
+        results_window.title(f"Recherche dans le contenu : {query}")
+        results_window.geometry("1000x600")
+        summary = f"{len(matches)} fichier(s) contenant '{query}'"
+        if truncated:
+            summary += f" (limité aux {len(matches)} premiers)"
+        ttk.Label(results_window, text=summary).pack(pady=5)
+        results_paned = ttk.PanedWindow(results_window, orient='horizontal')
+        results_paned.pack(fill='both', expand=True, padx=10, pady=10)
+        list_frame = ttk.Frame(results_paned)
+        results_paned.add(list_frame, weight=1)
+        results_scroll = ttk.Scrollbar(list_frame)
+        results_scroll.pack(side='right', fill='y')
+        results_listbox = tk.Listbox(list_frame, yscrollcommand=results_scroll.set, exportselection=False)
+        results_listbox.pack(side='left', fill='both', expand=True)
+        results_scroll.config(command=results_listbox.yview)
+        hits_text = ScrolledText(results_paned, wrap='none', font=(self.code_font, self.font_size))
+        results_paned.add(hits_text, weight=2)
+        hits_by_path = {match.path: match.hits for match in matches}
+        for match in matches:
+            results_listbox.insert(tk.END, match.path)
+
+        def show_hits(event=None):
+            selection = results_listbox.curselection()
+            hits_text.configure(state='normal')
+            hits_text.delete('1.0', tk.END)
+            if selection:
+                for line_no, line in hits_by_path[results_listbox.get(selection[0])]:
+                    hits_text.insert(tk.END, f"{line_no:>6}: {line}\n")
+            hits_text.configure(state='disabled')
+
+        results_listbox.bind('<<ListboxSelect>>', show_hits)
+        action_frame = ttk.Frame(results_window)
+        action_frame.pack(pady=5)
+        ttk.Button(action_frame, text="Ouvrir l'élément sélectionné",
+                   command=lambda: self.open_selected_result(results_listbox)).pack(side='left', padx=5)
+        ttk.Button(action_frame, text="Afficher dans l'arborescence",
+                   command=lambda: self.show_in_tree(results_listbox)).pack(side='left', padx=5)
+        ttk.Button(action_frame, text="Sélectionner ces fichiers",
+                   command=lambda: self.select_search_results([match.path for match in matches])).pack(side='left', padx=5)
+
+    def select_search_results(self, paths):
+        """
+        Ajoute les fichiers trouvés par une recherche à la sélection manuelle.
+        """
+        added = 0
+        for path in paths:
+            if os.path.isfile(path) and path not in self.manual_selected_files:
+                self.manual_selected_files[path] = True
+                added += 1
+        self.update_selected_files()
+        self.status_var.set(f"{added} fichier(s) ajouté(s) à la sélection")
 
     def open_selected_result(self, listbox):
         """
@@ -1369,80 +2074,155 @@ class ProjectExplorerApp:
 
     def process_queue(self):
         """
-        Traite les éléments de la queue pour mettre à jour l'interface de manière thread-safe.
+        Traite les messages de la queue pour mettre à jour l'interface de manière thread-safe.
+        Appelée toutes les QUEUE_POLL_MS sur le thread Tk, elle ne fait que tester le drapeau
+        de la queue tant qu'aucun message n'arrive. Chaque passage est limité à
+        QUEUE_TICK_BUDGET : le reste est repris au passage suivant, après les événements
+        clavier et souris. Les mises à jour de statut et de progression sont fusionnées et
+        appliquées une seule fois par passage.
         """
+        if self.processing_queue:
+            return
+        if self.queue_after_id:
+            self.root.after_cancel(self.queue_after_id)
+            self.queue_after_id = None
+        if not self.queue.take_work() and not self.pending_inserts and self.queue.empty():
+            self.queue_after_id = self.root.after(self.QUEUE_POLL_MS, self.process_queue)
+            return
+        self.processing_queue = True
+        deadline = time.perf_counter() + self.QUEUE_TICK_BUDGET
+        status = None
+        progress = None  # [maximum, value] tant que le chargement initial est suivi
+        more = True
         try:
-            while True:
-                task = self.queue.get_nowait()
-                if task[0] == 'insert':
-                    _, parent, item, abs_path, is_dir = task
-                    if is_dir:
-                        node = self.tree.insert(parent, 'end', text=item, open=False, values=[abs_path],
-                                                image=self.folder_icon if self.folder_icon else '')
-                        self.tree.insert(node, 'end')
+            while time.perf_counter() < deadline:
+                if self.pending_inserts:
+                    self.apply_pending_inserts(deadline)
+                    continue
+                try:
+                    task = self.queue.get_nowait()
+                except queue.Empty:
+                    more = False
+                    break
+                kind = task[0]
+                if kind == 'status':
+                    status = task[1]
+                elif kind in ('progress_max', 'progress_value', 'progress_increment'):
+                    if not self.is_initial_loading:
+                        continue
+                    if progress is None:
+                        progress = [self.progress['maximum'], self.progress['value']]
+                    if kind == 'progress_max':
+                        progress[0] = task[1]
+                    elif kind == 'progress_value':
+                        progress[1] = task[1]
                     else:
-                        node = self.tree.insert(parent, 'end', text=item, values=[abs_path],
-                                                image=self.file_icon if self.file_icon else '')
-                    self.path_to_item[abs_path] = node
-                elif task[0] == 'progress_max':
-                    _, max_value = task
-                    if self.is_initial_loading:
-                        self.progress['maximum'] = max_value
-                elif task[0] == 'progress_value':
-                    _, value = task
-                    if self.is_initial_loading:
-                        self.progress['value'] = value
-                elif task[0] == 'progress_increment':
-                    if self.is_initial_loading:
-                        self.progress['value'] += 1
-                elif task[0] == 'status':
-                    _, status = task
-                    self.status_var.set(status)
-                elif task[0] == 'clear_extensions':
-                    for widget in self.ext_frame.winfo_children():
-                        widget.destroy()
-                    self.ext_vars.clear()
-                elif task[0] == 'add_extension':
-                    _, ext = task
-                    var = tk.BooleanVar()
-                    # Ajout d'une fonction lambda pour le callback immédiat
-                    var.trace_add("write", lambda *args: self.on_extension_change())
-                    cb = ttk.Checkbutton(self.ext_frame, text=ext, variable=var)
-                    cb.pack(anchor='w', pady=2)
-                    self.ext_vars[ext] = var
-                elif task[0] == 'delete':
-                    _, item_id = task
-                    path = self.tree.item(item_id, 'values')[0]
-                    if path in self.path_to_item:
-                        del self.path_to_item[path]
-                    self.tree.delete(item_id)
-                elif task[0] == 'insert_code':
-                    _, code = task
-                    self.code_text.insert(tk.END, code)
-                elif task[0] == 'show_message':
-                    _, title, message = task
-                    messagebox.showinfo(title, message)
-                elif task[0] == 'error_message':
-                    _, message = task
-                    messagebox.showerror("Erreur", message)
-                elif task[0] == 'search_results':
-                    _, matches = task
-                    self.show_search_results(matches)
-        except queue.Empty:
-            pass
+                        progress[1] += 1
+                else:
+                    self.dispatch_task(task)
         finally:
-            self.root.after(100, self.process_queue)
+            self.processing_queue = False
+            if status is not None:
+                self.status_var.set(status)
+            if progress is not None:
+                self.progress['maximum'], self.progress['value'] = progress
+            # Travail restant : reprendre dès que Tk a traité ses événements ; sinon revérifier le drapeau
+            self.queue_after_id = self.root.after(1 if more else self.QUEUE_POLL_MS, self.process_queue)
 
         if self.is_initial_loading and self.progress['value'] >= self.progress['maximum']:
             self.status_var.set("Chargement terminé")
             self.is_initial_loading = False
 
+    def dispatch_task(self, task):
+        """
+        Applique un message de la queue (hors statut et progression).
+        """
+        if task[0] == 'tree_rows':
+            _, token, parent, path, rows = task
+            # Résultat d'un chargement remplacé ou abandonné entre-temps : ignoré
+            if self.loading_dirs.get(path) == token:
+                del self.loading_dirs[path]
+                if rows:
+                    self.pending_inserts.append((parent, deque(rows)))
+        elif task[0] == 'clear_extensions':
+            for widget in self.ext_frame.winfo_children():
+                widget.destroy()
+            self.ext_vars.clear()
+        elif task[0] == 'add_extension':
+            _, ext = task
+            var = tk.BooleanVar()
+            # Ajout d'une fonction lambda pour le callback immédiat
+            var.trace_add("write", lambda *args: self.on_extension_change())
+            cb = ttk.Checkbutton(self.ext_frame, text=ext, variable=var)
+            cb.pack(anchor='w', pady=2)
+            self.ext_vars[ext] = var
+        elif task[0] == 'delete':
+            _, item_id = task
+            path = self.tree.item(item_id, 'values')[0]
+            if path in self.path_to_item:
+                del self.path_to_item[path]
+            self.tree.delete(item_id)
+        elif task[0] == 'insert_code':
+            _, code = task
+            self.code_text.insert(tk.END, code)
+        elif task[0] == 'show_message':
+            _, title, message = task
+            messagebox.showinfo(title, message)
+        elif task[0] == 'error_message':
+            _, message = task
+            messagebox.showerror("Erreur", message)
+        elif task[0] == 'search_results':
+            _, matches = task
+            self.show_search_results(matches)
+        elif task[0] == 'search_batch':
+            _, search_id, paths = task
+            self.add_search_batch(search_id, paths)
+        elif task[0] == 'search_done':
+            _, search_id, count, cancelled = task
+            self.finish_search(search_id, count, cancelled)
+        elif task[0] == 'content_results':
+            _, query, matches, truncated = task
+            self.show_content_results(query, matches, truncated)
+        elif task[0] == 'index_rebuilt':
+            _, path, built = task
+            self.index_waits.discard(path)
+            # Après un échec, pas de nouvelle attente qui échouerait de même
+            if built and path == self.path_var.get():
+                self.update_selected_files()
+        elif task[0] == 'fs_changed':
+            _, changes, extensions = task
+            self.on_fs_changed(changes, extensions)
+
+    def apply_pending_inserts(self, deadline):
+        """
+        Insère dans l'arborescence les lignes en attente (nom, chemin, dossier, tags)
+        jusqu'à l'échéance donnée ; le reste est inséré au passage suivant.
+        """
+        while self.pending_inserts and time.perf_counter() < deadline:
+            parent, rows = self.pending_inserts[0]
+            try:
+                while rows and time.perf_counter() < deadline:
+                    name, abs_path, is_dir, tags = rows.popleft()
+                    if is_dir:
+                        node = self.tree.insert(parent, 'end', text=name, open=False, values=[abs_path],
+                                                image=self.folder_icon if self.folder_icon else '', tags=tags)
+                        self.tree.insert(node, 'end')
+                    else:
+                        node = self.tree.insert(parent, 'end', text=name, values=[abs_path],
+                                                image=self.file_icon if self.file_icon else '', tags=tags)
+                    self.path_to_item[abs_path] = node
+            except tk.TclError:
+                # Le dossier parent a été supprimé ou rechargé entre-temps
+                rows.clear()
+            if not rows:
+                self.pending_inserts.popleft()
+
     def on_extension_change(self):
         """
         Callback appelé immédiatement quand une checkbox d'extension change d'état
         """
+        # update_selected_files planifie déjà la régénération (une seule par clic)
         self.update_selected_files()
-        self.on_generate_code()  # Force la mise à jour du code généré
 
     def highlight_treeview_item(self, item):
         """
@@ -1486,7 +2266,7 @@ class ProjectExplorerApp:
             parent_item = self.path_to_item.get(parent)
             if parent_item:
                 self.tree.item(parent_item, open=True)
-                self.on_treeview_open(None)
+                self.expand_tree_node(parent_item)
 
     def on_drop(self, event):
         """
@@ -1507,6 +2287,7 @@ class ProjectExplorerApp:
         """
         Gère la fermeture de l'application en sauvegardant les préférences.
         """
+        self.stop_fs_watcher()
         self.save_preferences()
         self.save_favorites()
         self.save_hidden_items()
@@ -1657,6 +2438,25 @@ class SettingsWindow(tk.Toplevel):
         for ext in sorted(self.app.known_text_extensions):
             self.extensions_list.insert(tk.END, ext)
         
+        # Encodages essayés, dans l'ordre, pour les fichiers qui ne sont pas en UTF-8
+        ttk.Label(extensions_frame, text="Encodages de repli (séparés par des virgules, ex: cp1252, latin-1):").pack(anchor='w', padx=5, pady=5)
+        self.fallback_encodings_var = tk.StringVar(value=", ".join(self.app.fallback_encodings))
+        ttk.Entry(extensions_frame, textvariable=self.fallback_encodings_var).pack(fill='x', padx=5, pady=5)
+        
+        # Onglet Exclusions
+        exclusions_frame = ttk.Frame(notebook)
+        notebook.add(exclusions_frame, text="Exclusions")
+        
+        ttk.Label(exclusions_frame, text="Motifs exclus (un par ligne, syntaxe .gitignore, ex: *.min.js ou /dist/):").pack(anchor='w', padx=5, pady=5)
+        self.patterns_text = ScrolledText(exclusions_frame, height=12, wrap='none')
+        self.patterns_text.pack(fill='both', expand=True, padx=5, pady=5)
+        self.patterns_text.insert('1.0', '\n'.join(self.app.exclude_patterns))
+        self.use_gitignore_var = tk.BooleanVar(value=self.app.use_gitignore)
+        ttk.Checkbutton(exclusions_frame, text="Appliquer les fichiers .gitignore",
+                        variable=self.use_gitignore_var).pack(anchor='w', padx=5, pady=5)
+        ttk.Label(exclusions_frame, text="Toujours exclus : " + ", ".join(self.app.excluded_dirs),
+                  wraplength=550).pack(anchor='w', padx=5, pady=5)
+        
         # Boutons de validation
         buttons_frame = ttk.Frame(self)
         buttons_frame.pack(fill='x', padx=10, pady=10)
@@ -1695,6 +2495,19 @@ class SettingsWindow(tk.Toplevel):
             self.app.code_font = self.font_var.get()
             self.app.font_size = self.font_size_var.get()
             self.app.code_text.configure(font=(self.app.code_font, self.app.font_size))
+            self.app.code_view.text.configure(font=(self.app.code_font, self.app.font_size))
+            
+            # Appliquer les encodages de repli (les décodages mémorisés sont refaits)
+            encodings = [name.strip() for name in self.fallback_encodings_var.get().split(',') if name.strip()]
+            self.app.content_cache.set_fallback_encodings(encodings)
+            if list(self.app.content_cache.fallback_encodings) != self.app.fallback_encodings:
+                # Les segments dépendent des encodages (voir get_segment_version) : tous sont refaits
+                self.app.fallback_encodings = list(self.app.content_cache.fallback_encodings)
+                self.app.schedule_generate_code()
+            
+            # Appliquer les règles d'exclusion (reconstruit l'index si elles ont changé)
+            patterns = [line.strip() for line in self.patterns_text.get('1.0', 'end').splitlines() if line.strip()]
+            self.app.apply_exclusions(patterns, self.use_gitignore_var.get())
             
             # Sauvegarder les préférences
             self.app.save_preferences()
@@ -0,0 +1,129 @@
+"""JSON config files cached in memory, with debounced atomic write-behind."""
+import atexit
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    """
+    One JSON document kept in memory.
+
+    The file is read once and re-read only when its mtime changes (checked at
+    most every `check_interval` seconds, never while local changes are
+    pending). Changes are written back `write_delay` seconds after the last
+    one, through a temporary file renamed over the target, and flushed at
+    exit. `generation` increases whenever the value changes.
+    """
+
+    def __init__(self, path, default, write_delay=0.5, check_interval=1.0):
+        self.path = path
+        self.default = default
+        self.write_delay = write_delay
+        self.check_interval = check_interval
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._value = None
+        self._mtime_ns = None
+        self._checked = 0.0
+        self._dirty = False
+        self._timer = None
+        atexit.register(self.flush)
+
+    def _load(self):
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if self._value is not None and mtime_ns == self._mtime_ns:
+            return
+        value = copy.deepcopy(self.default)
+        if mtime_ns is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read JSON file {self.path}: {e}")
+        self._value = value
+        self._mtime_ns = mtime_ns
+        self.generation += 1
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._value is None or (not self._dirty and now - self._checked >= self.check_interval):
+            self._checked = now
+            self._load()
+
+    def get(self):
+        """Current value. It is shared with other callers: treat it as read-only."""
+        with self._lock:
+            self._refresh()
+            return self._value
+
+    def snapshot(self):
+        """(generation, value) read together."""
+        with self._lock:
+            self._refresh()
+            return self.generation, self._value
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+            self.generation += 1
+            self._dirty = True
+            self._schedule_write()
+
+    def update(self, fn):
+        """
+        Apply `fn` to a copy of the value and store the result (the mutated
+        copy if `fn` returns None). Returns the stored value.
+        """
+        with self._lock:
+            self._refresh()
+            value = copy.deepcopy(self._value)
+            result = fn(value)
+            self.set(value if result is None else result)
+            return self._value
+
+    def _schedule_write(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.write_delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Write pending changes now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.path) or '.'
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(self.path)}.", suffix='.tmp',
+                                                dir=directory)
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump(self._value, f, ensure_ascii=False, indent=2)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+                self._mtime_ns = os.stat(self.path).st_mtime_ns
+                self._dirty = False
+            except OSError as e:
+                logger.error(f"Could not write JSON file {self.path}: {e}")
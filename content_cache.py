@@ -0,0 +1,175 @@
+"""Shared cache of decoded file contents, keyed by path and on-disk version."""
+import codecs
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Default byte budget for cached file contents (256 MB)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Codecs tried in order when a file has no byte order mark and is not UTF-8
+DEFAULT_FALLBACK_ENCODINGS = ('latin-1',)
+
+# UTF-32 marks first: the UTF-16 LE mark is a prefix of the UTF-32 LE one
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def file_version(path, st=None):
+    """Return the (inode, size, mtime_ns) stamp used to detect changed files."""
+    if st is None:
+        st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def valid_encodings(names):
+    """The codec names of `names` Python knows, in order; unknown ones are logged and dropped."""
+    valid = []
+    for name in names:
+        try:
+            codecs.lookup(name)
+        except LookupError:
+            logger.warning(f"Unknown fallback encoding ignored: {name}")
+            continue
+        valid.append(name)
+    return tuple(valid)
+
+
+def translate_newlines(text):
+    # Same result as reading in text mode (universal newlines)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def decode_bytes(data, fallback_encodings=DEFAULT_FALLBACK_ENCODINGS):
+    """
+    Decode file content already in memory; return (text, encoding).
+
+    A byte order mark selects its UTF-8/16/32 codec; otherwise UTF-8 is
+    tried, then each of `fallback_encodings`. Newlines are translated as in
+    text mode. Raises the first UnicodeDecodeError if no codec fits.
+    """
+    for bom, encoding in _BOM_ENCODINGS:
+        if data.startswith(bom):
+            candidates = (encoding,) + tuple(fallback_encodings)
+            break
+    else:
+        candidates = ('utf-8',) + tuple(fallback_encodings)
+    error = None
+    for encoding in candidates:
+        try:
+            return translate_newlines(data.decode(encoding)), encoding
+        except UnicodeDecodeError as e:
+            error = error or e
+    raise error
+
+
+class ContentCache:
+    """
+    LRU cache of decoded file text bounded by a byte budget.
+
+    An entry is only reused while the file's (inode, size, mtime_ns) stamp
+    is unchanged, so edited files are transparently re-read. Files are read
+    once as bytes and decoded with decode_bytes(), trying
+    `fallback_encodings` in memory when UTF-8 fails; the encoding that
+    worked is kept with the text.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, fallback_encodings=DEFAULT_FALLBACK_ENCODINGS):
+        self.max_bytes = max_bytes
+        self.fallback_encodings = valid_encodings(fallback_encodings)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (path, encoding or None) -> (version, text, cost, detected encoding)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def read(self, path, encoding=None):
+        """
+        Return the decoded content of `path`, reading it from disk only when
+        it changed since the last call. `encoding` forces one codec instead
+        of the detection. Raises the same errors as open()/read(), and
+        UnicodeDecodeError when no codec fits.
+        """
+        return self.read_decoded(path, encoding)[0]
+
+    def read_decoded(self, path, encoding=None):
+        """Same as read(), returning (text, encoding used)."""
+        st = os.stat(path)
+        version = file_version(path, st)
+        key = (path, encoding)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[3]
+            self.misses += 1
+        with open(path, 'rb') as f:
+            data = f.read()
+        if encoding is None:
+            text, detected = decode_bytes(data, self.fallback_encodings)
+        else:
+            text, detected = translate_newlines(data.decode(encoding)), encoding
+        self._store(key, version, text, st.st_size, detected)
+        return text, detected
+
+    def encoding_of(self, path):
+        """Encoding detected for the cached content of `path`, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get((path, None))
+        return entry[3] if entry is not None else None
+
+    def set_fallback_encodings(self, encodings):
+        """Change the fallback codecs; detected decodings are dropped."""
+        encodings = valid_encodings(encodings)
+        with self._lock:
+            if encodings == self.fallback_encodings:
+                return
+            self.fallback_encodings = encodings
+            for key in [k for k in self._entries if k[1] is None]:
+                self._size -= self._entries.pop(key)[2]
+
+    def _store(self, key, version, text, cost, encoding):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+            if cost > self.max_bytes:
+                return
+            self._entries[key] = (version, text, cost, encoding)
+            self._size += cost
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted[2]
+
+    def invalidate(self, path):
+        """Drop every cached decoding of `path`."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._size -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return hit/miss counters and current memory usage."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
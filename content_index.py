@@ -0,0 +1,420 @@
+"""Persistent trigram index over the contents of a project's text files."""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import defaultdict, namedtuple
+
+from content_cache import decode_bytes, file_version
+from file_sniffer import SNIFF_BYTES, looks_binary
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+# Files larger than this are not indexed (nor searched)
+MAX_INDEXED_BYTES = 2 * 1024 * 1024
+# Files indexed per commit while refreshing
+REFRESH_BATCH_FILES = 200
+# Most trigrams used to select candidates for one query (any subset is still a valid filter)
+MAX_QUERY_TRIGRAMS = 200
+# Posting lists are compacted once removed files reach this count and outnumber live ones
+COMPACT_MIN_DEAD = 500
+# Seconds after which a refresh stats the files again even if the metadata index did not change:
+# in-place edits do not always reach it (polling watchers, edits while the app was closed)
+RECHECK_INTERVAL = 5.0
+# Bumped when the indexed form of the content changes; older indexes are rebuilt
+INDEX_FORMAT = 2
+
+# One file matching a query: `hits` holds (1-based line number, line text) pairs
+ContentMatch = namedtuple('ContentMatch', ['path', 'hits'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed INTEGER NOT NULL
+);
+-- File ids holding each trigram, as native 32-bit integers. Ids of removed
+-- files stay until the next compaction; AUTOINCREMENT keeps them unused.
+CREATE TABLE IF NOT EXISTS postings (trigram INTEGER PRIMARY KEY, ids BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+_APPEND = """
+INSERT INTO postings (trigram, ids) VALUES (?, ?)
+ON CONFLICT(trigram) DO UPDATE SET ids = CAST(ids || excluded.ids AS BLOB)
+"""
+
+_LOW_24 = (0xFFFFFF).__and__
+
+
+def _trigrams(data):
+    """
+    Distinct trigrams of `data` (bytes) as integers (first byte lowest).
+    Every window is read as the low three bytes of a 32-bit word, four
+    interleaved word arrays covering all offsets.
+    """
+    count = len(data) - 2
+    grams = set()
+    if count <= 0:
+        return grams
+    padded = data + b'\0\0\0'
+    for offset in range(4):
+        words = (count - offset + 3) // 4  # Windows starting at offset, offset + 4, ... below count
+        if words <= 0:
+            continue
+        packed = array('I')
+        packed.frombytes(padded[offset:offset + words * 4])
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        grams.update(map(_LOW_24, packed))
+    return grams
+
+
+def _query_trigrams(literals, ignore_case):
+    # Trigrams every match must contain, with ASCII lowered like the index.
+    # Case-insensitive queries also drop windows with non-ASCII bytes, whose
+    # case variants are encoded differently.
+    grams = set()
+    for literal in literals:
+        data = literal.encode('utf-8', 'surrogatepass').lower()
+        for i in range(len(data) - 2):
+            window = data[i:i + 3]
+            if ignore_case and max(window) >= 0x80:
+                continue
+            grams.add(int.from_bytes(window, 'little'))
+    return sorted(grams)[:MAX_QUERY_TRIGRAMS]
+
+
+def _required_literals(pattern, flags):
+    """
+    Literal runs that appear in every match of regex `pattern`: consecutive
+    literal characters at the top level of the pattern. Anything else
+    (classes, repeats, groups, alternations) ends a run.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return []
+    runs = []
+    current = []
+    for op, value in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            runs.append(''.join(current))
+            current = []
+    if current:
+        runs.append(''.join(current))
+    return runs
+
+
+def _content_trigrams(path, size):
+    """
+    Trigrams of the decoded text of `path`, in the UTF-8 form queries are
+    encoded in, or None if the file is not indexed (too large, binary or
+    unreadable).
+    """
+    if size > MAX_INDEXED_BYTES:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(MAX_INDEXED_BYTES + 1)
+    except OSError:
+        return None
+    if len(data) > MAX_INDEXED_BYTES or looks_binary(data[:SNIFF_BYTES], complete=len(data) <= SNIFF_BYTES):
+        return None
+    try:
+        data = decode_bytes(data)[0].encode('utf-8', 'surrogatepass')
+    except UnicodeDecodeError:
+        return None
+    return _trigrams(data.lower())
+
+
+def read_text(path):
+    """Decode `path` as UTF-8 (or per its BOM), falling back to latin-1."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return decode_bytes(data)[0]
+
+
+class ContentIndex:
+    """
+    Trigram postings of the text files of a project, persisted in the data
+    directory next to the metadata index.
+
+    Content is decoded like the files search() reads (BOM, UTF-8, then
+    latin-1) and indexed as UTF-8 bytes with ASCII letters lowered, so one
+    index serves both case-sensitive and case-insensitive queries, whatever
+    the encoding of the file. refresh() brings
+    it in line with a ProjectIndex: only files whose own (size, mtime_ns)
+    changed are re-read, and files in excluded directories are never seen. Binary
+    files and files above MAX_INDEXED_BYTES are recorded but not indexed.
+    A query reads only the files holding all of its trigrams and checks them
+    with the real pattern.
+    """
+
+    def __init__(self, root, data_dir):
+        self.root = os.path.normpath(os.path.abspath(root))
+        os.makedirs(data_dir, exist_ok=True)
+        digest = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+        self.db_path = os.path.join(data_dir, f'content-{digest}.sqlite3')
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        if row is None or row[0] != INDEX_FORMAT:
+            # Postings of another format would silently miss matches: start over
+            self._conn.executescript("DELETE FROM files; DELETE FROM postings; DELETE FROM meta;")
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('format', ?)", (INDEX_FORMAT,))
+            self._conn.commit()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dead'").fetchone()
+        self._dead = row[0] if row else 0  # Removed files whose ids remain in posting lists
+        self._generation = None  # ProjectIndex generation of the last refresh
+        self._checked_at = 0.0  # time.monotonic() of the last refresh
+        self._refresh_lock = threading.Lock()  # One refresh at a time
+        self._refresh_thread_lock = threading.Lock()
+        self._refresh_thread = None
+
+    # --- Updates ------------------------------------------------------------
+
+    def refresh(self, project_index):
+        """
+        Re-index the files added or changed since the last refresh and forget
+        removed ones. Each file is stat'ed, so edits the metadata index did
+        not record are seen too; skipped when `project_index` did not change
+        and the last refresh is less than RECHECK_INTERVAL seconds old.
+        Files are read outside the lock and committed in batches, so queries
+        made meanwhile see partial results instead of waiting.
+        Returns the number of files (re)read.
+        """
+        with self._refresh_lock:
+            generation = project_index.generation
+            now = time.monotonic()
+            if generation == self._generation and now - self._checked_at < RECHECK_INTERVAL:
+                return 0
+            with self._lock:
+                known = {path: (file_id, size, mtime_ns) for file_id, path, size, mtime_ns
+                         in self._conn.execute('SELECT id, path, size, mtime_ns FROM files')}
+            pending = defaultdict(lambda: array('I'))
+            read = 0
+            for entry in project_index.files(self.root):
+                stamp = known.pop(entry.path, None)
+                try:
+                    _, size, mtime_ns = file_version(entry.path)
+                except OSError:
+                    # Vanished since the metadata index saw it
+                    if stamp is not None:
+                        known[entry.path] = stamp
+                    continue
+                if stamp is not None and stamp[1:] == (size, mtime_ns):
+                    continue
+                grams = _content_trigrams(entry.path, size)
+                with self._lock:
+                    if stamp is not None:
+                        self._remove(stamp[0])
+                    self._add(entry.path, size, mtime_ns, grams, pending)
+                    read += 1
+                    if read % REFRESH_BATCH_FILES == 0:
+                        self._flush(pending)
+            with self._lock:
+                for file_id, _, _ in known.values():
+                    self._remove(file_id)
+                self._flush(pending)
+                self._generation = generation
+                self._checked_at = now
+                if read or known:
+                    logger.info(f"Content index refreshed: {read} file(s) read, {len(known)} removed")
+                self._maybe_compact()
+            return read
+
+    def refresh_in_background(self, project_index, wait=None):
+        """
+        Run refresh() on a daemon thread, after making sure `project_index`
+        is built, unless one is already running. Waits at most `wait`
+        seconds for it; returns True if no refresh is running any more.
+        """
+        with self._refresh_thread_lock:
+            thread = self._refresh_thread
+            if thread is None or not thread.is_alive():
+                def run():
+                    project_index.ensure_built()
+                    self.refresh(project_index)
+                thread = threading.Thread(target=run, name='ContentIndexRefresh', daemon=True)
+                self._refresh_thread = thread
+                thread.start()
+        thread.join(wait)
+        return not thread.is_alive()
+
+    def _add(self, path, size, mtime_ns, grams, pending):
+        # Record a file; `grams` is None for files that are not indexed
+        cursor = self._conn.execute('INSERT INTO files (path, size, mtime_ns, indexed) VALUES (?, ?, ?, ?)',
+                                    (path, size, mtime_ns, int(grams is not None)))
+        if grams is not None:
+            file_id = cursor.lastrowid
+            for gram in grams:
+                pending[gram].append(file_id)
+
+    def _remove(self, file_id):
+        self._conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        self._dead += 1
+
+    def _flush(self, pending):
+        # Append the batch to the posting lists: one statement per trigram, not per (trigram, file)
+        conn = self._conn
+        conn.executemany(_APPEND, ((gram, ids.tobytes()) for gram, ids in pending.items()))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dead', ?)", (self._dead,))
+        conn.commit()
+        pending.clear()
+
+    def _maybe_compact(self):
+        conn = self._conn
+        live_count = conn.execute('SELECT COUNT(*) FROM files WHERE indexed = 1').fetchone()[0]
+        if self._dead < COMPACT_MIN_DEAD or self._dead < live_count:
+            return
+        live = {row[0] for row in conn.execute('SELECT id FROM files WHERE indexed = 1')}
+        rows = conn.execute('SELECT trigram, ids FROM postings').fetchall()
+        updates = []
+        for gram, blob in rows:
+            ids = array('I')
+            ids.frombytes(blob)
+            kept = array('I', [file_id for file_id in ids if file_id in live])
+            if len(kept) != len(ids):
+                updates.append((gram, kept.tobytes()))
+        conn.executemany('UPDATE postings SET ids = ?2 WHERE trigram = ?1', updates)
+        conn.execute("DELETE FROM postings WHERE ids = x''")
+        self._dead = 0
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dead', 0)")
+        conn.commit()
+        logger.info(f"Content index compacted: {len(updates)} posting list(s) rewritten")
+
+    # --- Queries ------------------------------------------------------------
+
+    def _candidates(self, grams, under):
+        low = under + os.sep if under != self.root else ''
+        with self._lock:
+            conn = self._conn
+            if not grams:
+                rows = conn.execute('SELECT path FROM files WHERE indexed = 1').fetchall()
+            else:
+                blobs = [row[0] for row in conn.execute(
+                    f"SELECT ids FROM postings WHERE trigram IN ({', '.join('?' * len(grams))})", grams)]
+                if len(blobs) < len(grams):
+                    return []
+                # Intersect from the shortest list; removed ids drop out when joined with files
+                blobs.sort(key=len)
+                ids = array('I')
+                ids.frombytes(blobs[0])
+                file_ids = set(ids)
+                for blob in blobs[1:]:
+                    if not file_ids:
+                        return []
+                    ids = array('I')
+                    ids.frombytes(blob)
+                    file_ids.intersection_update(ids)
+                file_ids = sorted(file_ids)
+                rows = []
+                for i in range(0, len(file_ids), 500):
+                    chunk = file_ids[i:i + 500]
+                    rows.extend(conn.execute(
+                        f"SELECT path FROM files WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+        return sorted(row[0] for row in rows if not low or row[0].startswith(low))
+
+    def search(self, query, regex=False, ignore_case=True, under=None, limit=None, max_hits=20, read_fn=read_text,
+               path_filter=None):
+        """
+        Files beneath `under` (default: the root) whose content matches
+        `query`, a literal string or, with `regex`, a Python regular
+        expression (^ and $ match at line boundaries). Returns
+        (matches, truncated): up to `limit` ContentMatch in path order, each
+        with at most `max_hits` matching lines; `path_filter` may reject
+        files before they are read. Raises re.error for an invalid pattern.
+        Call refresh() first to see recent changes.
+        """
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        if regex:
+            pattern = re.compile(query, flags)
+            literals = _required_literals(query, flags)
+        else:
+            pattern = re.compile(re.escape(query), flags)
+            literals = [query]
+        grams = _query_trigrams(literals, bool(pattern.flags & re.IGNORECASE))
+        under = os.path.normpath(os.path.abspath(under or self.root))
+        matches = []
+        for path in self._candidates(grams, under):
+            if path_filter is not None and not path_filter(path):
+                continue
+            try:
+                text = read_fn(path)
+            except Exception as e:
+                logger.debug(f"Skipping unreadable file {path}: {e}")
+                continue
+            hits = _line_hits(pattern, text, max_hits)
+            if hits:
+                if limit is not None and len(matches) >= limit:
+                    return matches, True
+                matches.append(ContentMatch(path, hits))
+        return matches, False
+
+    def stats(self):
+        """Indexed and skipped file counts."""
+        with self._lock:
+            rows = dict(self._conn.execute('SELECT indexed, COUNT(*) FROM files GROUP BY indexed').fetchall())
+        return {'indexed': rows.get(1, 0), 'skipped': rows.get(0, 0)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _line_hits(pattern, text, max_hits):
+    # (line number, line) of the first `max_hits` lines holding a match
+    hits = []
+    line_no = 1
+    line_start = 0
+    pos = 0
+    while len(hits) < max_hits:
+        match = pattern.search(text, pos)
+        if match is None:
+            break
+        start = match.start()
+        line_no += text.count('\n', line_start, start)
+        line_start = text.rfind('\n', 0, start) + 1
+        line_end = text.find('\n', start)
+        if line_end == -1:
+            line_end = len(text)
+        hits.append((line_no, text[line_start:line_end].rstrip('\r')))
+        # Continue on the next line: one hit per line
+        pos = line_end + 1
+        if pos > len(text):
+            break
+    return hits
+
+
+_open_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def open_content_index(root, data_dir):
+    """Return the content index of project `root`, opening it once per process."""
+    root = os.path.normpath(os.path.abspath(root))
+    with _registry_lock:
+        index = _open_indexes.get(root)
+        if index is None:
+            index = ContentIndex(root, data_dir)
+            _open_indexes[root] = index
+        return index
@@ -0,0 +1,244 @@
+"""Project exclusion rules: excluded names, user glob patterns and nested .gitignore files."""
+import os
+import re
+import threading
+from collections import namedtuple
+
+# Directory names never descended into, whatever the other rules say
+DEFAULT_EXCLUDED_DIRS = ('node_modules', '__pycache__', '.git', '.venv', 'venv', '__svn__', '__hg__', 'Google Drive')
+
+GITIGNORE = '.gitignore'
+
+# One compiled pattern line: regex over '/'-separated paths relative to its base directory
+Rule = namedtuple('Rule', ['regex', 'negated', 'dir_only'])
+
+
+def _translate_segment(segment):
+    # fnmatch-style translation of one path segment; wildcards never cross '/'
+    out = []
+    i = 0
+    while i < len(segment):
+        c = segment[i]
+        i += 1
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '\\' and i < len(segment):
+            out.append(re.escape(segment[i]))
+            i += 1
+        elif c == '[':
+            start = i + 1 if i < len(segment) and segment[i] in '!^' else i
+            # A ']' right after the opening bracket is part of the class
+            end = segment.find(']', start + 1 if segment[start:start + 1] == ']' else start)
+            if end == -1:
+                out.append(re.escape(c))
+                continue
+            body = segment[i:end]
+            i = end + 1
+            if body[:1] in ('!', '^'):
+                body = '^' + body[1:]
+            out.append('[' + body.replace('\\', '\\\\') + ']')
+        else:
+            out.append(re.escape(c))
+    return ''.join(out)
+
+
+def compile_pattern(line):
+    """
+    Compile one line of gitignore syntax into a Rule, or None for blank
+    lines and comments. A pattern containing '/' (other than a trailing
+    one) is anchored to its base directory; otherwise it matches at any
+    depth. '**' matches any number of directories.
+    """
+    line = line.rstrip('\n\r')
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    elif line.startswith('\\'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    anchored = '/' in line
+    segments = line.lstrip('/').split('/')
+    regex = ''
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == '**':
+            regex += '.*' if last else '(?:.*/)?'
+        else:
+            regex += _translate_segment(segment) + ('' if last else '/')
+    prefix = '' if anchored else '(?:.*/)?'
+    return Rule(re.compile(f'{prefix}{regex}\\Z', re.DOTALL), negated, dir_only)
+
+
+def compile_patterns(lines):
+    return tuple(rule for rule in map(compile_pattern, lines) if rule is not None)
+
+
+class ExclusionRules:
+    """
+    Decides which paths of a project are excluded.
+
+    A path is excluded when one of its components is in `excluded_names`,
+    or when the last matching rule among the user `patterns` (gitignore
+    syntax, relative to `root`) and the .gitignore files of its ancestor
+    directories excludes it, deeper files taking precedence. A path inside
+    an excluded directory is excluded too.
+
+    Each directory's .gitignore is read and compiled once; the chain of
+    rules applying to a directory is cached, so prune() costs a dict lookup
+    plus the rule matches. Call gitignore_changed() / invalidate() when a
+    .gitignore may have been edited.
+    """
+
+    def __init__(self, root, excluded_names=DEFAULT_EXCLUDED_DIRS, patterns=(), use_gitignore=True):
+        self.root = os.path.normpath(os.path.abspath(root))
+        self.excluded_names = frozenset(excluded_names)
+        self.patterns = tuple(patterns)
+        self.use_gitignore = use_gitignore
+        self._user_rules = compile_patterns(self.patterns)
+        self._lock = threading.Lock()
+        self._own = {}     # directory -> (.gitignore stamp, its compiled rules)
+        self._chains = {}  # directory -> ((base directory, rules), ...) applying to its entries
+
+    @property
+    def signature(self):
+        """Hashable description of the configuration (not of the .gitignore contents)."""
+        return (sorted(self.excluded_names), list(self.patterns), self.use_gitignore)
+
+    # --- Rule chains ----------------------------------------------------------
+
+    def _inside_root(self, path):
+        return path == self.root or path.startswith(self.root + os.sep)
+
+    @staticmethod
+    def _gitignore_stamp(directory):
+        try:
+            st = os.stat(os.path.join(directory, GITIGNORE))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _own_rules(self, directory):
+        cached = self._own.get(directory)
+        if cached is not None:
+            return cached[1]
+        stamp = self._gitignore_stamp(directory)
+        rules = ()
+        if stamp is not None:
+            try:
+                with open(os.path.join(directory, GITIGNORE), 'r', encoding='utf-8', errors='replace') as f:
+                    rules = compile_patterns(f)
+            except OSError:
+                stamp = None
+        with self._lock:
+            self._own[directory] = (stamp, rules)
+        return rules
+
+    def _chain(self, directory):
+        chain = self._chains.get(directory)
+        if chain is not None:
+            return chain
+        if directory == self.root:
+            chain = ((self.root, self._user_rules),) if self._user_rules else ()
+        else:
+            chain = self._chain(os.path.dirname(directory))
+        if self.use_gitignore:
+            own = self._own_rules(directory)
+            if own:
+                chain = chain + ((directory, own),)
+        with self._lock:
+            self._chains[directory] = chain
+        return chain
+
+    def gitignore_changed(self, directory):
+        """True if the .gitignore of `directory` changed since its rules were compiled."""
+        directory = os.path.normpath(os.path.abspath(directory))
+        cached = self._own.get(directory)
+        return cached is not None and cached[0] != self._gitignore_stamp(directory)
+
+    def gitignore_stamps(self, directory):
+        """
+        (mtime_ns, size) of the .gitignore files of `directory` and its
+        ancestors up to the root, read from disk (None where there is none):
+        it changes whenever the rules applying to the entries of `directory`
+        may have changed. Usable as a cache validator.
+        """
+        directory = os.path.normpath(os.path.abspath(directory))
+        if not self.use_gitignore or not self._inside_root(directory):
+            return ()
+        stamps = []
+        while True:
+            stamps.append(self._gitignore_stamp(directory))
+            if directory == self.root:
+                return tuple(stamps)
+            directory = os.path.dirname(directory)
+
+    def invalidate(self, directory=None):
+        """Forget compiled rules of `directory` and below (default: everything)."""
+        with self._lock:
+            if directory is None:
+                self._own.clear()
+                self._chains.clear()
+                return
+            directory = os.path.normpath(os.path.abspath(directory))
+            prefix = directory + os.sep
+            for cache in (self._own, self._chains):
+                for key in [k for k in cache if k == directory or k.startswith(prefix)]:
+                    del cache[key]
+
+    # --- Queries --------------------------------------------------------------
+
+    def excludes(self, parent, name, is_dir):
+        """
+        True if entry `name` of directory `parent` is excluded by itself,
+        assuming `parent` is not (walkers only list kept directories).
+        """
+        if name in self.excluded_names:
+            return True
+        if not self._inside_root(parent):
+            return False
+        for base, rules in reversed(self._chain(parent)):
+            rel = os.path.join(parent, name)[len(base) + 1:]
+            if os.sep != '/':
+                rel = rel.replace(os.sep, '/')
+            for rule in reversed(rules):
+                if rule.dir_only and not is_dir:
+                    continue
+                if rule.regex.match(rel):
+                    return not rule.negated
+        return False
+
+    def is_excluded(self, path, is_dir=None):
+        """
+        True if `path` or one of its ancestors below the root is excluded.
+        `is_dir` defaults to checking the filesystem.
+        """
+        path = os.path.normpath(os.path.abspath(path))
+        if not self._inside_root(path) or path == self.root:
+            return os.path.basename(path) in self.excluded_names
+        if is_dir is None:
+            is_dir = os.path.isdir(path)
+        parts = path[len(self.root) + 1:].split(os.sep)
+        parent = self.root
+        for index, name in enumerate(parts):
+            last = index == len(parts) - 1
+            if self.excludes(parent, name, is_dir if last else True):
+                return True
+            parent = os.path.join(parent, name)
+        return False
+
+    def prune(self, entry):
+        """fs_walker prune hook: True for DirEntry objects to skip (with their subtree)."""
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        return self.excludes(os.path.dirname(entry.path), entry.name, is_dir)
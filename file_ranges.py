@@ -0,0 +1,224 @@
+"""Bounded slices of files of any size, by bytes or by lines, read through mmap."""
+import codecs
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from itertools import islice
+
+from content_cache import DEFAULT_FALLBACK_ENCODINGS, decode_bytes, file_version, translate_newlines
+
+# Lines between two recorded line offsets: a line range is read from the
+# recorded offset before it, skipping at most this many lines
+LINE_STRIDE = 64
+
+# Line indexes kept in memory (8 bytes per LINE_STRIDE lines each)
+DEFAULT_MAX_LINE_INDEXES = 256
+
+# Longest encoded character (UTF-8, a UTF-16 surrogate pair, UTF-32)
+MAX_CHAR_BYTES = 4
+
+# Decoded slice of a file: text of bytes [start, end) of a file of `size` bytes
+TextSlice = namedtuple('TextSlice', ['text', 'start', 'end', 'size', 'encoding'])
+
+# Decoded lines [start, end] (1-based, inclusive) of a file of `line_count` lines
+LineSlice = namedtuple('LineSlice', ['text', 'start', 'end', 'line_count', 'encoding'])
+
+# Selection entry restricted to a line range: "<path>:<start>-<end>"
+_LINE_RANGE = re.compile(r'(.+):(\d+)-(\d+)\Z', re.DOTALL)
+
+# Byte order marks and the codec decoding what follows them, UTF-32 marks first
+# (the UTF-16 LE mark is a prefix of the UTF-32 LE one)
+_BOM_CODECS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le', 4),
+    (codecs.BOM_UTF32_BE, 'utf-32-be', 4),
+    (codecs.BOM_UTF8, 'utf-8', 1),
+    (codecs.BOM_UTF16_LE, 'utf-16-le', 2),
+    (codecs.BOM_UTF16_BE, 'utf-16-be', 2),
+)
+
+
+def read_bytes(path, offset, length):
+    """
+    Return (bytes [offset, offset + length) of `path` clipped to the file,
+    file size). Only the pages covering the range are mapped, so the cost
+    does not depend on the file size.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = max(0, min(offset, size))
+        end = min(size, offset + max(0, length))
+        if end <= offset:
+            return b'', size
+        base = offset - offset % mmap.ALLOCATIONGRANULARITY
+        with mmap.mmap(f.fileno(), end - base, offset=base, access=mmap.ACCESS_READ) as m:
+            return m[offset - base:end - base], size
+
+
+def _decode_partial(data, encoding, final):
+    # Decode `data`, leaving out a character cut at its end; return (text, bytes consumed)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    text = decoder.decode(data, final=final)
+    return text, len(data) - len(decoder.getstate()[0])
+
+
+def read_text_slice(path, offset, length, fallback_encodings=DEFAULT_FALLBACK_ENCODINGS):
+    """
+    Decode about `length` bytes of `path` from `offset`, for paging through
+    files too large to load. The slice is moved to character boundaries:
+    start is aligned to the code unit of a BOM-marked UTF-16/32 file, or
+    moved past UTF-8 continuation bytes, and a character cut at the end is
+    left for the next slice (which starts at the returned `end`); at least
+    MAX_CHAR_BYTES are read so every slice before the end of the file holds
+    a character. `offset` is clipped to the file. Without a BOM, UTF-8 is
+    tried, then `fallback_encodings`, on the slice only.
+    """
+    head, size = read_bytes(path, 0, 4)
+    bom_len, unit, candidates = 0, 1, ('utf-8',) + tuple(fallback_encodings)
+    for bom, codec, codec_unit in _BOM_CODECS:
+        if head.startswith(bom):
+            bom_len, unit, candidates = len(bom), codec_unit, (codec,)
+            break
+    start = max(min(offset, size), bom_len)
+    start -= (start - bom_len) % unit
+    length = max(MAX_CHAR_BYTES, length - length % unit)
+    data, size = read_bytes(path, start, length)
+    final = start + len(data) >= size
+    error = None
+    for encoding in candidates:
+        skip = 0
+        if encoding == 'utf-8' and start > bom_len:
+            # Continuation bytes belong to a character that began before the slice
+            while skip < min(3, len(data)) and 0x80 <= data[skip] < 0xC0:
+                skip += 1
+        try:
+            text, consumed = _decode_partial(data[skip:], encoding, final)
+        except UnicodeDecodeError as e:
+            error = error or e
+            continue
+        return TextSlice(translate_newlines(text), start + skip, start + skip + consumed, size, encoding)
+    raise error
+
+
+def split_line_range(entry):
+    """
+    Split a selection entry into (path, start, end). Entries of the form
+    "<path>:<start>-<end>" select lines start to end (1-based, inclusive);
+    start and end are None for a whole file. Nothing is checked on disk:
+    reading a missing file raises as usual.
+    """
+    match = _LINE_RANGE.match(entry)
+    if match is None:
+        return entry, None, None
+    start, end = int(match.group(2)), int(match.group(3))
+    if end < start:
+        start, end = end, start
+    return match.group(1), max(1, start), max(1, end)
+
+
+def format_line_range(path, start, end):
+    return f"{path}:{start}-{end}"
+
+
+def _skip_lines(data, pos, count):
+    # Position after `count` more newlines from `pos`, or the end of `data`
+    for _ in range(count):
+        pos = data.find(b'\n', pos)
+        if pos == -1:
+            return len(data)
+        pos += 1
+    return pos
+
+
+class LineIndex:
+    """
+    Byte offset of every LINE_STRIDE-th line of one version of a file,
+    found in a single pass over the mapped file. Files marked as UTF-16/32
+    by a BOM, where a newline is not a single byte, are not indexed
+    (`offsets` is None).
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self.version = file_version(path, st)
+            self.size = st.st_size
+            self.offsets = array('Q', [0])
+            if self.size == 0:
+                self.line_count = 0
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                if m[:4].startswith(tuple(bom for bom, _, unit in _BOM_CODECS if unit > 1)):
+                    self.offsets, self.line_count = None, None
+                    return
+                # Start of lines LINE_STRIDE, 2 * LINE_STRIDE, ...: one match object kept per stride
+                newlines = islice(re.finditer(b'\n', m), LINE_STRIDE - 1, None, LINE_STRIDE)
+                self.offsets.extend(match.end() for match in newlines)
+                tail = m[self.offsets[-1]:]
+        # Lines after the last recorded offset; a last line without newline counts too
+        self.line_count = (len(self.offsets) - 1) * LINE_STRIDE + tail.count(b'\n') + (bool(tail) and not tail.endswith(b'\n'))
+
+    def byte_range(self, path, start, end):
+        """
+        Bytes of lines [start, end] (1-based, inclusive, clipped to the
+        file) with one mapped read: from the recorded offset before `start`
+        to the one after `end`.
+        """
+        first = (start - 1) // LINE_STRIDE
+        last = -(-end // LINE_STRIDE)
+        low = self.offsets[first]
+        high = self.offsets[last] if last < len(self.offsets) else self.size
+        data, _ = read_bytes(path, low, high - low)
+        begin = _skip_lines(data, 0, start - 1 - first * LINE_STRIDE)
+        return data[begin:_skip_lines(data, begin, end - start + 1)]
+
+
+class LineIndexCache:
+    """
+    Line indexes of the files read by line range, rebuilt when a file's
+    (inode, size, mtime_ns) version changes. Bounded LRU of `max_entries`.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_LINE_INDEXES):
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()  # path -> LineIndex
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        version = file_version(path)
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(path)
+                return index
+        index = LineIndex(path)
+        with self._lock:
+            self._indexes[path] = index
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def read_lines(self, path, start, end, fallback_encodings=DEFAULT_FALLBACK_ENCODINGS):
+        """
+        Decode lines [start, end] (1-based, inclusive) of `path` into a
+        LineSlice whose start/end are clipped to the file. Raises OSError,
+        or UnicodeDecodeError when no codec fits the lines.
+        """
+        index = self.get(path)
+        if index.offsets is None:
+            # UTF-16/32: decode the whole file and cut its lines
+            with open(path, 'rb') as f:
+                text, encoding = decode_bytes(f.read(), fallback_encodings)
+            lines = text.split('\n')
+            last = lines.pop()  # '' when the text ends with a newline
+            lines = [line + '\n' for line in lines] + ([last] if last else [])
+            end = min(end, len(lines))
+            return LineSlice(''.join(lines[start - 1:end]), start, end, len(lines), encoding)
+        end = min(end, index.line_count)
+        if start > end:
+            return LineSlice('', start, end, index.line_count, 'utf-8')
+        text, encoding = decode_bytes(index.byte_range(path, start, end), fallback_encodings)
+        return LineSlice(text, start, end, index.line_count, encoding)
@@ -0,0 +1,108 @@
+"""Text/binary classification of files from a short prefix, cached per file version."""
+import codecs
+import threading
+from collections import OrderedDict
+
+from content_cache import file_version
+
+# Bytes read from the start of a file to classify it
+SNIFF_BYTES = 8192
+
+# Verdicts kept in memory (about 150 bytes each)
+DEFAULT_MAX_ENTRIES = 200000
+
+# Share of control characters above which a prefix is taken for binary
+MAX_CONTROL_RATIO = 0.1
+# Share of non-ASCII bytes above which a prefix that is not UTF-8 is taken for binary
+MAX_HIGH_BYTES_RATIO = 0.3
+
+# UTF-16/32 text is full of NUL bytes but starts with a byte order mark
+_BOMS = (codecs.BOM_UTF8, codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+# Control bytes that do not occur in text files (tab, newlines, form feed, backspace and escape do)
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in b'\t\n\r\f\b\x1b') + b'\x7f'
+_NOT_CONTROL = bytes(b for b in range(256) if b not in _CONTROL_BYTES)
+_ASCII = bytes(range(128))
+
+
+def looks_binary(prefix, complete=False):
+    """
+    True if `prefix`, the first bytes of a file, looks like binary data:
+    it contains a NUL byte (and no UTF-16/32 byte order mark) or many
+    control characters, or it is not valid UTF-8 and mostly made of
+    non-ASCII bytes. With `complete` the prefix is the whole file, so a
+    multi-byte character cut at its end is an error rather than the effect
+    of the cut.
+    """
+    if not prefix or prefix.startswith(_BOMS):
+        return False
+    if b'\0' in prefix:
+        return True
+    if len(prefix.translate(None, _NOT_CONTROL)) > len(prefix) * MAX_CONTROL_RATIO:
+        return True
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=complete)
+        return False
+    except UnicodeDecodeError:
+        pass
+    # Legacy 8-bit encodings are text too: accented letters stay a minority of the bytes
+    return len(prefix.translate(None, _ASCII)) > len(prefix) * MAX_HIGH_BYTES_RATIO
+
+
+class FileSniffer:
+    """
+    Remembers whether files are binary, reading SNIFF_BYTES of a file the
+    first time it is asked about and again only once its (inode, size,
+    mtime_ns) version changes. Bounded LRU of at most `max_entries` verdicts.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> (version, is_binary)
+        self._lock = threading.Lock()
+
+    def is_binary(self, path, st=None):
+        """Classify `path`; raises OSError if it cannot be stat'ed or read."""
+        version = file_version(path, st)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        with open(path, 'rb') as f:
+            prefix = f.read(SNIFF_BYTES)
+        verdict = looks_binary(prefix, complete=len(prefix) >= version[1])
+        with self._lock:
+            self._entries[path] = (version, verdict)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return verdict
+
+    def text_paths(self, paths, path_fn=None):
+        """
+        The `paths` that are not binary, in order. Paths that cannot be read
+        are kept, so the reader reports them like before. `path_fn` maps an
+        entry to the file to check (for entries that are not plain paths).
+        """
+        kept = []
+        for path in paths:
+            try:
+                if self.is_binary(path_fn(path) if path_fn else path):
+                    continue
+            except OSError:
+                pass
+            kept.append(path)
+        return kept
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
@@ -0,0 +1,67 @@
+"""os.scandir-based directory listing and walking with pruning hooks."""
+import os
+
+
+def exclude_names(names):
+    """Prune hook skipping entries whose basename is in `names`."""
+    names = set(names)
+    return lambda entry: entry.name in names
+
+
+def exclude_paths(paths):
+    """Prune hook skipping entries whose full path is in `paths`."""
+    paths = set(paths)
+    return lambda entry: entry.path in paths
+
+
+def combine(*prunes):
+    """Prune hook skipping an entry if any of the given hooks (None allowed) does."""
+    prunes = [p for p in prunes if p is not None]
+    return lambda entry: any(p(entry) for p in prunes)
+
+
+def list_dir(path, prune=None, sort=True):
+    """
+    Return the DirEntry objects of `path`, minus those `prune(entry)` rejects.
+
+    Entry types come from the directory read itself (is_dir() is cached), so
+    no per-entry stat is needed. Raises OSError if `path` cannot be listed.
+    """
+    with os.scandir(path) as it:
+        entries = [entry for entry in it if prune is None or not prune(entry)]
+    if sort:
+        entries.sort(key=lambda entry: entry.name)
+    return entries
+
+
+def split_entries(entries):
+    """Split entries into (dirs, files), preserving order."""
+    dirs, files = [], []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            continue
+        (dirs if is_dir else files).append(entry)
+    return dirs, files
+
+
+def walk(top, prune=None, sort=False, follow_symlinks=False):
+    """
+    Top-down walk yielding (dirpath, dir_entries, file_entries).
+
+    Pruned entries are neither yielded nor descended into; callers may also
+    remove items from dir_entries to skip those subtrees. Unreadable
+    directories are skipped silently, like os.walk.
+    """
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        try:
+            entries = list_dir(path, prune, sort)
+        except OSError:
+            continue
+        dirs, files = split_entries(entries)
+        yield path, dirs, files
+        stack.extend(entry.path for entry in reversed(dirs)
+                     if follow_symlinks or not entry.is_symlink())
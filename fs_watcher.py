@@ -0,0 +1,271 @@
+"""Incremental filesystem watching: inotify on Linux, directory polling elsewhere."""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from fs_walker import list_dir, walk
+
+logger = logging.getLogger(__name__)
+
+# Batch of changes: directories whose listing changed, files whose content changed
+FsChanges = namedtuple('FsChanges', ['dirs', 'files'])
+
+# inotify(7) constants
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_STRUCTURE_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+# Content edits: a write closed, or metadata (mtime) set by tools that write through mmap or touch
+_CONTENT_EVENTS = IN_CLOSE_WRITE | IN_ATTRIB
+_WATCH_MASK = _STRUCTURE_EVENTS | _CONTENT_EVENTS | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _PathFilter:
+    """Decides which directories are watched and which events are ignored."""
+
+    def __init__(self, excluded_dirs, ignore_paths, exclusions=None):
+        self.excluded_dirs = set(excluded_dirs)
+        self.ignore_paths = [os.path.normpath(os.path.abspath(p)) for p in ignore_paths]
+        self.exclusions = exclusions
+
+    def is_ignored(self, path):
+        return any(path == p or path.startswith(p + os.sep) for p in self.ignore_paths)
+
+    def should_watch_dir(self, path):
+        if os.path.basename(path) in self.excluded_dirs or self.is_ignored(path):
+            return False
+        return self.exclusions is None or not self.exclusions.is_excluded(path, is_dir=True)
+
+    def iter_dirs(self, top):
+        """Yield `top` and every watchable directory below it (symlinks not followed)."""
+        def prune(entry):
+            if not entry.is_dir(follow_symlinks=False):
+                return True
+            if entry.name in self.excluded_dirs or self.is_ignored(entry.path):
+                return True
+            # Parents were kept, so only the entry's own rules matter
+            return self.exclusions is not None and self.exclusions.excludes(os.path.dirname(entry.path), entry.name, True)
+        for path, _, _ in walk(top, prune):
+            yield path
+
+
+class _InotifyBackend:
+    """One inotify watch per directory; raises OSError if inotify is unusable."""
+
+    name = 'inotify'
+
+    def __init__(self, root, path_filter):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._filter = path_filter
+        self._wds = {}  # watch descriptor -> directory path
+        try:
+            self._add_tree(root, strict=True)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, top, strict=False):
+        for path in self._filter.iter_dirs(top):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if strict and err == errno.ENOSPC:
+                    # Watch limit reached: let the caller fall back to polling
+                    raise OSError(err, 'inotify watch limit reached')
+                continue
+            self._wds[wd] = path
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return None
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return None
+        dirs, files = set(), set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: treat every watched directory as changed
+                dirs.update(self._wds.values())
+                continue
+            if mask & IN_IGNORED:
+                self._wds.pop(wd, None)
+                continue
+            base = self._wds.get(wd)
+            if base is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue
+            path = os.path.join(base, name) if name else base
+            if self._filter.is_ignored(path):
+                continue
+            if mask & _STRUCTURE_EVENTS:
+                dirs.add(base)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and self._filter.should_watch_dir(path):
+                    # Re-adding an already watched inode returns its old
+                    # descriptor, which also remaps directories moved in the tree.
+                    self._add_tree(path)
+            elif mask & _CONTENT_EVENTS and not mask & IN_ISDIR:
+                files.add(path)
+        return FsChanges(dirs, files)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class _PollingBackend:
+    """
+    Periodically stats every watched directory (one stat each, never the
+    files) and reports those whose mtime changed; only such a directory is
+    listed again, to find its new subdirectories. In-place file edits are
+    not detected: readers that need them compare file versions themselves.
+    """
+
+    name = 'polling'
+
+    def __init__(self, root, path_filter, interval, stop_event):
+        self._filter = path_filter
+        self._interval = interval
+        self._stop = stop_event
+        self._mtimes = {}
+        self._snapshot(root)
+
+    def _snapshot(self, top):
+        for path in self._filter.iter_dirs(top):
+            try:
+                self._mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+    def read(self, timeout):
+        if self._stop.wait(self._interval):
+            return None
+        dirs = set()
+        for path in list(self._mtimes):
+            if path not in self._mtimes:
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                # Directory vanished: forget it and its subtree, report its parent
+                prefix = path + os.sep
+                for known in [p for p in self._mtimes if p == path or p.startswith(prefix)]:
+                    del self._mtimes[known]
+                dirs.add(os.path.dirname(path))
+                continue
+            if mtime_ns != self._mtimes[path]:
+                self._mtimes[path] = mtime_ns
+                dirs.add(path)
+                try:
+                    new_dirs = [e.path for e in list_dir(path, sort=False) if e.is_dir(follow_symlinks=False)
+                                and e.path not in self._mtimes and self._filter.should_watch_dir(e.path)]
+                except OSError:
+                    new_dirs = []
+                for new_dir in new_dirs:
+                    self._snapshot(new_dir)
+        return FsChanges(dirs, set()) if dirs else None
+
+    def close(self):
+        pass
+
+
+class FsWatcher:
+    """
+    Watches a project tree on a background thread and calls
+    `on_change(FsChanges)` with debounced batches of changes.
+
+    Uses inotify when available and falls back to polling directory mtimes.
+    Excluded directory names, and directories excluded by `exclusions` (an
+    ExclusionRules), are not watched; `ignore_paths` (for example the data
+    directory holding the index) never produce events. The exclusions are
+    fixed for the life of the watcher: start a new one when they change.
+    """
+
+    def __init__(self, root, on_change, excluded_dirs=(), ignore_paths=(), exclusions=None,
+                 poll_interval=2.0, debounce=0.2, use_inotify=True):
+        self.root = os.path.normpath(os.path.abspath(root))
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify
+        self.backend_name = None
+        self._filter = _PathFilter(excluded_dirs, ignore_paths, exclusions)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def exclusions(self):
+        return self._filter.exclusions
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='FsWatcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def _create_backend(self):
+        if self.use_inotify:
+            try:
+                return _InotifyBackend(self.root, self._filter)
+            except (OSError, AttributeError) as e:
+                logger.info(f"inotify unavailable for {self.root} ({e}), falling back to polling")
+        return _PollingBackend(self.root, self._filter, self.poll_interval, self._stop)
+
+    def _run(self):
+        backend = self._create_backend()
+        self.backend_name = backend.name
+        pending_dirs, pending_files = set(), set()
+        last_event = 0.0
+        try:
+            while not self._stop.is_set():
+                changes = backend.read(self.debounce)
+                if changes:
+                    pending_dirs |= changes.dirs
+                    pending_files |= changes.files
+                    last_event = time.monotonic()
+                if (pending_dirs or pending_files) and time.monotonic() - last_event >= self.debounce:
+                    batch = FsChanges(pending_dirs, pending_files)
+                    pending_dirs, pending_files = set(), set()
+                    try:
+                        self.on_change(batch)
+                    except Exception as e:
+                        logger.error(f"Error handling filesystem changes under {self.root}: {e}")
+        finally:
+            backend.close()
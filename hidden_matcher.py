@@ -0,0 +1,64 @@
+"""Path-component trie answering "is this path or one of its ancestors hidden"."""
+import os
+
+# Key of a trie node whose path is itself hidden, mapping to the spellings its name was given with
+_HIDDEN = object()
+
+
+def _components(path):
+    # Components as spelled in `path`; compare them through os.path.normcase
+    path = os.path.normpath(os.path.abspath(path))
+    return [part for part in path.split(os.sep) if part]
+
+
+class HiddenMatcher:
+    """
+    Compiled set of hidden paths. Lookups walk one trie node per path
+    component, so their cost depends on the path depth rather than on the
+    number of hidden items. Components are matched case-insensitively where
+    the platform is (os.path.normcase), but names are reported as given.
+    Build a new matcher when the hidden items change.
+    """
+
+    def __init__(self, paths=()):
+        self._root = {}
+        self._count = 0
+        for path in paths:
+            node = self._root
+            parts = _components(path)
+            for part in parts:
+                node = node.setdefault(os.path.normcase(part), {})
+            if _HIDDEN not in node:
+                node[_HIDDEN] = set()
+                self._count += 1
+            if parts:
+                node[_HIDDEN].add(parts[-1])
+
+    def __len__(self):
+        return self._count
+
+    def is_hidden(self, path):
+        """True if `path` or any of its ancestors is hidden."""
+        if not self._count:
+            return False
+        node = self._root
+        for part in _components(path):
+            node = node.get(os.path.normcase(part))
+            if node is None:
+                return False
+            if _HIDDEN in node:
+                return True
+        return False
+
+    def hidden_names(self, directory):
+        """
+        Names of the hidden entries directly inside `directory`, spelled as in
+        the hidden paths, for exact comparisons such as SQL `NOT IN`.
+        """
+        node = self._root
+        for part in _components(directory):
+            node = node.get(os.path.normcase(part))
+            if node is None:
+                return []
+        return [name for key, child in node.items() if key is not _HIDDEN and _HIDDEN in child
+                for name in child[_HIDDEN]]
@@ -0,0 +1,586 @@
+"""Persistent per-project metadata index backed by SQLite."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+from exclusions import DEFAULT_EXCLUDED_DIRS, GITIGNORE, ExclusionRules
+from fs_walker import list_dir
+
+# Directories listed per commit while building, so queries can interleave with a build
+BUILD_BATCH_DIRS = 200
+
+IndexEntry = namedtuple('IndexEntry', ['path', 'parent', 'name', 'is_dir', 'size', 'mtime_ns', 'ext'])
+
+_COLUMNS = 'path, parent, name, is_dir, size, mtime_ns, ext'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ext TEXT NOT NULL,
+    pruned INTEGER NOT NULL DEFAULT 0,
+    scanned INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent, name);
+CREATE INDEX IF NOT EXISTS entries_ext ON entries (ext);
+-- Covers the filtered child counts of paginated listings
+CREATE INDEX IF NOT EXISTS entries_parent_type ON entries (parent, is_dir, ext, name);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+-- File count and total size per extension, kept current by the triggers below
+CREATE TABLE IF NOT EXISTS ext_stats (ext TEXT PRIMARY KEY, files INTEGER NOT NULL, bytes INTEGER NOT NULL);
+CREATE TRIGGER IF NOT EXISTS ext_stats_insert AFTER INSERT ON entries
+WHEN NEW.is_dir = 0 AND NEW.pruned = 0
+BEGIN
+    INSERT INTO ext_stats (ext, files, bytes) VALUES (NEW.ext, 1, NEW.size)
+    ON CONFLICT(ext) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes;
+END;
+CREATE TRIGGER IF NOT EXISTS ext_stats_delete AFTER DELETE ON entries
+WHEN OLD.is_dir = 0 AND OLD.pruned = 0
+BEGIN
+    UPDATE ext_stats SET files = files - 1, bytes = bytes - OLD.size WHERE ext = OLD.ext;
+END;
+CREATE TRIGGER IF NOT EXISTS ext_stats_update AFTER UPDATE OF is_dir, pruned, size, ext ON entries
+BEGIN
+    UPDATE ext_stats SET files = files - 1, bytes = bytes - OLD.size
+    WHERE ext = OLD.ext AND OLD.is_dir = 0 AND OLD.pruned = 0;
+    INSERT INTO ext_stats (ext, files, bytes) SELECT NEW.ext, 1, NEW.size WHERE NEW.is_dir = 0 AND NEW.pruned = 0
+    ON CONFLICT(ext) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes;
+END;
+"""
+
+# Fills ext_stats for indexes created before it existed
+_BACKFILL_EXT_STATS = """
+DELETE FROM ext_stats;
+INSERT INTO ext_stats (ext, files, bytes)
+    SELECT ext, COUNT(*), SUM(size) FROM entries WHERE is_dir = 0 AND pruned = 0 GROUP BY ext;
+INSERT OR REPLACE INTO meta (key, value) VALUES ('ext_stats', '1');
+"""
+
+# Upsert that keeps the scan-time mtime of directories already listed, so a
+# parent re-listing never makes a stale child listing look fresh.
+_UPSERT = f"""
+INSERT INTO entries ({_COLUMNS}, pruned, scanned) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+ON CONFLICT(path) DO UPDATE SET
+    is_dir = excluded.is_dir,
+    pruned = excluded.pruned,
+    size = excluded.size,
+    ext = excluded.ext,
+    mtime_ns = CASE WHEN entries.is_dir AND excluded.is_dir AND entries.scanned
+                    THEN entries.mtime_ns ELSE excluded.mtime_ns END,
+    scanned = CASE WHEN entries.is_dir AND excluded.is_dir THEN entries.scanned ELSE 0 END
+"""
+
+
+def _normalize(path):
+    return os.path.normpath(os.path.abspath(path))
+
+
+def _subtree_bounds(path):
+    """Return (low, high) so that descendants of `path` satisfy low <= p < high."""
+    prefix = path.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def _scan_rows(path, exclusions, pruned=False):
+    """
+    List one directory; return its entry rows and the subdirectories to
+    descend into. Excluded entries are recorded as pruned, and nothing is
+    descended into below an excluded directory.
+    """
+    rows, subdirs = [], []
+    for entry in list_dir(path, sort=False):
+        try:
+            is_dir = entry.is_dir()
+            st = entry.stat()
+        except OSError:
+            continue
+        name = entry.name
+        ext = '' if is_dir else os.path.splitext(name)[1]
+        excluded = pruned or exclusions.excludes(path, name, is_dir)
+        rows.append((entry.path, path, name, int(is_dir), 0 if is_dir else st.st_size, st.st_mtime_ns, ext, int(excluded)))
+        # Like os.walk, list symlinked directories but do not follow them
+        if is_dir and not excluded and not entry.is_symlink():
+            subdirs.append(entry.path)
+    return rows, subdirs
+
+
+class ProjectIndex:
+    """
+    Path, parent, type, size, mtime and extension of every entry under a
+    project root, persisted in the data directory so reopening a project does
+    not require walking it again.
+
+    Entries excluded by `exclusions` (an ExclusionRules: excluded names,
+    user glob patterns and .gitignore files) are recorded as pruned and never
+    descended into; they do not show up in children(), files() or
+    extensions(). Directory listings are revalidated against the directory
+    mtime when queried through children(), and rescan_dir() refreshes a
+    single directory. Editing a .gitignore re-evaluates the subtree it covers.
+    An index reopened from a previous session rescans the directories whose
+    mtime changed while it was closed before ensure_built() returns.
+    """
+
+    def __init__(self, root, data_dir, exclusions=None):
+        self.root = _normalize(root)
+        self.exclusions = exclusions or ExclusionRules(self.root)
+        self.generation = 0  # Bumped on every change, usable as a cache validator
+        os.makedirs(data_dir, exist_ok=True)
+        digest = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+        self.db_path = os.path.join(data_dir, f'index-{digest}.sqlite3')
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'ext_stats'").fetchone() is None:
+            self._conn.executescript(_BACKFILL_EXT_STATS)
+        self._built = (self._conn.execute("SELECT 1 FROM meta WHERE key = 'built'").fetchone() is not None
+                       and self._stored_signature() == self._signature())
+        self._synced = False  # Whether a reopened index was checked against the disk
+        self._build_lock = threading.Lock()
+        self._build_epoch = 0  # Bumped by configure(): a build started under older rules stops
+        self._thread_lock = threading.Lock()
+        self._build_thread = None
+
+    def _signature(self):
+        return json.dumps(self.exclusions.signature)
+
+    def _stored_signature(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'exclusions'").fetchone()
+        return row[0] if row else None
+
+    def configure(self, exclusions):
+        """
+        Switch to other exclusion rules without waiting for a build in
+        progress: that build stops at its next batch and ensure_built()
+        starts over. If the rules differ from the ones the index was built
+        with, the index is rebuilt by the next ensure_built().
+        """
+        with self._lock:
+            self.exclusions = exclusions
+            self._build_epoch += 1
+            if self._built and self._stored_signature() != self._signature():
+                self._conn.execute("DELETE FROM meta WHERE key = 'built'")
+                self._conn.commit()
+                self._built = False
+
+    # --- Building ---------------------------------------------------------
+
+    @property
+    def is_built(self):
+        return self._built
+
+    @property
+    def is_current(self):
+        """True once ensure_built() has returned: built, and checked against the disk if reopened."""
+        return self._built and self._synced
+
+    def ensure_built(self):
+        """
+        Build the index unless a previous session (or another thread) already
+        did. An index reopened from a previous session first re-evaluates the
+        subtrees whose .gitignore changed in the meantime, then rescans the
+        directories whose listing changed (one stat per directory).
+        """
+        with self._build_lock:
+            if not self._built:
+                # Restarted when configure() changes the rules during the build
+                while not self.build():
+                    pass
+            elif not self._synced:
+                self._sync_gitignores()
+                self._sync_dirs()
+            self._synced = True
+
+    def build_in_background(self):
+        """Run ensure_built() on a daemon thread; queries keep working meanwhile."""
+        with self._thread_lock:
+            if (self._built and self._synced) or (self._build_thread and self._build_thread.is_alive()):
+                return
+            self._build_thread = threading.Thread(target=self.ensure_built, name='ProjectIndexBuild', daemon=True)
+            self._build_thread.start()
+
+    def build(self):
+        """
+        Walk the whole project once and store every entry. Progress is
+        committed in batches, releasing the lock in between, so queries made
+        during the build see partial results instead of waiting for it.
+        Returns False, leaving the index unbuilt, if configure() changed the
+        rules meanwhile.
+        """
+        with self._lock:
+            epoch = self._build_epoch
+            conn = self._conn
+            conn.execute('DELETE FROM entries')
+            st = os.stat(self.root)
+            conn.execute(_UPSERT, (self.root, os.path.dirname(self.root), os.path.basename(self.root), 1, 0, st.st_mtime_ns, '', 0))
+            conn.commit()
+        self.exclusions.invalidate()
+        if not self._scan_tree(self.root, batch=BUILD_BATCH_DIRS, epoch=epoch):
+            return False
+        with self._lock:
+            if epoch != self._build_epoch:
+                return False
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('exclusions', ?)", (self._signature(),))
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')")
+            self._conn.commit()
+            self._built = True
+            self.generation += 1
+        return True
+
+    def _scan_tree(self, top, batch=None, epoch=None):
+        # Depth-first listing of `top` and every non-excluded subdirectory.
+        # With `batch`, commit and release the lock every `batch` directories.
+        # Returns False, stopping early, once the build epoch differs from `epoch`.
+        stack = [top]
+        while stack:
+            with self._lock:
+                if epoch is not None and epoch != self._build_epoch:
+                    self._conn.commit()
+                    return False
+                for _ in range(batch or len(stack)):
+                    if not stack:
+                        break
+                    path = stack.pop()
+                    try:
+                        mtime_ns = os.stat(path).st_mtime_ns
+                        rows, subdirs = _scan_rows(path, self.exclusions)
+                    except OSError:
+                        continue
+                    self._conn.executemany(_UPSERT, rows)
+                    self._mark_scanned(path, mtime_ns)
+                    stack.extend(subdirs)
+                if batch:
+                    self._conn.commit()
+                    self.generation += 1
+        return True
+
+    def _is_pruned(self, path):
+        # True when `path` is, or lies inside, an excluded directory
+        return path != self.root and self.exclusions.is_excluded(path, is_dir=True)
+
+    def _gitignore_stale(self, directory):
+        # True when the .gitignore of `directory` differs from the indexed one
+        if not self.exclusions.use_gitignore:
+            return False
+        path = os.path.join(directory, GITIGNORE)
+        with self._lock:
+            row = self._conn.execute('SELECT size, mtime_ns FROM entries WHERE path = ?', (path,)).fetchone()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return row is not None
+        return row is None or tuple(row) != (st.st_size, st.st_mtime_ns)
+
+    def _sync_gitignores(self):
+        with self._lock:
+            dirs = [row[0] for row in self._conn.execute(
+                'SELECT parent FROM entries WHERE name = ? AND is_dir = 0 AND pruned = 0', (GITIGNORE,))]
+        for directory in dirs:
+            if self._gitignore_stale(directory):
+                self.reindex_subtree(directory)
+
+    def _sync_dirs(self):
+        # Rescan the directories whose mtime differs from the one stored when they
+        # were listed; parents come first, so a vanished subtree is dropped at once
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, mtime_ns FROM entries WHERE is_dir = 1 AND pruned = 0 AND scanned = 1 '
+                'ORDER BY path').fetchall()
+        for path, mtime_ns in rows:
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                current = None
+            if current != mtime_ns:
+                self.rescan_dir(path)
+
+    def _mark_scanned(self, path, mtime_ns):
+        self._conn.execute('UPDATE entries SET scanned = 1, mtime_ns = ? WHERE path = ?', (mtime_ns, path))
+
+    def _delete_subtree(self, path):
+        low, high = _subtree_bounds(path)
+        self._conn.execute('DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+        self.exclusions.invalidate(path)
+
+    # --- Incremental updates ----------------------------------------------
+
+    def contains(self, path):
+        """True if `path` is the root or lies beneath it."""
+        path = _normalize(path)
+        return path == self.root or path.startswith(_subtree_bounds(self.root)[0])
+
+    def rescan_dir(self, path):
+        """
+        Re-list one directory: drop vanished entries (with their subtrees),
+        update changed ones and fully index newly created subdirectories.
+        """
+        path = _normalize(path)
+        if not self.contains(path):
+            return
+        with self._lock:
+            if self._gitignore_stale(path):
+                self.reindex_subtree(path)
+            else:
+                self._rescan(path)
+
+    def reindex_subtree(self, path):
+        """
+        Re-evaluate the exclusions of everything beneath `path` and index it
+        again, after a .gitignore in `path` was created, edited or deleted.
+        """
+        path = _normalize(path)
+        if not self.contains(path):
+            return
+        with self._lock:
+            self.exclusions.invalidate(path)
+            low, high = _subtree_bounds(path)
+            self._conn.execute('DELETE FROM entries WHERE path >= ? AND path < ?', (low, high))
+            self._rescan(path)
+
+    def _rescan(self, path):
+        with self._lock:
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                rows, subdirs = _scan_rows(path, self.exclusions, self._is_pruned(path))
+            except OSError:
+                self._delete_subtree(path)
+                self._conn.commit()
+                self.generation += 1
+                return
+            conn = self._conn
+            old = {p: is_dir for p, is_dir in conn.execute('SELECT path, is_dir FROM entries WHERE parent = ?', (path,))}
+            new = {row[0]: row[3] for row in rows}
+            for p, was_dir in old.items():
+                if p not in new or (was_dir and not new[p]):
+                    self._delete_subtree(p)
+            conn.executemany(_UPSERT, rows)
+            self._mark_scanned(path, mtime_ns)
+            for sub in subdirs:
+                if not old.get(sub):
+                    self._scan_tree(sub)
+            conn.commit()
+            self.generation += 1
+
+    def refresh_file(self, path):
+        """Update the size and mtime of one file after its content changed."""
+        path = _normalize(path)
+        if not self.contains(path):
+            return
+        if os.path.basename(path) == GITIGNORE and self._gitignore_stale(os.path.dirname(path)):
+            self.reindex_subtree(os.path.dirname(path))
+            return
+        with self._lock:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._delete_subtree(path)
+            else:
+                self._conn.execute(
+                    'UPDATE entries SET size = ?, mtime_ns = ? WHERE path = ? AND is_dir = 0',
+                    (st.st_size, st.st_mtime_ns, path))
+            self._conn.commit()
+            self.generation += 1
+
+    def remove(self, path):
+        """Forget `path` and everything below it."""
+        with self._lock:
+            self._delete_subtree(_normalize(path))
+            self._conn.commit()
+            self.generation += 1
+
+    # --- Queries ------------------------------------------------------------
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [IndexEntry._make(row) for row in self._conn.execute(sql, params)]
+
+    def entry(self, path):
+        rows = self._query(f'SELECT {_COLUMNS} FROM entries WHERE path = ?', (_normalize(path),))
+        return rows[0] if rows else None
+
+    def _live_children(self, path):
+        # Outside the project: list live without recording anything
+        try:
+            rows, _ = _scan_rows(path, self.exclusions)
+        except OSError:
+            return []
+        return sorted((IndexEntry._make(row[:7]) for row in rows if not row[7]), key=lambda e: e.name)
+
+    def _revalidate(self, path):
+        """Rescan `path` if it changed since it was indexed; False if it cannot be listed."""
+        with self._lock:
+            state = self._conn.execute('SELECT scanned, mtime_ns FROM entries WHERE path = ?', (path,)).fetchone()
+        try:
+            current_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if state is None or not state[0] or state[1] != current_mtime:
+            self.rescan_dir(path)
+        return True
+
+    def children(self, path):
+        """
+        Entries directly inside `path` that are not excluded, sorted by name.
+        The listing is refreshed first if the directory changed since it was
+        indexed.
+        """
+        path = _normalize(path)
+        if not self.contains(path):
+            return self._live_children(path)
+        if not self._revalidate(path):
+            return []
+        return self._query(f'SELECT {_COLUMNS} FROM entries WHERE parent = ? AND pruned = 0 ORDER BY name', (path,))
+
+    def children_page(self, path, after=None, limit=None, include_exts=None, exclude_exts=(), exclude_names=()):
+        """
+        One page of children(path) as (entries, total).
+
+        Entries are sorted by name and start after the name `after` (keyset
+        cursor), so pages stay stable while other entries come and go.
+        `include_exts` / `exclude_exts` filter files only; `exclude_names`
+        drops entries of any type. `total` counts every matching entry.
+        """
+        path = _normalize(path)
+        include_exts = None if include_exts is None else list(include_exts)
+        exclude_exts, exclude_names = list(exclude_exts), list(exclude_names)
+        if not self.contains(path):
+            entries = [e for e in self._live_children(path)
+                       if e.name not in exclude_names
+                       and (e.is_dir or ((include_exts is None or e.ext in include_exts) and e.ext not in exclude_exts))]
+            page = [e for e in entries if after is None or e.name > after]
+            return (page if limit is None else page[:limit]), len(entries)
+        if not self._revalidate(path):
+            return [], 0
+        where, params = 'parent = ? AND pruned = 0', [path]
+        if include_exts is not None:
+            where += f" AND (is_dir = 1 OR ext IN ({', '.join('?' * len(include_exts))}))"
+            params.extend(include_exts)
+        if exclude_exts:
+            where += f" AND (is_dir = 1 OR ext NOT IN ({', '.join('?' * len(exclude_exts))}))"
+            params.extend(exclude_exts)
+        if exclude_names:
+            where += f" AND name NOT IN ({', '.join('?' * len(exclude_names))})"
+            params.extend(exclude_names)
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM entries WHERE {where}', params).fetchone()[0]
+        sql = f'SELECT {_COLUMNS} FROM entries WHERE {where}'
+        if after is not None:
+            sql += ' AND name > ?'
+            params.append(after)
+        sql += ' ORDER BY name'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self._query(sql, params), total
+
+    def files(self, under=None, exts=None, limit=None):
+        """
+        Indexed files beneath `under` (default: the root), optionally limited
+        to `exts`, and to the first `limit` by path.
+        """
+        low, high = _subtree_bounds(_normalize(under or self.root))
+        sql = f'SELECT {_COLUMNS} FROM entries WHERE is_dir = 0 AND pruned = 0 AND path >= ? AND path < ?'
+        params = [low, high]
+        if exts is not None:
+            exts = list(exts)
+            if not exts:
+                return []
+            sql += f" AND ext IN ({', '.join('?' * len(exts))})"
+            params.extend(exts)
+        sql += ' ORDER BY path'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self._query(sql, params)
+
+    def iter_files(self, under=None, page_size=2000):
+        """
+        Same entries as files(under), fetched in pages of `page_size` so the
+        first ones are available before the whole subtree is read. The lock
+        is only held while a page is fetched.
+        """
+        low, high = _subtree_bounds(_normalize(under or self.root))
+        sql = (f'SELECT {_COLUMNS} FROM entries WHERE is_dir = 0 AND pruned = 0 AND path > ? AND path < ? '
+               f'ORDER BY path LIMIT ?')
+        after = low
+        while True:
+            rows = self._query(sql, (after, high, page_size))
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = rows[-1].path
+
+    def child_files(self, path):
+        """Indexed files directly inside `path`."""
+        return self._query(f'SELECT {_COLUMNS} FROM entries WHERE parent = ? AND is_dir = 0 AND pruned = 0 ORDER BY name', (_normalize(path),))
+
+    def extensions(self, under=None):
+        """Distinct file extensions found beneath `under` (default: the root)."""
+        low, high = _subtree_bounds(_normalize(under or self.root))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT ext FROM entries WHERE is_dir = 0 AND pruned = 0 AND ext != '' AND path >= ? AND path < ?",
+                (low, high)).fetchall()
+        return {row[0] for row in rows}
+
+    def tree_stamp(self, under=None):
+        """
+        Digest of the current mtimes of `under` (default: the root) and of the
+        indexed directories beneath it, outside excluded ones. It changes
+        whenever one of those listings changes, and costs one stat per directory.
+        """
+        under = _normalize(under or self.root)
+        low, high = _subtree_bounds(under)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path FROM entries WHERE is_dir = 1 AND pruned = 0 AND path >= ? AND path < ? ORDER BY path',
+                (low, high)).fetchall()
+        digest = hashlib.sha1()
+        for path in [under] + [row[0] for row in rows]:
+            try:
+                stamp = os.stat(path).st_mtime_ns
+            except OSError:
+                stamp = '-'
+            digest.update(f'{path}\0{stamp}\0'.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def extension_stats(self):
+        """{ext: (file count, total bytes)} over the whole project, kept current incrementally."""
+        with self._lock:
+            rows = self._conn.execute("SELECT ext, files, bytes FROM ext_stats WHERE files > 0 AND ext != ''").fetchall()
+        return {ext: (files, size) for ext, files, size in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_open_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def open_index(path, data_dir, excluded_dirs=DEFAULT_EXCLUDED_DIRS, patterns=(), use_gitignore=True):
+    """
+    Return the index covering `path`, reusing one already open for an
+    ancestor directory. The exclusion settings replace those of a reused
+    index when they differ.
+    """
+    path = _normalize(path)
+    with _registry_lock:
+        for index in _open_indexes.values():
+            if index.contains(path):
+                rules = ExclusionRules(index.root, excluded_dirs, patterns, use_gitignore)
+                if rules.signature != index.exclusions.signature:
+                    index.configure(rules)
+                return index
+        index = ProjectIndex(path, data_dir, ExclusionRules(path, excluded_dirs, patterns, use_gitignore))
+        _open_indexes[path] = index
+        return index
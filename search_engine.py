@@ -0,0 +1,91 @@
+"""Advanced file search: criteria compiled once, matches streamed in batches."""
+import datetime
+import fnmatch
+import os
+import re
+import time
+
+# Matches delivered per batch, and the longest a found match waits before delivery
+BATCH_SIZE = 500
+BATCH_INTERVAL = 0.1
+
+
+class SearchCriteria:
+    """
+    Compiled criteria of an advanced search, tested against entries carrying
+    the stat data of a directory scan (path, name, ext, size, mtime_ns), such
+    as ProjectIndex rows. Unset criteria are not checked; the others are
+    checked cheapest first.
+
+    - name: substring of the basename, case-insensitive
+    - exts: extensions with their leading dot, case-insensitive
+    - modified_after: date or datetime; files modified earlier are rejected
+    - min_size / max_size: bounds in bytes, inclusive
+    - path_glob: fnmatch pattern, case-insensitive, matched against the path
+      relative to `root` with '/' separators, or against the basename when
+      the pattern has no '/'
+    """
+
+    def __init__(self, root, name=None, exts=None, modified_after=None, min_size=None, max_size=None,
+                 path_glob=None):
+        self.root = os.path.normpath(os.path.abspath(root))
+        checks = []
+        if exts:
+            ext_set = frozenset(ext.lower() for ext in exts)
+            checks.append(lambda entry: entry.ext.lower() in ext_set)
+        if min_size is not None:
+            checks.append(lambda entry: entry.size >= min_size)
+        if max_size is not None:
+            checks.append(lambda entry: entry.size <= max_size)
+        if modified_after is not None:
+            if not isinstance(modified_after, datetime.datetime):
+                modified_after = datetime.datetime.combine(modified_after, datetime.time())
+            threshold_ns = int(modified_after.timestamp() * 1_000_000_000)
+            checks.append(lambda entry: entry.mtime_ns >= threshold_ns)
+        if name:
+            needle = name.lower()
+            checks.append(lambda entry: needle in entry.name.lower())
+        if path_glob:
+            pattern = re.compile(fnmatch.translate(path_glob.replace(os.sep, '/')), re.IGNORECASE)
+            if '/' in path_glob.replace(os.sep, '/'):
+                prefix_len = len(self.root) + 1
+                checks.append(lambda entry: pattern.match(entry.path[prefix_len:].replace(os.sep, '/')) is not None)
+            else:
+                checks.append(lambda entry: pattern.match(entry.name) is not None)
+        self._checks = tuple(checks)
+
+    def matches(self, entry):
+        for check in self._checks:
+            if not check(entry):
+                return False
+        return True
+
+
+def run_search(entries, criteria, on_batch, cancel=None, batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL):
+    """
+    Pass the paths of the `entries` matching `criteria` to on_batch(paths)
+    as they are found: the first match right away, then in batches of
+    `batch_size` or every `batch_interval` seconds. `cancel` (a
+    threading.Event) stops the search between two entries, without a last
+    batch. Returns (match count, cancelled).
+    """
+    matches = criteria.matches
+    batch = []
+    count = 0
+    next_flush = 0.0  # The first match is delivered immediately
+    for entry in entries:
+        if cancel is not None and cancel.is_set():
+            return count, True
+        if not matches(entry):
+            continue
+        batch.append(entry.path)
+        count += 1
+        if len(batch) >= batch_size or time.monotonic() >= next_flush:
+            on_batch(batch)
+            batch = []
+            next_flush = time.monotonic() + batch_interval
+    if cancel is not None and cancel.is_set():
+        return count, True
+    if batch:
+        on_batch(batch)
+    return count, False
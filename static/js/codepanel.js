@@ -6,35 +6,172 @@ document.addEventListener('alpine:init', () => {
     code: '// Select files and click the Code tab to generate.',
     treeStructure: '// Tree structure not generated yet.',
 
-    fetchCode() {
+    codeController: null,
+    codeEtag: null,   // Validator of the bundle currently shown
+    tokenBudget: parseInt(localStorage.getItem('tokenBudget') || '0', 10) || 0,
+    tokenInfo: '',
+
+    // Content search: results, and the files they added to the bundle
+    contentQuery: '',
+    contentRegex: false,
+    contentResults: [],
+    contentTruncated: false,
+    contentStatus: '',
+    searchSelection: [],
+
+    saveBudget() {
+      localStorage.setItem('tokenBudget', String(this.tokenBudget || 0));
+      this.fetchCode();
+    },
+
+    async fetchTokens(paths) {
+      // Token counts are memoized server-side, so this only tokenizes changed files
+      try {
+        const res = await fetch('/api/tokens', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify({paths: paths, budget: this.tokenBudget || null})
+        });
+        const data = await res.json();
+        if (data.budget) {
+          this.tokenInfo = `${data.packed_total} / ${data.budget} tokens (${data.packed.length} files, ${data.skipped.length} skipped, ${data.tokenizer})`;
+        } else {
+          this.tokenInfo = `${data.total} tokens (${data.tokenizer})`;
+        }
+      } catch (err) {
+        console.error('Failed to fetch token counts:', err);
+        this.tokenInfo = '';
+      }
+    },
+
+    async searchContent() {
+      const query = this.contentQuery;
+      if (!query.trim()) {
+        this.contentResults = [];
+        this.contentStatus = '';
+        return;
+      }
+      this.contentStatus = 'Searching…';
+      try {
+        const params = new URLSearchParams({q: query, regex: this.contentRegex ? '1' : '0'});
+        const res = await fetch(`/api/search/content?${params}`);
+        const data = await res.json();
+        if (!res.ok) {
+          throw new Error(data.error || `HTTP ${res.status}`);
+        }
+        this.contentResults = data.results;
+        this.contentTruncated = data.truncated;
+        this.contentStatus = `${data.results.length} file(s)${data.truncated ? ' (truncated)' : ''}`
+          + (data.building ? ' (index still building, results may be incomplete)' : '');
+      } catch (err) {
+        console.error('Content search failed:', err);
+        this.contentResults = [];
+        this.contentStatus = `Search failed: ${err.message}`;
+      }
+    },
+
+    selectSearchResults() {
+      // Add every matching file to the bundle, next to the files checked in the tree
+      const paths = new Set(this.searchSelection);
+      this.contentResults.forEach(result => paths.add(result.path));
+      this.searchSelection = [...paths];
+      this.fetchCode();
+    },
+
+    addToBundle(entries) {
+      // Entries added from elsewhere in the page, such as "<path>:<start>-<end>" line ranges from the preview
+      this.searchSelection = [...new Set([...this.searchSelection, ...entries])];
+      this.fetchCode();
+    },
+
+    clearSearchSelection() {
+      this.searchSelection = [];
+      this.fetchCode();
+    },
+
+    async fetchCode() {
       this.tab = 'code'; // Switch to code tab when fetching
       const tree = $('#tree').jstree(true);
-      if (!tree) {
+      if (!tree && !this.searchSelection.length) {
         this.code = '// Tree not initialized yet.';
+        this.codeEtag = null;
         return;
       }
       // Get IDs of checked nodes that are files (not folders)
-      const selected = tree.get_checked(false).filter(id => {
+      const checked = tree ? tree.get_checked(false).filter(id => {
         const node = tree.get_node(id);
         // Check if it's a file (leaf node)
         return node && !tree.is_parent(node);
-      });
+      }) : [];
+      const selected = [...new Set([...checked, ...this.searchSelection])];
 
       if (!selected.length) {
         this.code = '// No files selected or checked in the tree.';
+        this.codeEtag = null;
         return;
       }
 
+      // Abort any bundle still streaming from a previous selection
+      if (this.codeController) {
+        this.codeController.abort();
+      }
+      const controller = new AbortController();
+      this.codeController = controller;
+
+      const shown = this.code;
       this.code = '// Loading code...'; // Show loading state
-      fetch(`/api/code?paths=${encodeURIComponent(JSON.stringify(selected))}`)
-        .then(res => res.json())
-        .then(data => {
-          this.code = data.code || '// Failed to load code.';
-        })
-        .catch(err => {
-          console.error('Failed to fetch code:', err);
-          this.code = '// Error fetching code.';
+      try {
+        const headers = {'Content-Type': 'application/json'};
+        if (this.codeEtag) {
+          headers['If-None-Match'] = this.codeEtag;
+        }
+        const res = await fetch('/api/code/stream', {
+          method: 'POST',
+          headers: headers,
+          body: JSON.stringify({paths: selected, budget: this.tokenBudget || null}),
+          signal: controller.signal
         });
+        if (res.status === 304) {
+          // Same selection and no file changed since the last bundle
+          this.code = shown;
+          return;
+        }
+        this.codeEtag = null;
+        if (!res.ok || !res.body) {
+          throw new Error(`HTTP ${res.status}`);
+        }
+        // Render chunks as they arrive instead of waiting for the whole bundle: each
+        // chunk is appended to the textarea as its own text node, and the bundle is
+        // joined once at the end, so a large bundle is not rebuilt for every chunk
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        const area = this.$refs.codeArea;
+        const chunks = [];
+        while (true) {
+          const {done, value} = await reader.read();
+          if (done) break;
+          const chunk = decoder.decode(value, {stream: true});
+          if (!chunk) continue;
+          if (!chunks.length) {
+            area.textContent = '';
+          }
+          chunks.push(chunk);
+          area.appendChild(document.createTextNode(chunk));
+        }
+        chunks.push(decoder.decode());
+        const received = chunks.join('');
+        this.code = received || '// Failed to load code.';
+        this.codeEtag = received ? res.headers.get('ETag') : null;
+        this.fetchTokens(selected);
+      } catch (err) {
+        if (err.name === 'AbortError') return;
+        console.error('Failed to fetch code:', err);
+        this.code = '// Error fetching code.';
+      } finally {
+        if (this.codeController === controller) {
+          this.codeController = null;
+        }
+      }
     },
 
     async fetchTreeStructure() {
@@ -82,6 +219,11 @@ document.addEventListener('alpine:init', () => {
     newFav: '',
     hidden: [],
     newHidden: '',
+    extension_stats: {},
+    scan_complete: true,
+    exclude_patterns: '',
+    fallback_encodings: '',
+    use_gitignore: true,
     async fetchOptions() {
       try {
         const res = await fetch('/api/options');
@@ -89,10 +231,30 @@ document.addEventListener('alpine:init', () => {
         this.known_extensions = data.known_extensions;
         this.selected_extensions = data.selected_extensions;
         this.favorites = data.favorites;
+        this.extension_stats = data.extension_stats || {};
+        this.scan_complete = data.scan_complete !== false;
+        this.exclude_patterns = (data.exclude_patterns || []).join('\n');
+        this.fallback_encodings = (data.fallback_encodings || []).join(', ');
+        this.use_gitignore = data.use_gitignore !== false;
+        // The project is still being indexed: poll until the counts are final
+        if (!this.scan_complete) {
+          setTimeout(() => this.fetchOptions(), 1000);
+        }
       } catch (e) {
         console.error('Failed to load options', e);
       }
     },
+    extensionInfo(ext) {
+      const stat = this.extension_stats[ext];
+      if (!stat) return '';
+      const units = ['B', 'KB', 'MB', 'GB'];
+      let size = stat.bytes, unit = 0;
+      while (size >= 1024 && unit < units.length - 1) {
+        size /= 1024;
+        unit++;
+      }
+      return `${stat.files} files, ${size.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+    },
     async fetchHidden() {
       try {
         const res = await fetch('/api/options/hidden');
@@ -127,6 +289,42 @@ document.addEventListener('alpine:init', () => {
         console.error('Failed to save extensions', e);
       }
     },
+    async saveExclusions() {
+      try {
+        await fetch('/api/options/exclusions', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify({
+            exclude_patterns: this.exclude_patterns.split('\n').map(p => p.trim()).filter(p => p),
+            use_gitignore: this.use_gitignore
+          })
+        });
+        // The index is rebuilt with the new rules: reload options and tree
+        this.fetchOptions();
+        const tree = $('#tree').jstree(true);
+        if (tree) {
+          tree.refresh();
+        }
+      } catch (e) {
+        console.error('Failed to save exclusions', e);
+      }
+    },
+    async saveEncodings() {
+      try {
+        const res = await fetch('/api/options/encodings', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify({
+            fallback_encodings: this.fallback_encodings.split(',').map(e => e.trim()).filter(e => e)
+          })
+        });
+        // Show the codecs the server kept (unknown names are dropped)
+        const data = await res.json();
+        this.fallback_encodings = (data.fallback_encodings || []).join(', ');
+      } catch (e) {
+        console.error('Failed to save encodings', e);
+      }
+    },
     init() {
       this.$watch('selected_extensions', () => {
         clearTimeout(this.saveTimeout);
@@ -29,12 +29,105 @@ document.addEventListener('DOMContentLoaded', function() {
       window.showHidden = this.checked;
       localStorage.setItem('showHidden', window.showHidden ? 'true' : 'false'); // Persist state
       const tree = $('#tree').jstree(true);
+      prefetched.clear();
       if (tree) {
         tree.refresh();
       }
     });
   }
 
+  // File preview, one slice at a time: large files are paged by bytes or by lines instead of loaded whole
+  const PREVIEW_BYTES = 64 * 1024;
+  const PREVIEW_LINES = 200;
+  let previewRequest = 0;
+
+  function formatBytes(n) {
+    const units = ['B', 'KB', 'MB', 'GB'];
+    let unit = 0;
+    while (n >= 1024 && unit < units.length - 1) {
+      n /= 1024;
+      unit++;
+    }
+    return `${n.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+  }
+
+  function pagerButton(label, enabled, onClick) {
+    const button = document.createElement('button');
+    button.className = 'px-1 bg-gray-300 dark:bg-gray-600 rounded disabled:opacity-50';
+    button.textContent = label;
+    button.disabled = !enabled;
+    button.addEventListener('click', onClick);
+    return button;
+  }
+
+  // mode is head, tail or range (from byte `offset`), or lines (from line `offset`)
+  function loadPreview(path, mode = 'head', offset = 0) {
+    const pane = document.getElementById('file-preview');
+    const request = ++previewRequest; // Ignore answers to superseded requests
+    const params = mode === 'lines'
+      ? new URLSearchParams({path, mode, line: offset, count: PREVIEW_LINES})
+      : new URLSearchParams({path, mode, offset, length: PREVIEW_BYTES});
+    fetch(`/api/preview?${params}`)
+      .then(r => r.json().then(d => ({ok: r.ok, status: r.status, d})))
+      .then(({ok, status, d}) => {
+        if (request !== previewRequest) return;
+        pane.innerHTML = '';
+        if (!ok) {
+          pane.innerText = `// ${d.error || `Error loading preview (HTTP ${status})`}`;
+          return;
+        }
+        if (d.binary) {
+          pane.innerText = '// Binary file, no preview';
+          return;
+        }
+        const bar = document.createElement('div');
+        bar.className = 'flex items-center space-x-2 mb-1 text-xs text-gray-500';
+        const info = document.createElement('span');
+        if (mode === 'lines') {
+          bar.appendChild(pagerButton('‹ Prev', d.line > 1,
+            () => loadPreview(path, 'lines', Math.max(1, d.line - PREVIEW_LINES))));
+          bar.appendChild(pagerButton('Next ›', d.end_line < d.line_count,
+            () => loadPreview(path, 'lines', d.end_line + 1)));
+          info.textContent = d.line <= d.end_line
+            ? `Lines ${d.line}–${d.end_line} of ${d.line_count}`
+            : `${d.line_count || 0} line(s)`;
+        } else if (d.size > d.end - d.offset) {
+          // Byte pager, only when the file does not fit in one slice
+          bar.appendChild(pagerButton('« Head', d.offset > 0, () => loadPreview(path, 'head')));
+          bar.appendChild(pagerButton('‹ Prev', d.offset > 0,
+            () => loadPreview(path, 'range', Math.max(0, d.offset - PREVIEW_BYTES))));
+          bar.appendChild(pagerButton('Next ›', d.end < d.size, () => loadPreview(path, 'range', d.end)));
+          bar.appendChild(pagerButton('Tail »', d.end < d.size, () => loadPreview(path, 'tail')));
+          info.textContent = `${formatBytes(d.offset)}–${formatBytes(d.end)} of ${formatBytes(d.size)}`;
+        }
+        bar.appendChild(info);
+        // Jump to a line number; the lines shown can then be added to the bundle on their own
+        const lineInput = document.createElement('input');
+        lineInput.type = 'number';
+        lineInput.min = '1';
+        lineInput.placeholder = 'Line';
+        lineInput.className = 'w-20 px-1 border rounded dark:bg-gray-800';
+        const goToLine = () => loadPreview(path, 'lines', Math.max(1, parseInt(lineInput.value, 10) || 1));
+        lineInput.addEventListener('keydown', e => { if (e.key === 'Enter') goToLine(); });
+        bar.appendChild(lineInput);
+        bar.appendChild(pagerButton('Go', true, goToLine));
+        if (mode === 'lines' && d.line <= d.end_line) {
+          bar.appendChild(pagerButton(`Add lines ${d.line}–${d.end_line} to bundle`, true, () => {
+            window.dispatchEvent(new CustomEvent('bundle-add', {detail: [`${path}:${d.line}-${d.end_line}`]}));
+          }));
+        }
+        pane.appendChild(bar);
+        const text = document.createElement('div');
+        text.innerText = d.content || '// No preview available or file is empty';
+        pane.appendChild(text);
+        pane.scrollTop = 0;
+      }).catch(err => {
+        if (request !== previewRequest) return;
+        pane.innerText = '// Error loading preview';
+        console.error('Preview error:', err);
+      });
+  }
+
   // Navigation history stack
   let history = [], histIndex = -1;
   function updateNavButtons() {
@@ -65,13 +158,134 @@ document.addEventListener('DOMContentLoaded', function() {
     }
   }, 500);
 
+  // Directory listings are fetched one page at a time
+  const TREE_PAGE_SIZE = 500;
+
+  function fetchTreePage(path, cursor) {
+    const params = { path: path, showHidden: window.showHidden, limit: TREE_PAGE_SIZE };
+    if (cursor) params.cursor = cursor;
+    return $.getJSON('/api/tree', params);
+  }
+
+  // Placeholder node that loads the next page of its parent folder when selected
+  function loadMoreNode(path, cursor, shown, total) {
+    return {
+      id: '__more__' + path,
+      text: `Load more… (${shown} of ${total})`,
+      type: 'more',
+      children: false,
+      state: { checkbox_disabled: true },
+      data: { path: path, cursor: cursor, shown: shown, total: total }
+    };
+  }
+
+  function pageNodes(path, page, shown) {
+    const nodes = page.items.slice();
+    if (page.next_cursor) {
+      nodes.push(loadMoreNode(path, page.next_cursor, shown + page.items.length, page.total));
+    }
+    return nodes;
+  }
+
+  // Listings received ahead of time through /api/tree/batch, by folder path
+  const PREFETCH_TTL_MS = 30000;
+  const prefetched = new Map();
+
+  function fetchTreeBatch(paths, depth) {
+    return fetch('/api/tree/batch', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({ paths: paths, depth: depth || 0, showHidden: window.showHidden, limit: TREE_PAGE_SIZE })
+    }).then(r => r.json()).then(function(data) {
+      const now = Date.now();
+      Object.entries(data.listings || {}).forEach(function([path, page]) {
+        prefetched.set(path, { page: page, time: now });
+      });
+    });
+  }
+
+  function takePrefetched(path) {
+    const entry = prefetched.get(path);
+    prefetched.delete(path);
+    if (entry && Date.now() - entry.time < PREFETCH_TTL_MS) return entry.page;
+    return null;
+  }
+
+  // Expanded folders are remembered so the tree can be restored in one batch request
+  const OPEN_STATE_KEY = 'treeOpenFolders';
+  function loadOpenState() {
+    try {
+      return JSON.parse(localStorage.getItem(OPEN_STATE_KEY)) || [];
+    } catch (e) {
+      return [];
+    }
+  }
+  function saveOpenState(tree) {
+    const open = tree.get_json('#', { flat: true })
+      .filter(n => n.state && n.state.opened)
+      .map(n => n.id);
+    localStorage.setItem(OPEN_STATE_KEY, JSON.stringify(open));
+  }
+
+  function restoreOpenState(tree) {
+    const paths = loadOpenState().sort((a, b) => a.length - b.length);
+    if (!paths.length) return;
+    fetchTreeBatch(paths).catch(function(err) {
+      console.error('Failed to prefetch tree state:', err);
+    }).then(function() {
+      // Parents sort before their children, so each folder exists when its turn comes
+      (function openNext(i) {
+        if (i >= paths.length) return;
+        if (tree.get_node(paths[i])) {
+          tree.open_node(paths[i], function() { openNext(i + 1); }, false);
+        } else {
+          openNext(i + 1);
+        }
+      })(0);
+    });
+  }
+
+  // Pre-warm the children of the subfolders of a folder that was just opened
+  const PREFETCH_MAX_FOLDERS = 50;
+  function prefetchChildren(tree, node) {
+    const folders = (node.children || [])
+      .map(id => tree.get_node(id))
+      .filter(child => child && tree.is_parent(child)
+              && !tree.is_loaded(child) && !prefetched.has(child.id))
+      .slice(0, PREFETCH_MAX_FOLDERS)
+      .map(child => child.id);
+    if (folders.length) {
+      fetchTreeBatch(folders).catch(function(err) {
+        console.error('Failed to prefetch folders:', err);
+      });
+    }
+  }
+
+  function loadMore(tree, moreNode) {
+    const info = moreNode.data;
+    const parent = tree.get_parent(moreNode);
+    fetchTreePage(info.path, info.cursor).done(function(page) {
+      tree.delete_node(moreNode);
+      pageNodes(info.path, page, info.shown).forEach(function(child) {
+        tree.create_node(parent, child, 'last');
+      });
+    }).fail(function() {
+      console.error('Failed to load more tree data for path:', info.path);
+    });
+  }
+
   // Build tree
   $('#tree').jstree({
     core: {
       data: function(node, callback) {
         let path = node.id === '#' ? baseDir : node.id;
-        $.getJSON('/api/tree', { path: path, showHidden: window.showHidden }, function(data) {
-          callback(data);
+        const page = takePrefetched(path);
+        if (page) {
+          callback(pageNodes(path, page, 0));
+          return;
+        }
+        fetchTreePage(path).done(function(page) {
+          callback(pageNodes(path, page, 0));
         }).fail(function() {
           callback([]);
           console.error('Failed to load tree data for path:', path);
@@ -86,7 +300,8 @@ document.addEventListener('DOMContentLoaded', function() {
     plugins: ['types', 'checkbox', 'search', 'contextmenu', 'wholerow'],
     types: {
       'default': { icon: 'jstree-icon jstree-file' },
-      'folder': { icon: 'jstree-icon jstree-folder' }
+      'folder': { icon: 'jstree-icon jstree-folder' },
+      'more': { icon: false }
     },
     checkbox: {
       keep_selected_style: false,
@@ -99,6 +314,7 @@ document.addEventListener('DOMContentLoaded', function() {
     },
     contextmenu: {
       items: function(node) {
+        if (node.type === 'more') return {};
         const tree = $('#tree').jstree(true);
         const isDir = tree.is_parent(node);
         const path = node.id;
@@ -114,14 +330,7 @@ document.addEventListener('DOMContentLoaded', function() {
           preview: {
             label: "Preview",
             action: function(data) {
-              fetch(`/api/preview?path=${encodeURIComponent(path)}`)
-                .then(r => r.json())
-                .then(d => {
-                  document.getElementById('file-preview').innerText = d.content || '// No preview available or file is empty';
-                }).catch(err => {
-                  document.getElementById('file-preview').innerText = '// Error loading preview';
-                  console.error('Preview error:', err);
-                });
+              loadPreview(path);
             },
             _disabled: isDir // Disable for folders
           },
@@ -303,9 +512,45 @@ document.addEventListener('DOMContentLoaded', function() {
     debouncedFetchCode();
   });
 
-  // On ready, just enable navigation buttons without expanding tree
-  $('#tree').on('ready.jstree', function() {
+  // Live filesystem changes pushed by the server: reload only the changed folders
+  if (window.EventSource) {
+    const fsEvents = new EventSource('/api/fs/events');
+    fsEvents.onmessage = function(e) {
+      const changes = JSON.parse(e.data);
+      const tree = $('#tree').jstree(true);
+      if (!tree) return;
+      (changes.dirs || []).forEach(function(dir) {
+        prefetched.delete(dir);
+        if (dir === baseDir) {
+          tree.refresh(true);
+          return;
+        }
+        const node = tree.get_node(dir);
+        if (node && node.state.loaded) {
+          tree.refresh_node(node);
+        }
+      });
+      // Regenerate the bundle if the selection may have changed
+      const checked = new Set(tree.get_checked());
+      const touched = (changes.files || []).some(f => checked.has(f));
+      if (touched || (changes.dirs || []).length) {
+        debouncedFetchCode();
+      }
+    };
+  }
+
+  // On ready, enable navigation buttons and reopen the folders expanded last time
+  $('#tree').on('ready.jstree', function(e, data) {
     updateNavButtons();
+    restoreOpenState(data.instance);
+  });
+
+  $('#tree').on('open_node.jstree', function(e, data) {
+    prefetchChildren(data.instance, data.node);
+    saveOpenState(data.instance);
+  });
+  $('#tree').on('close_node.jstree', function(e, data) {
+    saveOpenState(data.instance);
   });
 
   // Setup search debounce
@@ -335,6 +580,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const node = data.node;
     const inst = data.instance;
 
+    if (node.type === 'more') {
+      inst.deselect_node(node);
+      loadMore(inst, node);
+      return;
+    }
+
     if (e.originalEvent && $(e.originalEvent.target).hasClass('jstree-checkbox')) {
         return;
     }
@@ -342,14 +593,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (inst.is_parent(node)) {
       inst.toggle_node(node);
     } else {
-      fetch(`/api/preview?path=${encodeURIComponent(node.id)}`)
-        .then(r => r.json())
-        .then(d => {
-          document.getElementById('file-preview').innerText = d.content || '// No preview available or file is empty';
-        }).catch(err => {
-            document.getElementById('file-preview').innerText = '// Error loading preview';
-            console.error('Preview error:', err);
-        });
+      loadPreview(node.id);
     }
   });
 
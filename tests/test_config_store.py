@@ -0,0 +1,103 @@
+import json
+import os
+import time
+
+import pytest
+
+from config_store import JsonStore
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json(path, value, mtime_offset_ns=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + mtime_offset_ns))
+
+
+@pytest.fixture
+def replaces(monkeypatch):
+    """Record the os.replace calls, the only way the store writes the target."""
+    calls = []
+    replace = os.replace
+
+    def counting(src, dst):
+        calls.append(dst)
+        replace(src, dst)
+    monkeypatch.setattr(os, 'replace', counting)
+    return calls
+
+
+def test_missing_file_gives_a_copy_of_the_default(tmp_path):
+    default = {'items': []}
+    store = JsonStore(str(tmp_path / 'a.json'), default)
+    store.update(lambda value: value['items'].append(1))
+    assert store.get() == {'items': [1]}
+    assert default == {'items': []}
+
+
+def test_invalid_json_falls_back_to_the_default(tmp_path):
+    path = tmp_path / 'a.json'
+    path.write_text('{not json', encoding='utf-8')
+    assert JsonStore(str(path), {'ok': True}).get() == {'ok': True}
+
+
+def test_writes_are_debounced(tmp_path, replaces):
+    path = str(tmp_path / 'a.json')
+    store = JsonStore(path, {}, write_delay=0.1)
+    for i in range(5):
+        store.set({'n': i})
+    assert not os.path.exists(path)
+    deadline = time.monotonic() + 5
+    while not replaces and time.monotonic() < deadline:
+        time.sleep(0.02)
+    time.sleep(0.2)
+    assert replaces == [path]
+    assert read_json(path) == {'n': 4}
+
+
+def test_flush_writes_pending_changes_once(tmp_path, replaces):
+    path = str(tmp_path / 'a.json')
+    store = JsonStore(path, {}, write_delay=60)
+    store.set({'a': 1})
+    store.flush()
+    store.flush()
+    assert replaces == [path]
+    assert read_json(path) == {'a': 1}
+
+
+def test_failed_write_keeps_the_old_file_and_retries(tmp_path, monkeypatch):
+    path = str(tmp_path / 'a.json')
+    write_json(path, {'old': True})
+    store = JsonStore(path, {}, write_delay=60)
+    store.set({'new': True})
+
+    def fail(src, dst):
+        raise OSError('disk full')
+    replace = os.replace
+    monkeypatch.setattr(os, 'replace', fail)
+    store.flush()
+    assert read_json(path) == {'old': True}
+    assert os.listdir(str(tmp_path)) == ['a.json']  # No temporary file left behind
+    monkeypatch.setattr(os, 'replace', replace)
+    store.flush()
+    assert read_json(path) == {'new': True}
+
+
+def test_external_edits_are_reloaded_unless_changes_are_pending(tmp_path):
+    path = str(tmp_path / 'a.json')
+    write_json(path, {'v': 1})
+    store = JsonStore(path, {}, write_delay=60, check_interval=0)
+    generation, value = store.snapshot()
+    assert value == {'v': 1}
+    write_json(path, {'v': 2}, mtime_offset_ns=10 ** 9)
+    assert store.snapshot() == (generation + 1, {'v': 2})
+    store.set({'v': 3})
+    write_json(path, {'v': 4}, mtime_offset_ns=2 * 10 ** 9)
+    assert store.get() == {'v': 3}
+    store.flush()
+    assert read_json(path) == {'v': 3}
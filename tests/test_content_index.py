@@ -0,0 +1,112 @@
+import os
+import re
+
+import pytest
+
+from content_index import ContentIndex, _query_trigrams, _required_literals, _trigrams
+from project_index import ProjectIndex
+
+
+def naive_trigrams(data):
+    return {int.from_bytes(data[i:i + 3], 'little') for i in range(len(data) - 2)}
+
+
+@pytest.mark.parametrize('size', range(0, 12))
+def test_trigrams_cover_every_offset(size):
+    data = bytes(range(65, 65 + size))
+    assert _trigrams(data) == naive_trigrams(data)
+
+
+@pytest.mark.parametrize('pattern, literals', [
+    ('foo', ['foo']),
+    ('foo.*bar', ['foo', 'bar']),
+    (r'def \w+\(', ['def ', '(']),
+    ('(a|b)xyz', ['xyz']),
+    ('ab?cd', ['a', 'cd']),
+    ('[abc]+', []),
+    ('(', []),
+])
+def test_required_literals(pattern, literals):
+    assert _required_literals(pattern, re.MULTILINE) == literals
+
+
+def test_query_trigrams_lower_ascii_only():
+    assert _query_trigrams(['ABC'], ignore_case=True) == [int.from_bytes(b'abc', 'little')]
+    # Windows with non-ASCII bytes have case variants encoded differently
+    assert _query_trigrams(['\xe9t\xe9'], ignore_case=True) == []
+    assert _query_trigrams(['\xe9t\xe9'], ignore_case=False) == sorted(naive_trigrams('\xe9t\xe9'.encode('utf-8')))
+    assert _query_trigrams(['ab'], ignore_case=True) == []
+
+
+def write_bytes(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = str(tmp_path / 'project')
+    write_bytes(os.path.join(root, 'plain.py'), b'def find_needle(hay):\n    return hay\n')
+    write_bytes(os.path.join(root, 'wide.txt'), 'utf-16 Needle here\n'.encode('utf-16'))
+    write_bytes(os.path.join(root, 'latin.txt'), 'caf\xe9 au lait\n'.encode('latin-1'))
+    write_bytes(os.path.join(root, 'sub', 'other.md'), b'no match\nneedle at line two\n')
+    write_bytes(os.path.join(root, 'blob.bin'), b'needle\0\0\0\xff' * 20)
+    index = ProjectIndex(root, str(tmp_path / 'data'))
+    index.ensure_built()
+    content = ContentIndex(root, str(tmp_path / 'data'))
+    content.refresh(index)
+    yield root, index, content
+    content.close()
+    index.close()
+
+
+def found(root, result):
+    matches, _ = result
+    return sorted(os.path.relpath(m.path, root).replace(os.sep, '/') for m in matches)
+
+
+def test_binary_files_are_skipped(project):
+    _, _, content = project
+    assert content.stats() == {'indexed': 4, 'skipped': 1}
+
+
+def test_literal_search_ignores_case_by_default(project):
+    root, _, content = project
+    assert found(root, content.search('needle')) == ['plain.py', 'sub/other.md', 'wide.txt']
+    assert found(root, content.search('Needle', ignore_case=False)) == ['wide.txt']
+
+
+def test_utf16_and_latin1_files_are_indexed_as_decoded_text(project):
+    root, _, content = project
+    assert found(root, content.search('utf-16 needle')) == ['wide.txt']
+    assert found(root, content.search('caf\xe9 au')) == ['latin.txt']
+    assert found(root, content.search('CAF\xc9 AU')) == ['latin.txt']
+
+
+def test_regex_search_reports_matching_lines(project):
+    root, _, content = project
+    matches, truncated = content.search(r'^needle \w+', regex=True)
+    assert not truncated
+    assert [(os.path.basename(m.path), m.hits) for m in matches] == [('other.md', [(2, 'needle at line two')])]
+
+
+def test_under_and_limit(project):
+    root, _, content = project
+    assert found(root, content.search('needle', under=os.path.join(root, 'sub'))) == ['sub/other.md']
+    matches, truncated = content.search('needle', limit=1)
+    assert len(matches) == 1 and truncated
+
+
+def test_refresh_picks_up_edits_and_removals(project):
+    root, index, content = project
+    path = os.path.join(root, 'plain.py')
+    write_bytes(path, b'nothing left\n')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    index.refresh_file(path)
+    os.remove(os.path.join(root, 'latin.txt'))
+    index.rescan_dir(root)
+    assert content.refresh(index) == 1
+    assert found(root, content.search('needle')) == ['sub/other.md', 'wide.txt']
+    assert found(root, content.search('caf\xe9')) == []
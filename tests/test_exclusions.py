@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from exclusions import ExclusionRules, compile_pattern
+
+
+def matches(pattern, rel):
+    return compile_pattern(pattern).regex.match(rel) is not None
+
+
+def write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+@pytest.mark.parametrize('line', ['', '   ', '# comment', '/', '\n'])
+def test_blank_lines_and_comments_compile_to_nothing(line):
+    assert compile_pattern(line) is None
+
+
+def test_unanchored_pattern_matches_at_any_depth():
+    assert matches('*.log', 'a.log')
+    assert matches('*.log', 'd/e/a.log')
+    assert not matches('*.log', 'a.log.txt')
+
+
+def test_wildcards_do_not_cross_directories():
+    assert matches('docs/*.md', 'docs/a.md')
+    assert not matches('docs/*.md', 'docs/sub/a.md')
+    assert matches('a?c', 'abc')
+    assert not matches('a?c', 'a/c')
+
+
+def test_pattern_with_slash_is_anchored():
+    assert matches('/build', 'build')
+    assert not matches('/build', 'src/build')
+    assert matches('src/gen', 'src/gen')
+    assert not matches('src/gen', 'lib/src/gen')
+
+
+def test_double_star():
+    assert matches('**/tmp', 'tmp')
+    assert matches('**/tmp', 'a/b/tmp')
+    assert matches('a/**/b', 'a/b')
+    assert matches('a/**/b', 'a/x/y/b')
+    assert matches('logs/**', 'logs/x/y')
+
+
+def test_character_classes():
+    assert matches('[abc].py', 'b.py')
+    assert not matches('[abc].py', 'd.py')
+    assert matches('[!abc].py', 'd.py')
+    assert not matches('[!abc].py', 'a.py')
+    assert matches('[]]x', ']x')
+
+
+def test_flags_and_escapes():
+    rule = compile_pattern('!keep.log')
+    assert rule.negated and not rule.dir_only
+    assert compile_pattern('out/').dir_only
+    assert matches(r'\!bang', '!bang')
+    assert matches(r'\#hash', '#hash')
+    assert not compile_pattern(r'\!bang').negated
+    assert matches('trailing   ', 'trailing')
+    assert matches('space\\ ', 'space ')
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / 'project'
+    write(str(root / '.gitignore'), '*.log\n!keep.log\nout/\n/top.txt\n')
+    write(str(root / 'sub' / '.gitignore'), '!deep.log\n')
+    for rel in ('a.log', 'keep.log', 'top.txt', 'sub/top.txt', 'sub/deep.log', 'sub/other.log',
+                'out/x.py', 'sub/out', 'node_modules/lib.js'):
+        write(str(root / rel))
+    return str(root)
+
+
+def excluded(rules, root, rel):
+    return rules.is_excluded(os.path.join(root, *rel.split('/')))
+
+
+def test_gitignore_rules_and_negation(project):
+    rules = ExclusionRules(project)
+    assert excluded(rules, project, 'a.log')
+    assert not excluded(rules, project, 'keep.log')
+    assert excluded(rules, project, 'top.txt')
+    assert not excluded(rules, project, 'sub/top.txt')
+    # A deeper .gitignore takes precedence
+    assert not excluded(rules, project, 'sub/deep.log')
+    assert excluded(rules, project, 'sub/other.log')
+
+
+def test_dir_only_pattern_skips_files(project):
+    rules = ExclusionRules(project)
+    assert excluded(rules, project, 'out')
+    assert not excluded(rules, project, 'sub/out')
+
+
+def test_entries_inside_excluded_directory_stay_excluded(project):
+    rules = ExclusionRules(project, patterns=['!out/x.py'])
+    assert excluded(rules, project, 'out/x.py')
+    assert excluded(rules, project, 'node_modules/lib.js')
+
+
+def test_user_patterns_come_before_gitignore(project):
+    # The .gitignore is more specific than the user patterns, so its negation wins
+    rules = ExclusionRules(project, patterns=['keep.log', '*.py'])
+    assert not excluded(rules, project, 'keep.log')
+    assert excluded(rules, project, 'sub/deep.py')
+
+
+def test_gitignore_can_be_disabled(project):
+    rules = ExclusionRules(project, use_gitignore=False)
+    assert not excluded(rules, project, 'a.log')
+    assert excluded(rules, project, 'node_modules')
+
+
+def test_edited_gitignore_applies_after_invalidate(project):
+    rules = ExclusionRules(project)
+    assert not excluded(rules, project, 'sub/top.txt')
+    path = os.path.join(project, 'sub', '.gitignore')
+    write(path, '!deep.log\ntop.txt\n')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert rules.gitignore_changed(os.path.join(project, 'sub'))
+    rules.invalidate(os.path.join(project, 'sub'))
+    assert excluded(rules, project, 'sub/top.txt')
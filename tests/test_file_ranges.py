@@ -0,0 +1,107 @@
+import codecs
+
+import pytest
+
+from file_ranges import LINE_STRIDE, LineIndexCache, read_text_slice, split_line_range
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def expected_lines(text, start, end):
+    lines = text.splitlines(keepends=True)
+    return ''.join(lines[start - 1:end])
+
+
+@pytest.mark.parametrize('entry, parts', [
+    ('/p/a.py', ('/p/a.py', None, None)),
+    ('/p/a.py:3-7', ('/p/a.py', 3, 7)),
+    ('/p/a.py:7-3', ('/p/a.py', 3, 7)),
+    ('/p/a.py:0-2', ('/p/a.py', 1, 2)),
+    ('/p/a:b.py:1-2', ('/p/a:b.py', 1, 2)),
+    ('/p/a.py:1-', ('/p/a.py:1-', None, None)),
+    ('C:\\p\\a.py', ('C:\\p\\a.py', None, None)),
+])
+def test_split_line_range(entry, parts):
+    assert split_line_range(entry) == parts
+
+
+LINE_COUNT = 3 * LINE_STRIDE + 5
+RANGES = [(1, 1), (1, 3), (2, LINE_STRIDE), (LINE_STRIDE, LINE_STRIDE + 1), (LINE_STRIDE + 1, 2 * LINE_STRIDE),
+          (LINE_COUNT - 2, LINE_COUNT), (1, LINE_COUNT)]
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+@pytest.mark.parametrize('final_newline', [True, False])
+@pytest.mark.parametrize('start, end', RANGES)
+def test_read_lines_matches_the_decoded_file(tmp_path, newline, final_newline, start, end):
+    text = newline.join(f'line {i} \xe9' for i in range(1, LINE_COUNT + 1)) + (newline if final_newline else '')
+    path = str(tmp_path / 'f.txt')
+    write(path, text.encode('utf-8'))
+    result = LineIndexCache().read_lines(path, start, end)
+    assert result.text == expected_lines(text.replace('\r\n', '\n'), start, end)
+    assert (result.start, result.end, result.line_count, result.encoding) == (start, end, LINE_COUNT, 'utf-8')
+
+
+def test_out_of_range_lines_are_clipped(tmp_path):
+    path = str(tmp_path / 'f.txt')
+    write(path, b'a\nb\nc')
+    cache = LineIndexCache()
+    assert cache.read_lines(path, 2, 99)[:4] == ('b\nc', 2, 3, 3)
+    assert cache.read_lines(path, 5, 9)[:4] == ('', 5, 3, 3)
+    write(path, b'')
+    assert cache.read_lines(path, 1, 3)[:4] == ('', 1, 0, 0)
+
+
+def test_utf16_files_are_cut_after_decoding(tmp_path):
+    path = str(tmp_path / 'f.txt')
+    cache = LineIndexCache()
+    write(path, codecs.BOM_UTF16_LE + 'one\r\ntwo\r\nthree\r\n'.encode('utf-16-le'))
+    assert cache.read_lines(path, 2, 9)[:4] == ('two\nthree\n', 2, 3, 3)
+    write(path, codecs.BOM_UTF16_LE + 'one\ntwo'.encode('utf-16-le'))
+    assert cache.read_lines(path, 2, 2)[:4] == ('two', 2, 2, 2)
+
+
+def test_latin1_fallback(tmp_path):
+    path = str(tmp_path / 'f.txt')
+    write(path, 'caf\xe9\nth\xe9\n'.encode('latin-1'))
+    result = LineIndexCache().read_lines(path, 2, 2)
+    assert (result.text, result.encoding) == ('th\xe9\n', 'latin-1')
+
+
+def test_index_is_rebuilt_when_the_file_changes(tmp_path):
+    path = str(tmp_path / 'f.txt')
+    cache = LineIndexCache(max_entries=1)
+    write(path, b'a\nb\n')
+    assert cache.get(path) is cache.get(path)
+    write(path, b'a\nb\nc\n')
+    assert cache.read_lines(path, 3, 3).text == 'c\n'
+
+
+@pytest.mark.parametrize('encoding, bom', [('utf-8', b''), ('utf-16-le', codecs.BOM_UTF16_LE),
+                                           ('utf-32-be', codecs.BOM_UTF32_BE)])
+@pytest.mark.parametrize('length', [1, 5, 7, 64])
+def test_text_slices_page_through_the_file(tmp_path, encoding, bom, length):
+    text = ''.join(f'{i} caf\xe9 \u20ac \U0001f600\n' for i in range(20))
+    path = str(tmp_path / 'f.txt')
+    write(path, bom + text.encode(encoding))
+    pieces, offset = [], 0
+    while True:
+        piece = read_text_slice(path, offset, length)
+        if piece.end >= piece.size:
+            pieces.append(piece.text)
+            break
+        assert piece.end > offset
+        pieces.append(piece.text)
+        offset = piece.end
+    assert ''.join(pieces) == text
+
+
+def test_text_slice_starting_inside_a_character(tmp_path):
+    path = str(tmp_path / 'f.txt')
+    write(path, 'a\u20acb'.encode('utf-8'))
+    piece = read_text_slice(path, 2, 10)
+    assert (piece.text, piece.start, piece.end, piece.size) == ('b', 4, 5, 5)
+    assert read_text_slice(path, 99, 10)[:3] == ('', 5, 5)
@@ -0,0 +1,68 @@
+import os
+
+from project_index import ProjectIndex
+
+
+def write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def names(entries):
+    return sorted(e.name for e in entries)
+
+
+def test_build_skips_excluded_dirs(tmp_path):
+    root = tmp_path / 'project'
+    write(str(root / 'a.py'))
+    write(str(root / 'node_modules' / 'lib.js'))
+    index = ProjectIndex(str(root), str(tmp_path / 'data'))
+    index.ensure_built()
+    assert names(index.files()) == ['a.py']
+    assert index.extensions() == {'.py'}
+    index.close()
+
+
+def test_reopened_index_picks_up_changes_made_while_closed(tmp_path):
+    root, data = tmp_path / 'project', str(tmp_path / 'data')
+    write(str(root / 'a.py'), 'a')
+    write(str(root / 'sub' / 'x.txt'), 'x')
+    index = ProjectIndex(str(root), data)
+    index.ensure_built()
+    index.close()
+
+    write(str(root / 'sub' / 'b.py'), 'b')
+    write(str(root / 'new' / 'c.py'), 'c')
+    os.remove(str(root / 'a.py'))
+    # Make the directory mtimes differ even on coarse-grained filesystems
+    for directory in (root, root / 'sub'):
+        st = os.stat(str(directory))
+        os.utime(str(directory), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    index = ProjectIndex(str(root), data)
+    assert index.is_built
+    index.ensure_built()
+    assert names(index.files()) == ['b.py', 'c.py', 'x.txt']
+    assert names(index.iter_files()) == ['b.py', 'c.py', 'x.txt']
+    assert names(index.child_files(str(root / 'new'))) == ['c.py']
+    assert index.extension_stats() == {'.py': (2, 2), '.txt': (1, 1)}
+    index.close()
+
+
+def test_build_in_background_syncs_a_reopened_index(tmp_path):
+    root, data = tmp_path / 'project', str(tmp_path / 'data')
+    write(str(root / 'a.py'))
+    index = ProjectIndex(str(root), data)
+    index.ensure_built()
+    index.close()
+
+    write(str(root / 'new' / 'c.py'))
+    st = os.stat(str(root))
+    os.utime(str(root), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    index = ProjectIndex(str(root), data)
+    index.build_in_background()
+    index._build_thread.join()
+    assert names(index.files()) == ['a.py', 'c.py']
+    index.close()
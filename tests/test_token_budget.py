@@ -0,0 +1,148 @@
+import base64
+import codecs
+import os
+
+import pytest
+
+from content_cache import decode_bytes
+from token_budget import BpeTokenizer, HeuristicTokenizer, TokenCounter, pack
+
+
+class Reader:
+    """read_fn that records which files were read."""
+
+    def __init__(self):
+        self.reads = []
+
+    def __call__(self, path):
+        self.reads.append(os.path.basename(path))
+        with open(path, 'rb') as f:
+            return decode_bytes(f.read())[0]
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def touch_later(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_heuristic_tokenizer_rounds_up():
+    tokenizer = HeuristicTokenizer()
+    assert tokenizer.count('') == 0
+    assert tokenizer.count('abcd') == 1
+    assert tokenizer.count('abcde') == 2
+    assert tokenizer.count('\xe9\xe9') == 1  # Four UTF-8 bytes
+
+
+def test_bpe_tokenizer_merges_by_rank(tmp_path):
+    vocab = tmp_path / 'vocab.tiktoken'
+    ranks = [b'a', b'b', b'c', b'ab', b'abc', b' ']
+    vocab.write_bytes(b''.join(base64.b64encode(t) + b' %d\n' % i for i, t in enumerate(ranks)))
+    tokenizer = BpeTokenizer.from_file(str(vocab))
+    assert tokenizer.max_token_bytes == 3
+    assert tokenizer.count('abc') == 1
+    assert tokenizer.count('abcab') == 2
+    assert tokenizer.count('abc abc') == 3  # Pieces 'abc' and ' abc', the space staying alone
+    assert tokenizer.count('cba') == 3
+
+
+@pytest.fixture
+def counter():
+    reader = Reader()
+    return TokenCounter(HeuristicTokenizer(), reader), reader
+
+
+def test_counts_are_memoized_per_file_version(tmp_path, counter):
+    counter, reader = counter
+    path = str(tmp_path / 'a.txt')
+    write(path, b'x' * 40)
+    assert counter.count_file(path) == 10
+    assert counter.count_file(path) == 10
+    assert reader.reads == ['a.txt']
+    write(path, b'x' * 80)
+    touch_later(path)
+    assert counter.count_file(path) == 20
+    assert reader.reads == ['a.txt', 'a.txt']
+
+
+def test_memo_is_keyed_by_tokenizer_and_encodings(tmp_path):
+    reader = Reader()
+    encodings = ['latin-1']
+    counter = TokenCounter(HeuristicTokenizer(), reader, encodings_fn=lambda: encodings)
+    path = str(tmp_path / 'a.txt')
+    write(path, b'x' * 40)
+    counter.count_file(path)
+    counter.tokenizer = HeuristicTokenizer()  # Same name, other tokenizer
+    counter.count_file(path)
+    encodings[:] = ['cp1252']
+    counter.count_file(path)
+    counter.count_file(path)
+    assert reader.reads == ['a.txt'] * 3
+
+
+def test_memo_is_bounded(tmp_path):
+    reader = Reader()
+    counter = TokenCounter(HeuristicTokenizer(), reader, max_entries=2)
+    paths = []
+    for name in 'abc':
+        paths.append(str(tmp_path / name))
+        write(paths[-1], b'text')
+    for path in paths + paths[-1:]:
+        counter.count_file(path)
+    assert len(counter._counts) == 2
+    counter.count_file(paths[0])
+    assert reader.reads == ['a', 'b', 'c', 'a']
+
+
+@pytest.mark.parametrize('data', [
+    b'plain ascii text\n' * 50,
+    b'crlf line\r\n' * 50,
+    codecs.BOM_UTF16_LE + 'utf-16 text\n'.encode('utf-16-le') * 50,
+    '\xe9t\xe9 accentu\xe9\n'.encode('utf-8') * 50,
+])
+def test_min_tokens_is_a_lower_bound(tmp_path, counter, data):
+    counter, reader = counter
+    path = str(tmp_path / 'f.txt')
+    write(path, data)
+    bound = counter.min_tokens(path)
+    assert reader.reads == []
+    assert 0 < bound <= counter.count_file(path)
+    # The memoized count is exact
+    assert counter.min_tokens(path) == counter.count_file(path)
+
+
+def test_min_tokens_of_line_range_and_missing_file(tmp_path, counter):
+    counter, _ = counter
+    path = str(tmp_path / 'f.txt')
+    write(path, b'x' * 400)
+    assert counter.min_tokens(f'{path}:1-2') == 0
+    with pytest.raises(OSError):
+        counter.min_tokens(str(tmp_path / 'missing.txt'))
+
+
+def test_pack_keeps_priority_order_and_skips_what_does_not_fit(tmp_path, counter):
+    counter, reader = counter
+    sizes = {'big': 4000, 'a': 40, 'mid': 400, 'b': 40}
+    paths = []
+    for name, size in sizes.items():
+        paths.append(str(tmp_path / name))
+        write(paths[-1], b'x' * size)
+    missing = str(tmp_path / 'missing')
+    kept, used, skipped = pack(paths + [missing], 60, counter, overhead_fn=lambda p: 5)
+    assert [os.path.basename(p) for p in kept] == ['a', 'b']
+    assert used == 30
+    assert [os.path.basename(p) for p in skipped] == ['big', 'mid', 'missing']
+    # Files whose size alone exceeds the budget are never read
+    assert 'big' not in reader.reads and 'mid' not in reader.reads
+
+
+def test_pack_without_budget_pressure_keeps_everything(tmp_path, counter):
+    counter, _ = counter
+    paths = [str(tmp_path / name) for name in 'ab']
+    for path in paths:
+        write(path, b'x' * 8)
+    assert pack(paths, 100, counter) == (paths, 4, [])
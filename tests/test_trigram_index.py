@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from project_index import ProjectIndex
+from trigram_index import FileNameIndex
+
+
+def write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / 'project'
+    for rel in ('alpha.py', 'bet.py', 'src/Alphabet.txt', 'src/gamma.py', 'docs/alphabet/readme.md', 'docs/bet/x'):
+        write(str(root.joinpath(*rel.split('/'))))
+    index = ProjectIndex(str(root), str(tmp_path / 'data'))
+    index.ensure_built()
+    names = FileNameIndex(str(root))
+    names.build(index)
+    yield str(root), index, names
+    index.close()
+
+
+def rel(root, paths):
+    return sorted(os.path.relpath(p, root).replace(os.sep, '/') for p in paths)
+
+
+def test_basename_search_is_case_insensitive(project):
+    root, _, names = project
+    assert len(names) == 6
+    assert rel(root, names.search('ALPHA')) == ['alpha.py', 'src/Alphabet.txt']
+
+
+def test_every_trigram_must_occur_in_the_same_file(project):
+    root, _, names = project
+    # 'alp' and 'bet' both have postings, but only one file holds the whole query
+    assert rel(root, names.search('alphabet')) == ['src/Alphabet.txt']
+    assert names.search('betalpha') == []
+    assert names.search('zzz') == []
+
+
+def test_short_queries_scan_every_name(project):
+    root, _, names = project
+    assert rel(root, names.search('.p')) == ['alpha.py', 'bet.py', 'src/gamma.py']
+    assert len(names.search('')) == 6
+
+
+def test_limit(project):
+    _, _, names = project
+    assert len(names.search('.py', limit=2)) == 2
+
+
+def test_path_search_matches_directories_and_spanning_queries(project):
+    root, _, names = project
+    assert rel(root, names.search('alphabet', in_path=True)) == ['docs/alphabet/readme.md', 'src/Alphabet.txt']
+    assert rel(root, names.search('src/gam', in_path=True)) == ['src/gamma.py']
+    assert rel(root, names.search('docs/bet', in_path=True)) == ['docs/bet/x']
+
+
+def test_removed_and_added_files(project):
+    root, index, names = project
+    names.remove_file(os.path.join(root, 'alpha.py'))
+    assert rel(root, names.search('alpha')) == ['src/Alphabet.txt']
+    write(os.path.join(root, 'src', 'new', 'alpha2.py'))
+    index.rescan_dir(os.path.join(root, 'src'))
+    names.sync_dir(index, os.path.join(root, 'src'))
+    assert rel(root, names.search('alpha')) == ['src/Alphabet.txt', 'src/new/alpha2.py']
+    names.remove_tree(os.path.join(root, 'src'))
+    assert names.search('alpha') == []
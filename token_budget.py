@@ -0,0 +1,226 @@
+"""Offline token counting, memoized per file version, and budget-aware packing."""
+import base64
+import codecs
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from content_cache import file_version
+from file_ranges import split_line_range
+
+# Pre-tokenization close to the GPT-style splitting, using only the stdlib `re`
+_PIECE_RE = re.compile(
+    r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""",
+    re.UNICODE)
+
+# Average bytes per token used by the heuristic tokenizer
+HEURISTIC_BYTES_PER_TOKEN = 4
+
+# Memoized file counts kept in memory
+DEFAULT_MAX_COUNTS = 200000
+
+# Most file bytes per UTF-8 byte of the decoded text, by byte order mark: CRLF newlines
+# are decoded to one byte, and UTF-16/32 spend 2/4 bytes on ASCII characters
+_BYTES_PER_TEXT_BYTE = ((codecs.BOM_UTF32_LE, 8), (codecs.BOM_UTF32_BE, 8),
+                        (codecs.BOM_UTF16_LE, 4), (codecs.BOM_UTF16_BE, 4))
+_DEFAULT_BYTES_PER_TEXT_BYTE = 2
+
+
+def _bytes_per_text_byte(path):
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for bom, ratio in _BYTES_PER_TEXT_BYTE:
+        if head.startswith(bom):
+            return ratio
+    return _DEFAULT_BYTES_PER_TEXT_BYTE
+
+
+class HeuristicTokenizer:
+    """Fast estimate: one token per few UTF-8 bytes."""
+
+    name = 'heuristic'
+    max_token_bytes = HEURISTIC_BYTES_PER_TOKEN
+
+    def count(self, text):
+        return -(-len(text.encode('utf-8', 'surrogatepass')) // HEURISTIC_BYTES_PER_TOKEN)
+
+
+class BpeTokenizer:
+    """
+    Byte-level BPE driven by a local rank file in the tiktoken format
+    (one "<base64 token> <rank>" pair per line). Counts of repeated
+    pre-tokenized pieces are memoized.
+    """
+
+    name = 'bpe'
+    PIECE_CACHE_SIZE = 200000
+
+    def __init__(self, ranks):
+        self.ranks = ranks
+        # Longest token: no count can be below the UTF-8 length divided by it
+        self.max_token_bytes = max(map(len, ranks), default=1)
+        self._piece_counts = {}
+
+    @classmethod
+    def from_file(cls, path):
+        ranks = {}
+        with open(path, 'rb') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    ranks[base64.b64decode(parts[0])] = int(parts[1])
+        return cls(ranks)
+
+    def _merge_count(self, piece):
+        # Repeatedly merge the adjacent pair with the lowest rank
+        if piece in self.ranks:
+            return 1
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        ranks = self.ranks
+        while len(parts) > 1:
+            best_rank, best_i = None, None
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_i = rank, i
+            if best_i is None:
+                break
+            parts[best_i:best_i + 2] = [parts[best_i] + parts[best_i + 1]]
+        return len(parts)
+
+    def count(self, text):
+        total = 0
+        cache = self._piece_counts
+        for match in _PIECE_RE.finditer(text):
+            piece = match.group().encode('utf-8', 'surrogatepass')
+            n = cache.get(piece)
+            if n is None:
+                n = self._merge_count(piece)
+                if len(cache) >= self.PIECE_CACHE_SIZE:
+                    cache.clear()
+                cache[piece] = n
+            total += n
+        return total
+
+
+def load_tokenizer(vocab_path=None):
+    """BPE tokenizer from `vocab_path` if it exists, else the byte heuristic."""
+    if vocab_path and os.path.isfile(vocab_path):
+        return BpeTokenizer.from_file(vocab_path)
+    return HeuristicTokenizer()
+
+
+class TokenCounter:
+    """
+    Per-file token counts memoized by (inode, size, mtime_ns), so only files
+    that changed since the last count are read and tokenized again. A count
+    is also stale once the tokenizer or `encodings_fn()` (the fallback
+    encodings read_fn decodes with) changed. Bounded LRU of at most
+    `max_entries` counts.
+    """
+
+    def __init__(self, tokenizer, read_fn, encodings_fn=None, max_entries=DEFAULT_MAX_COUNTS):
+        self.tokenizer = tokenizer
+        self.read_fn = read_fn
+        self.encodings_fn = encodings_fn
+        self.max_entries = max_entries
+        self._counts = OrderedDict()  # path -> (stamp, count)
+        self._lock = threading.Lock()
+
+    def _stamp(self, file_path, st=None):
+        # The tokenizer object itself, not only its name: another vocabulary keeps the name
+        encodings = tuple(self.encodings_fn()) if self.encodings_fn is not None else ()
+        return (file_version(file_path, st), self.tokenizer.name, self.tokenizer, encodings)
+
+    def _memo(self, path, stamp):
+        with self._lock:
+            memo = self._counts.get(path)
+            if memo is None or memo[0] != stamp:
+                return None
+            self._counts.move_to_end(path)
+            return memo[1]
+
+    def count_file(self, path, text=None):
+        """
+        Token count of `path`, which may be a "<path>:<start>-<end>" line
+        range; `text` may be passed when the caller already read it.
+        """
+        stamp = self._stamp(split_line_range(path)[0])
+        count = self._memo(path, stamp)
+        if count is not None:
+            return count
+        if text is None:
+            text = self.read_fn(path)
+        count = stamp[2].count(text)
+        with self._lock:
+            self._counts[path] = (stamp, count)
+            self._counts.move_to_end(path)
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def min_tokens(self, path):
+        """
+        A lower bound of count_file(path) that reads nothing: the memoized
+        count while it is current, else one derived from the file size and
+        its byte order mark (0 for a line range). A fallback encoding wider
+        than one byte per character could make it overestimate. Raises
+        OSError if the file cannot be read.
+        """
+        file_path, start, _ = split_line_range(path)
+        st = os.stat(file_path)
+        count = self._memo(path, self._stamp(file_path, st))
+        if count is not None:
+            return count
+        if start is not None:
+            return 0
+        return st.st_size // (_bytes_per_text_byte(file_path) * self.tokenizer.max_token_bytes)
+
+    def count_text(self, text):
+        return self.tokenizer.count(text)
+
+    def counts(self, paths):
+        """{path: count} for every readable path."""
+        result = {}
+        for path in paths:
+            try:
+                result[path] = self.count_file(path)
+            except Exception:
+                continue
+        return result
+
+    def forget(self, path):
+        with self._lock:
+            self._counts.pop(path, None)
+
+
+def pack(paths, budget, counter, overhead_fn=None):
+    """
+    Greedily keep the highest-priority files that fit in `budget` tokens.
+
+    `paths` is ordered by priority (first = most important). Files that do
+    not fit are skipped so smaller, lower-priority ones can still be taken.
+    `overhead_fn(path)` gives the extra tokens a file costs in the bundle
+    (header, separator). Files whose size alone shows they cannot fit in
+    what is left of the budget are skipped without being read, so a small
+    budget over a large selection tokenizes only what it can take.
+    Returns (kept paths in input order, tokens used, skipped paths).
+    """
+    kept, skipped, used = [], [], 0
+    for path in paths:
+        overhead = overhead_fn(path) if overhead_fn is not None else 0
+        try:
+            if used + overhead + counter.min_tokens(path) > budget:
+                skipped.append(path)
+                continue
+            cost = counter.count_file(path) + overhead
+        except Exception:
+            skipped.append(path)
+            continue
+        if used + cost <= budget:
+            kept.append(path)
+            used += cost
+        else:
+            skipped.append(path)
+    return kept, used, skipped
@@ -0,0 +1,233 @@
+"""In-memory trigram index over the file names and relative paths of a project."""
+import os
+import threading
+from array import array
+from collections import defaultdict
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class FileNameIndex:
+    """
+    Case-insensitive substring search over file basenames (or relative
+    paths) of one project tree.
+
+    Basenames and directory paths each get trigram posting lists; a query
+    intersects the posting lists of its trigrams, shortest first, and
+    verifies the remaining candidates with a plain substring test. Directory paths are shared by
+    the files they contain, which keeps memory proportional to the number of
+    distinct directories rather than to the full path of every file.
+
+    Posting lists are append-only arrays of ids; removed files leave dead ids
+    that are skipped and dropped by the next compaction.
+    """
+
+    COMPACT_MIN_DEAD = 10000
+
+    def __init__(self, root):
+        self.root = os.path.normpath(os.path.abspath(root))
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._names = []          # file id -> basename, None once removed
+        self._lower_names = []    # file id -> lowercased basename
+        self._file_dirs = []      # file id -> directory id
+        self._file_ids = {}       # (directory id, basename) -> file id
+        self._dir_paths = []      # directory id -> relative path ('' for the root)
+        self._lower_dirs = []     # directory id -> lowercased relative path
+        self._dir_ids = {}        # relative path -> directory id
+        self._dir_files = []      # directory id -> set of file ids
+        self._name_postings = defaultdict(lambda: array('i'))
+        self._dir_postings = defaultdict(lambda: array('i'))
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    # --- Updates ------------------------------------------------------------
+
+    def _rel(self, path):
+        rel = os.path.relpath(os.path.normpath(os.path.abspath(path)), self.root)
+        return '' if rel == '.' else rel
+
+    def _dir_id(self, rel_dir):
+        dir_id = self._dir_ids.get(rel_dir)
+        if dir_id is None:
+            dir_id = len(self._dir_paths)
+            self._dir_ids[rel_dir] = dir_id
+            self._dir_paths.append(rel_dir)
+            lower = rel_dir.lower()
+            self._lower_dirs.append(lower)
+            self._dir_files.append(set())
+            for gram in _trigrams(lower):
+                self._dir_postings[gram].append(dir_id)
+        return dir_id
+
+    def _add(self, dir_id, name):
+        if (dir_id, name) in self._file_ids:
+            return
+        file_id = len(self._names)
+        self._file_ids[(dir_id, name)] = file_id
+        self._names.append(name)
+        lower = name.lower()
+        self._lower_names.append(lower)
+        self._file_dirs.append(dir_id)
+        self._dir_files[dir_id].add(file_id)
+        for gram in _trigrams(lower):
+            self._name_postings[gram].append(file_id)
+
+    def _remove(self, dir_id, name):
+        file_id = self._file_ids.pop((dir_id, name), None)
+        if file_id is None:
+            return
+        self._names[file_id] = None
+        self._lower_names[file_id] = None
+        self._dir_files[dir_id].discard(file_id)
+        self._dead += 1
+
+    def add_file(self, path):
+        rel_dir, name = os.path.split(self._rel(path))
+        with self._lock:
+            self._add(self._dir_id(rel_dir), name)
+
+    def remove_file(self, path):
+        rel_dir, name = os.path.split(self._rel(path))
+        with self._lock:
+            dir_id = self._dir_ids.get(rel_dir)
+            if dir_id is not None:
+                self._remove(dir_id, name)
+            self._maybe_compact()
+
+    def remove_tree(self, path):
+        """
+        Forget every file under directory `path`, and the directories
+        themselves: a directory created again under the same name gets a new
+        id, so sync_dir() sees it as new and indexes its files.
+        """
+        rel = self._rel(path)
+        prefix = rel + os.sep if rel else ''
+        with self._lock:
+            removed = [(rel_dir, dir_id) for rel_dir, dir_id in self._dir_ids.items()
+                       if rel_dir == rel or rel_dir.startswith(prefix)]
+            for rel_dir, dir_id in removed:
+                for file_id in list(self._dir_files[dir_id]):
+                    self._remove(dir_id, self._names[file_id])
+                # The id stays in the directory postings, with no files left
+                del self._dir_ids[rel_dir]
+            self._maybe_compact()
+
+    def build(self, project_index):
+        """Index every file known to `project_index` beneath the root."""
+        with self._lock:
+            self._clear()
+            for entry in project_index.files(self.root):
+                self._add(self._dir_id(self._rel(entry.parent)), entry.name)
+
+    def sync_dir(self, project_index, path):
+        """
+        Bring one directory in line with `project_index` after its listing
+        changed: files added or removed, subdirectories created or deleted.
+        """
+        path = os.path.normpath(os.path.abspath(path))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return
+        entry = project_index.entry(path)
+        if entry is None or not entry.is_dir:
+            self.remove_tree(path)
+            return
+        rel = self._rel(path)
+        with self._lock:
+            dir_id = self._dir_id(rel)
+            current = {e.name for e in project_index.child_files(path)}
+            known = {self._names[file_id] for file_id in self._dir_files[dir_id]}
+            for name in known - current:
+                self._remove(dir_id, name)
+            for name in current - known:
+                self._add(dir_id, name)
+            # Subdirectories: drop vanished ones, index new ones completely
+            subdirs = {e.name for e in project_index.children(path) if e.is_dir}
+            prefix = rel + os.sep if rel else ''
+            known_subdirs = {d[len(prefix):].split(os.sep, 1)[0] for d in self._dir_ids
+                             if d != rel and d.startswith(prefix)}
+            for name in known_subdirs - subdirs:
+                self.remove_tree(os.path.join(path, name))
+            for name in subdirs - known_subdirs:
+                for file_entry in project_index.files(os.path.join(path, name)):
+                    self._add(self._dir_id(self._rel(file_entry.parent)), file_entry.name)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._dead < self.COMPACT_MIN_DEAD or self._dead < len(self._file_ids):
+            return
+        live = [(self._dir_paths[self._file_dirs[file_id]], name)
+                for (_, name), file_id in sorted(self._file_ids.items(), key=lambda item: item[1])]
+        self._clear()
+        for rel_dir, name in live:
+            self._add(self._dir_id(rel_dir), name)
+
+    # --- Queries ------------------------------------------------------------
+
+    def _candidates(self, postings, query, count):
+        grams = _trigrams(query)
+        if not grams:
+            return range(count)
+        lists = [postings.get(gram) for gram in grams]
+        if any(lst is None for lst in lists):
+            return ()
+        # Intersect from the shortest list; ids stay in indexing order
+        lists.sort(key=len)
+        ids = set(lists[0])
+        for lst in lists[1:]:
+            if not ids:
+                return ()
+            ids.intersection_update(lst)
+        return sorted(ids)
+
+    def _path(self, file_id):
+        rel_dir = self._dir_paths[self._file_dirs[file_id]]
+        return os.path.join(self.root, rel_dir, self._names[file_id])
+
+    def search(self, query, limit=None, in_path=False):
+        """
+        Absolute paths of files whose basename (or relative path, with
+        `in_path`) contains `query`, case-insensitively, in indexing order.
+        """
+        query = query.lower()
+        if in_path:
+            query = query.replace('/', os.sep)
+        matches = []
+        with self._lock:
+            names = self._lower_names
+            for file_id in self._candidates(self._name_postings, query, len(names)):
+                name = names[file_id]
+                if name is not None and query in name:
+                    matches.append(file_id)
+                    if limit is not None and len(matches) >= limit:
+                        break
+            if in_path and (limit is None or len(matches) < limit):
+                matches = set(matches)
+                self._search_paths(query, matches, limit)
+                matches = sorted(matches)
+            return [self._path(file_id) for file_id in matches]
+
+    def _search_paths(self, query, matches, limit):
+        # Matches in the directory part, or spanning directory and basename
+        dirs = self._lower_dirs
+        if os.sep not in query:
+            dir_ids = [d for d in self._candidates(self._dir_postings, query, len(dirs)) if query in dirs[d]]
+        else:
+            # The part before the last separator must appear in the directory path
+            head = query.rsplit(os.sep, 1)[0]
+            dir_ids = self._candidates(self._dir_postings, head, len(dirs)) if head else range(len(dirs))
+        whole_dir = os.sep not in query
+        for dir_id in dir_ids:
+            for file_id in self._dir_files[dir_id]:
+                if file_id in matches:
+                    continue
+                if whole_dir or query in os.path.join(dirs[dir_id], self._lower_names[file_id]):
+                    matches.add(file_id)
+                    if limit is not None and len(matches) >= limit:
+                        return
@@ -0,0 +1,28 @@
+"""Queue feeding a GUI event loop, polled through a cheap thread-safe flag."""
+import queue
+import threading
+
+
+class UiQueue(queue.Queue):
+    """
+    Thread-safe queue of UI tasks. put() only raises a flag and never calls
+    into the GUI toolkit, so producers on worker threads neither touch Tk
+    nor wait on its event loop. The GUI thread checks the flag with a short
+    timer and calls take_work() before draining: anything put meanwhile
+    raises the flag again for the next check.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._work = threading.Event()
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self._work.set()
+
+    def take_work(self):
+        """True if something was put since the last call; clears the flag."""
+        if not self._work.is_set():
+            return False
+        self._work.clear()
+        return True
@@ -0,0 +1,202 @@
+"""Off-widget bundle storage and a Text view that renders only its visible lines."""
+import bisect
+import re
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import font as tkfont, ttk
+
+
+class SegmentedDocument:
+    """
+    Bundle text kept outside Tk as ordered per-file segments.
+
+    Segments are expected to end with a newline so that every line belongs
+    to exactly one segment. Line numbers are 0-based.
+    """
+
+    def __init__(self):
+        self._texts = OrderedDict()   # key -> segment text
+        self._line_counts = {}        # key -> number of lines in the segment
+        self._offsets = {}            # key -> start offsets of each line (built lazily)
+        self._keys = []
+        self._line_starts = []        # first line of each segment
+        self.line_count = 0
+        self.size = 0
+
+    def update(self, keys, new_texts):
+        """Reorder to `keys`, replacing or adding the segments found in `new_texts`."""
+        texts = OrderedDict()
+        for key in keys:
+            if key in new_texts:
+                texts[key] = new_texts[key]
+                self._line_counts[key] = new_texts[key].count('\n')
+                self._offsets.pop(key, None)
+            else:
+                texts[key] = self._texts[key]
+        for key in set(self._texts) - set(texts):
+            self._line_counts.pop(key, None)
+            self._offsets.pop(key, None)
+        self._texts = texts
+        self._keys = list(texts)
+        self._line_starts = []
+        line = 0
+        size = 0
+        for key, text in texts.items():
+            self._line_starts.append(line)
+            line += self._line_counts[key]
+            size += len(text)
+        self.line_count = line
+        self.size = size
+
+    def segment_text(self, key):
+        return self._texts[key]
+
+    def text(self):
+        """The whole bundle as one string (for copying)."""
+        return ''.join(self._texts.values())
+
+    def _line_offsets(self, key):
+        offsets = self._offsets.get(key)
+        if offsets is None:
+            text = self._texts[key]
+            offsets = [0]
+            find = text.find
+            pos = find('\n')
+            while pos != -1:
+                offsets.append(pos + 1)
+                pos = find('\n', pos + 1)
+            self._offsets[key] = offsets
+        return offsets
+
+    def _locate(self, line):
+        # Segment index holding `line`
+        return bisect.bisect_right(self._line_starts, line) - 1
+
+    def get_lines(self, start, count):
+        """Return up to `count` lines (without newlines) starting at line `start`."""
+        lines = []
+        if count <= 0 or start >= self.line_count:
+            return lines
+        i = max(0, self._locate(start))
+        local = start - self._line_starts[i]
+        while len(lines) < count and i < len(self._keys):
+            key = self._keys[i]
+            text = self._texts[key]
+            offsets = self._line_offsets(key)
+            stop = min(self._line_counts[key], local + count - len(lines))
+            for n in range(local, stop):
+                lines.append(text[offsets[n]:offsets[n + 1] - 1])
+            i += 1
+            local = 0
+        return lines
+
+    def find(self, query, line=0, col=0, nocase=True):
+        """
+        (line, col) of the next occurrence of `query` at or after the given
+        position, wrapping around once; None if absent.
+        """
+        if not query or not self._keys:
+            return None
+        pattern = re.compile(re.escape(query), re.IGNORECASE if nocase else 0)
+        line = min(max(line, 0), max(self.line_count - 1, 0))
+        first = max(0, self._locate(line))
+        order = list(range(first, len(self._keys))) + list(range(0, first + 1))
+        for n, i in enumerate(order):
+            key = self._keys[i]
+            text = self._texts[key]
+            pos = 0
+            if n == 0:
+                offsets = self._line_offsets(key)
+                pos = offsets[min(line - self._line_starts[i], len(offsets) - 1)] + col
+            match = pattern.search(text, pos)
+            if match is None:
+                continue
+            offset = match.start()
+            found_line = self._line_starts[i] + text.count('\n', 0, offset)
+            found_col = offset - (text.rfind('\n', 0, offset) + 1)
+            return found_line, found_col
+        return None
+
+
+class VirtualTextView(ttk.Frame):
+    """
+    Read-only view of a SegmentedDocument. Only the visible lines plus a
+    margin are inserted in the Text widget; the scrollbar spans the whole
+    document and the window is re-rendered as the user scrolls.
+    """
+
+    MARGIN = 300  # Lines rendered above and below the visible area
+
+    def __init__(self, master, document, **text_options):
+        super().__init__(master)
+        self.document = document
+        self.first_line = 0
+        self._window = (0, 0)
+        self._rerender_pending = False
+        self.scrollbar = ttk.Scrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+        self.text = tk.Text(self, wrap='none', state='disabled', yscrollcommand=self._on_text_scroll, **text_options)
+        self.text.pack(side='left', fill='both', expand=True)
+        self.text.tag_configure('search', background='yellow')
+        self.text.bind('<Configure>', lambda event: self.refresh())
+
+    def visible_lines(self):
+        linespace = max(1, tkfont.Font(font=self.text.cget('font')).metrics('linespace'))
+        return max(1, self.text.winfo_height() // linespace)
+
+    def refresh(self):
+        """Re-render the window around the current first line."""
+        total = self.document.line_count
+        visible = self.visible_lines()
+        self.first_line = min(max(0, self.first_line), max(0, total - visible))
+        start = max(0, self.first_line - self.MARGIN)
+        end = min(total, self.first_line + visible + self.MARGIN)
+        self._window = (start, end)
+        lines = self.document.get_lines(start, end - start)
+        self.text.configure(state='normal')
+        self.text.delete('1.0', 'end')
+        self.text.insert('1.0', '\n'.join(lines))
+        self.text.configure(state='disabled')
+        self.text.yview(f"{self.first_line - start + 1}.0")
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = max(1, self.document.line_count)
+        visible = self.visible_lines()
+        self.scrollbar.set(self.first_line / total, min(1.0, (self.first_line + visible) / total))
+
+    def _on_text_scroll(self, lo, hi):
+        # Inner scrolling (wheel, keys, selection drag): track it and page in more lines near the edges
+        top = int(self.text.index('@0,0').split('.')[0]) - 1
+        start, end = self._window
+        self.first_line = start + top
+        self._update_scrollbar()
+        visible = self.visible_lines()
+        near_top = start > 0 and top < self.MARGIN // 3
+        near_bottom = end < self.document.line_count and start + top + visible > end - self.MARGIN // 3
+        if (near_top or near_bottom) and not self._rerender_pending:
+            self._rerender_pending = True
+            self.after_idle(self._rerender)
+
+    def _rerender(self):
+        self._rerender_pending = False
+        self.refresh()
+
+    def on_scrollbar(self, *args):
+        total = self.document.line_count
+        visible = self.visible_lines()
+        if args[0] == 'moveto':
+            self.first_line = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = visible if args[2] == 'pages' else 1
+            self.first_line += int(args[1]) * step
+        self.refresh()
+
+    def show(self, line, col, length):
+        """Scroll to (line, col) and highlight `length` characters there."""
+        self.first_line = line - self.visible_lines() // 2
+        self.refresh()
+        index = f"{line - self._window[0] + 1}.{col}"
+        self.text.tag_remove('search', '1.0', 'end')
+        self.text.tag_add('search', index, f"{index}+{length}c")
+        self.text.see(index)